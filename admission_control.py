@@ -0,0 +1,315 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+_current_tenant = contextvars.ContextVar('tenant', default='anonymous')
+
+
+class AdmissionRejected(Exception):
+    """A request was shed; retry_after is a suggested wait in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Request rejected ({reason}); retry after {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def current_tenant():
+    return _current_tenant.get()
+
+
+def set_current_tenant(tenant):
+    """Attribute the rest of this request's model calls to tenant"""
+    _current_tenant.set(tenant or 'anonymous')
+
+
+@contextmanager
+def tenant_context(tenant):
+    """Attribute model calls made inside the block to tenant"""
+    token = _current_tenant.set(tenant or 'anonymous')
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def parse_tenant_weights(spec):
+    """"tenant=weight,..." -> {tenant: weight}"""
+    weights = {}
+    for item in (spec or '').split(','):
+        tenant, _, weight = item.strip().rpartition('=')
+        if tenant:
+            weights[tenant] = float(weight)
+    return weights
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, amount=1.0):
+        """Take amount tokens; returns 0 on success, else the seconds until they would be available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.burst)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ('tenant', 'tokens', 'granted', 'cancelled', 'loop', 'future')
+
+    def __init__(self, tenant, tokens, loop=None, future=None):
+        self.tenant = tenant
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop         # set for coroutines waiting in async_slot
+        self.future = future
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """Rate limits, fair queuing and load shedding in front of the model.
+
+    admit() runs at the door: each tenant (API key, session or client
+    address) has a token bucket of `rate_per_second` requests with `burst`,
+    and new work is shed while the queue is `max_queue_depth` deep or the
+    estimated tokens queued and in flight exceed `token_budget`.
+
+    slot() (or async_slot() on an event loop) wraps each model call; both
+    share one queue. At most `concurrency` calls run at once;
+    the rest wait in a weighted fair queue ordered by virtual finish time,
+    so a tenant firing a scripted sweep only slows itself down. The limit
+    adapts to the upstream: it is cut by `decrease_factor` on a 429 (at most
+    once per `decrease_interval_seconds`) and grows by one after `concurrency`
+    consecutive successful calls, up to `max_concurrency`.
+    """
+
+    def __init__(self, enabled=True, rate_per_second=1.0, burst=20, max_concurrency=16, min_concurrency=2,
+                 max_queue_depth=64, token_budget=400000, max_wait_seconds=60.0, tenant_weights=None,
+                 decrease_factor=0.5, decrease_interval_seconds=5.0, idle_tenant_seconds=600.0):
+        self.enabled = enabled
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_queue_depth = max_queue_depth
+        self.token_budget = token_budget
+        self.max_wait_seconds = max_wait_seconds
+        self.tenant_weights = tenant_weights or {}
+        self.decrease_factor = decrease_factor
+        self.decrease_interval_seconds = decrease_interval_seconds
+        self.idle_tenant_seconds = idle_tenant_seconds
+
+        self.concurrency = max_concurrency
+        self._buckets = {}       # tenant -> TokenBucket
+        self._finish_tags = {}   # tenant -> virtual finish time of its last queued call
+        self._last_seen = {}     # tenant -> monotonic time
+        self._queue = []         # heap of (finish tag, sequence, waiter)
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._active = 0
+        self._queued = 0
+        self._committed_tokens = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._last_prune = time.monotonic()
+        self._service_seconds = 1.0   # smoothed duration of a model call
+        self._counts = {'admitted': 0, 'rate_limited': 0, 'queue_full': 0, 'token_budget': 0, 'queue_timeout': 0,
+                        'upstream_rate_limits': 0}
+        self._condition = threading.Condition()
+
+    def weight(self, tenant):
+        return max(self.tenant_weights.get(tenant, 1.0), 0.01)
+
+    def _backlog_seconds(self):
+        """Rough time for the current queue to drain"""
+        return max(1.0, math.ceil((self._queued + 1) / max(self.concurrency, 1) * self._service_seconds))
+
+    def _prune(self, now):
+        """Forget tenants idle long enough for their bucket to have refilled"""
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for tenant in [tenant for tenant, seen in self._last_seen.items() if now - seen > self.idle_tenant_seconds]:
+            self._buckets.pop(tenant, None)
+            self._last_seen.pop(tenant, None)
+            if self._finish_tags.get(tenant, 0.0) <= self._virtual_time:
+                self._finish_tags.pop(tenant, None)
+
+    def admit(self, tenant, cost=1.0, estimated_tokens=0):
+        """Accept a request at the door or raise AdmissionRejected"""
+        if not self.enabled:
+            return
+        with self._condition:
+            now = time.monotonic()
+            self._prune(now)
+            self._last_seen[tenant] = now
+            if self._queued >= self.max_queue_depth:
+                self._counts['queue_full'] += 1
+                raise AdmissionRejected('queue_full', self._backlog_seconds())
+            if self._committed_tokens and self._committed_tokens + estimated_tokens > self.token_budget:
+                self._counts['token_budget'] += 1
+                raise AdmissionRejected('token_budget', self._backlog_seconds())
+            bucket = self._buckets.get(tenant)
+            if bucket is None:
+                bucket = self._buckets[tenant] = TokenBucket(self.rate_per_second, self.burst)
+            wait = bucket.take(cost)
+            if wait > 0:
+                self._counts['rate_limited'] += 1
+                raise AdmissionRejected('rate_limited', max(1.0, math.ceil(wait)))
+            self._counts['admitted'] += 1
+
+    def _dispatch(self):
+        """Grant free slots to the queue head(s); caller holds the condition"""
+        granted = False
+        while self._queue and self._active < self.concurrency:
+            tag, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            self._virtual_time = max(self._virtual_time, tag)
+            waiter.granted = True
+            self._queued -= 1
+            self._active += 1
+            if waiter.future is not None:
+                try:
+                    waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                except RuntimeError:
+                    # Its event loop has closed; nobody will use or release the slot
+                    self._active -= 1
+                    self._committed_tokens -= waiter.tokens
+                    continue
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _enqueue(self, tenant, estimated_tokens, loop=None, future=None):
+        """Queue a waiter by virtual finish time and grant what fits; caller holds the condition"""
+        if self._queued >= self.max_queue_depth:
+            self._counts['queue_full'] += 1
+            raise AdmissionRejected('queue_full', self._backlog_seconds())
+        waiter = _Waiter(tenant, estimated_tokens, loop, future)
+        start = max(self._virtual_time, self._finish_tags.get(tenant, 0.0))
+        tag = start + max(estimated_tokens, 1) / self.weight(tenant)
+        self._finish_tags[tenant] = tag
+        heapq.heappush(self._queue, (tag, next(self._sequence), waiter))
+        self._queued += 1
+        self._committed_tokens += estimated_tokens
+        self._dispatch()
+        return waiter
+
+    def _abandon(self, waiter):
+        """Take a waiter that was never granted out of the queue; caller holds the condition"""
+        waiter.cancelled = True
+        self._queued -= 1
+        self._committed_tokens -= waiter.tokens
+
+    def _release(self, estimated_tokens, started):
+        """Give back a granted slot; caller holds the condition"""
+        self._active -= 1
+        self._committed_tokens -= estimated_tokens
+        self._service_seconds += 0.2 * (time.monotonic() - started - self._service_seconds)
+        self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant, estimated_tokens=0):
+        """Hold one model-call slot for the block, waiting in the fair queue for it"""
+        if not self.enabled:
+            yield
+            return
+        with self._condition:
+            waiter = self._enqueue(tenant, estimated_tokens)
+            deadline = time.monotonic() + self.max_wait_seconds
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(waiter)
+                    self._counts['queue_timeout'] += 1
+                    raise AdmissionRejected('queue_timeout', self._backlog_seconds())
+                self._condition.wait(remaining)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._release(estimated_tokens, started)
+
+    @asynccontextmanager
+    async def async_slot(self, tenant, estimated_tokens=0):
+        """slot() for coroutines: waits in the same fair queue without blocking the event loop"""
+        if not self.enabled:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._condition:
+            waiter = self._enqueue(tenant, estimated_tokens, loop, future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._condition:
+                # The grant may have landed after the timeout fired; a cancelled caller must hand it back
+                if not waiter.granted:
+                    self._abandon(waiter)
+                    if not isinstance(e, asyncio.TimeoutError):
+                        raise
+                    self._counts['queue_timeout'] += 1
+                    raise AdmissionRejected('queue_timeout', self._backlog_seconds())
+                if not isinstance(e, asyncio.TimeoutError):
+                    self._release(estimated_tokens, time.monotonic())
+                    raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._release(estimated_tokens, started)
+
+    def record_upstream(self, rate_limited):
+        """Feed back one upstream model call: shrink the limit on a 429, grow it slowly on success"""
+        with self._condition:
+            if rate_limited:
+                self._counts['upstream_rate_limits'] += 1
+                self._successes = 0
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval_seconds:
+                    self._last_decrease = now
+                    self.concurrency = max(self.min_concurrency, int(self.concurrency * self.decrease_factor))
+                return
+            self._successes += 1
+            if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                self._successes = 0
+                self.concurrency += 1
+                self._dispatch()
+
+    def stats(self):
+        with self._condition:
+            return dict(
+                self._counts,
+                enabled=self.enabled,
+                concurrency=self.concurrency,
+                active=self._active,
+                queued=self._queued,
+                committed_tokens=self._committed_tokens,
+                tenants=len(self._last_seen)
+            )
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_text(value):
+    if value is None:
+        return None
+    text = ' '.join(str(value).split()).lower()
+    return text or None
+
+
+def _normalize_number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return round(float(value), 6)
+    except (TypeError, ValueError):
+        return _normalize_text(value)
+
+
+def normalize_process_params(unit, temp, pressure, chemicals, flow_rate=None, operation_phase=None,
+                             equipment_volume=None, phase=None, location=None, utilities=None):
+    """Canonical form of the hazard-analysis inputs: case, whitespace and list order do not matter"""
+    return {
+        'unit': _normalize_text(unit),
+        'temp': _normalize_number(temp),
+        'pressure': _normalize_number(pressure),
+        'chemicals': sorted({c for c in (_normalize_text(c) for c in chemicals or []) if c}),
+        'flow_rate': _normalize_text(flow_rate),
+        'operation_phase': _normalize_text(operation_phase),
+        'equipment_volume': _normalize_text(equipment_volume),
+        'phase': _normalize_text(phase),
+        'location': _normalize_text(location),
+        'utilities': sorted({u for u in (_normalize_text(u) for u in utilities or []) if u})
+    }
+
+
+def analysis_cache_key(params, documents, prompt_version, model):
+    """SHA-256 over normalized params, retrieved passages (with document versions) and prompt/model versions"""
+    payload = {
+        'params': params,
+        'documents': sorted(
+            [str(doc.get('document_id')), str(doc.get('chunk_id')), str(doc.get('upload_date', ''))]
+            for doc in documents
+        ),
+        'prompt_version': prompt_version,
+        'model': model
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier LRU + TTL cache for hazard-analysis reports.
+
+    The in-process tier is an OrderedDict in LRU order. The optional SQLite
+    tier survives restarts and is shared by workers on the same host; hits
+    there are promoted into memory. Every entry remembers which documents
+    fed its prompt so those entries can be dropped when a document changes.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=86400, sqlite_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()   # key -> (expires_at, value, document_ids)
+        self._lock = threading.RLock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS analysis_cache_documents (
+                    key TEXT NOT NULL,
+                    document_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS analysis_cache_documents_doc ON analysis_cache_documents(document_id);
+                CREATE INDEX IF NOT EXISTS analysis_cache_last_used ON analysis_cache(last_used);
+            ''')
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self._db is not None
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or expiry"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM analysis_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute('UPDATE analysis_cache SET last_used = ? WHERE key = ?', (now, key))
+                    self._db.commit()
+                    document_ids = [r[0] for r in self._db.execute(
+                        'SELECT document_id FROM analysis_cache_documents WHERE key = ?', (key,)
+                    )]
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value, document_ids)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, document_ids=()):
+        """Store value under key in both tiers"""
+        expires_at = time.time() + self.ttl_seconds
+        document_ids = [str(doc_id) for doc_id in set(document_ids)]
+        with self._lock:
+            self._remember(key, expires_at, value, document_ids)
+
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(value), expires_at, time.time())
+                )
+                self._db.execute('DELETE FROM analysis_cache_documents WHERE key = ?', (key,))
+                self._db.executemany(
+                    'INSERT INTO analysis_cache_documents (key, document_id) VALUES (?, ?)',
+                    [(key, doc_id) for doc_id in document_ids]
+                )
+                self._prune_disk()
+                self._db.commit()
+
+    def _remember(self, key, expires_at, value, document_ids):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (expires_at, value, set(document_ids))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        self._db.execute('DELETE FROM analysis_cache WHERE expires_at <= ?', (time.time(),))
+        self._db.execute(
+            'DELETE FROM analysis_cache WHERE key IN '
+            '(SELECT key FROM analysis_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_disk_entries,)
+        )
+        self._db.execute('DELETE FROM analysis_cache_documents WHERE key NOT IN (SELECT key FROM analysis_cache)')
+
+    def invalidate_documents(self, document_ids):
+        """Drop every entry whose prompt included one of the given documents"""
+        document_ids = {str(doc_id) for doc_id in document_ids}
+        if not document_ids:
+            return 0
+
+        with self._lock:
+            stale = [key for key, entry in self._memory.items() if entry[2] & document_ids]
+            for key in stale:
+                del self._memory[key]
+
+            removed = len(stale)
+            if self._db is not None:
+                placeholders = ','.join('?' * len(document_ids))
+                cursor = self._db.execute(
+                    f'DELETE FROM analysis_cache WHERE key IN '
+                    f'(SELECT key FROM analysis_cache_documents WHERE document_id IN ({placeholders}))',
+                    tuple(document_ids)
+                )
+                removed = max(removed, cursor.rowcount)
+                self._db.execute(
+                    f'DELETE FROM analysis_cache_documents WHERE document_id IN ({placeholders})',
+                    tuple(document_ids)
+                )
+                self._db.commit()
+            return removed
+
+    def clear(self):
+        """Drop all entries from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM analysis_cache')
+                self._db.execute('DELETE FROM analysis_cache_documents')
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and current memory-tier size"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memory)}
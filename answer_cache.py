@@ -0,0 +1,178 @@
+"""Semantic answer cache for chat questions about one analysis.
+
+Chat answers are stored under the fingerprint of what they were answered
+against (the session's analysis and process data, the indexed documents and
+the chat model, plus the conversation so far for follow-ups that refer back
+to it) together with an embedding of the normalized question. A new
+question against the same fingerprint is answered from the cache when its
+vector is close enough to a stored one, so "what if we lose cooling water?" and
+"what happens on loss of cooling water?" share one model call.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Question scaffolding that carries no meaning once the question is about a what-if
+_FILLER_WORDS = frozenset(
+    "what whats if happens happen happened would will could can should does do did is are was were be been "
+    "the a an we our you your there it its in on of to for then and or about suppose say please".split()
+)
+# Ways of saying a piece of equipment or utility stops working
+_FAILURE_WORDS = {
+    'fail': 'failure', 'fails': 'failure', 'failed': 'failure', 'failing': 'failure',
+    'loss': 'failure', 'lose': 'failure', 'loses': 'failure', 'lost': 'failure', 'losing': 'failure',
+    'trip': 'stop', 'trips': 'stop', 'tripped': 'stop', 'stops': 'stop', 'stopped': 'stop',
+}
+# Words whose presence flips a question's meaning; a cached answer must agree on them
+_NEGATIONS = frozenset(('not', 'no', 'never', 'without', "don't", "doesn't", "isn't", "can't", "won't", 'cannot'))
+# Words that point back into the conversation ("does that apply to the condenser too?")
+_REFERRING_WORDS = frozenset((
+    'it', 'its', "it's", 'that', 'this', 'these', 'those', 'they', 'them', 'their',
+    'above', 'previous', 'earlier', 'same', 'again', 'else', 'also', 'instead', 'too'
+))
+_WORD = re.compile(r"[a-z0-9][a-z0-9.%'-]*")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_question(text):
+    """Lowercased content words of a question, with failure wording unified"""
+    words = [word.rstrip('.') for word in _WORD.findall(str(text).lower())]
+    words = [_FAILURE_WORDS.get(word, word) for word in words if word and word not in _FILLER_WORDS]
+    # "loss of cooling water" reads as "cooling water failure"
+    if len(words) > 1 and words[0] in ('failure', 'stop'):
+        words = words[1:] + words[:1]
+    return ' '.join(words)
+
+
+def question_guard(text):
+    """Numbers and negations in a question; near-identical questions differing in these are not the same"""
+    lowered = str(text).lower()
+    return (tuple(_NUMBER.findall(lowered)), bool(_NEGATIONS.intersection(_WORD.findall(lowered))))
+
+
+def is_follow_up(text):
+    """True if a question leans on earlier turns, so its answer depends on the conversation"""
+    return bool(_REFERRING_WORDS.intersection(_WORD.findall(str(text).lower())))
+
+
+class SemanticAnswerCache:
+    """Bounded LRU of answers, looked up by fingerprint and question similarity.
+
+    An exact match on the normalized question is a dict lookup; otherwise the
+    question is embedded and compared with the stored questions for the same
+    fingerprint, and the best one at or above `threshold` cosine similarity
+    is served. Entries expire after `ttl_seconds`.
+    """
+
+    def __init__(self, embedder, max_entries=512, threshold=0.9, ttl_seconds=3600, min_words=2):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.min_words = min_words
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # (fingerprint, question) -> (expires_at, vector, guard, answer)
+        self._groups = {}               # fingerprint -> {question: None} in insertion order
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def cacheable(self, question):
+        """Too-short questions ("and then?") lean on the conversation, not the analysis"""
+        return len(normalize_question(question).split()) >= self.min_words
+
+    def _embed(self, normalized):
+        return self.embedder.embed([normalized])[0]
+
+    def _drop(self, key):
+        del self._entries[key]
+        group = self._groups.get(key[0])
+        if group is not None:
+            group.pop(key[1], None)
+            if not group:
+                del self._groups[key[0]]
+
+    def get(self, fingerprint, question):
+        """Cached answer for question, or None"""
+        if not self.enabled or not self.cacheable(question):
+            return None
+        normalized = normalize_question(question)
+        guard = question_guard(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((fingerprint, normalized))
+            if entry is not None and entry[0] > now and entry[2] == guard:
+                self._entries.move_to_end((fingerprint, normalized))
+                self.hits += 1
+                return entry[3]
+            questions = list(self._groups.get(fingerprint, ()))
+
+        best_key = None
+        if questions:
+            vector = self._embed(normalized)
+            with self._lock:
+                candidates = []
+                for stored in questions:
+                    entry = self._entries.get((fingerprint, stored))
+                    if entry is None or entry[2] != guard:
+                        continue
+                    if entry[0] <= now:
+                        self._drop((fingerprint, stored))
+                        continue
+                    candidates.append((stored, entry[1]))
+                if candidates:
+                    scores = np.stack([stored_vector for _, stored_vector in candidates]) @ vector
+                    position = int(np.argmax(scores))
+                    if scores[position] >= self.threshold:
+                        best_key = (fingerprint, candidates[position][0])
+                if best_key is not None and best_key in self._entries:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[best_key][3]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, fingerprint, question, answer):
+        if not self.enabled or not answer or not self.cacheable(question):
+            return
+        normalized = normalize_question(question)
+        vector = self._embed(normalized)
+        key = (fingerprint, normalized)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, vector, question_guard(question), answer)
+            self._entries.move_to_end(key)
+            self._groups.setdefault(fingerprint, {})[normalized] = None
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+                'threshold': self.threshold
+            }
@@ -1,4 +1,8 @@
-from safety_assistant import app
+import os
+import sys
+
+# Serverless entry point: every /api/* route is served by the one Flask app in
+# the root module. It is built once per container and reused by warm invocations.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def handler(request):
-    return app(request.environ, lambda *args: None)
+from safety_assistant import app
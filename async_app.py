@@ -0,0 +1,597 @@
+"""Asyncio serving mode for the safety assistant API.
+
+Run with:  uvicorn async_app:app --host 0.0.0.0 --port 5002
+
+Serves the same routes as the Flask app in safety_assistant.py. Model calls go
+through the model router's non-blocking calls, so a single worker process can
+keep hundreds of analyses in flight. Supabase, index and extraction work uses
+blocking client libraries and runs on worker threads. Each backend has its own
+concurrency semaphore and timeout, so a burst of analyses cannot exhaust the
+thread pool or pile up unbounded upstream calls.
+"""
+import asyncio
+import contextvars
+import email.utils
+import functools
+import os
+import time
+from datetime import timezone
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import safety_assistant as core
+from request_coalescing import AsyncSingleFlight
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "64"))
+STORAGE_CONCURRENCY = int(os.getenv("STORAGE_CONCURRENCY", "16"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+STORAGE_TIMEOUT_SECONDS = float(os.getenv("STORAGE_TIMEOUT_SECONDS", "30"))
+UPLOAD_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_TIMEOUT_SECONDS", "300"))
+
+# Created on startup so they bind to the server's event loop
+llm_semaphore = None
+storage_semaphore = None
+hazard_flights = None
+# Background conversation summaries, one per session at a time
+summary_tasks = {}
+
+
+class BackendTimeout(Exception):
+    """A model or storage call exceeded its timeout"""
+
+
+async def run_storage(func, *args, timeout=STORAGE_TIMEOUT_SECONDS, **kwargs):
+    """Run a blocking storage/index call on a worker thread, bounded by the storage semaphore"""
+    loop = asyncio.get_running_loop()
+    async with storage_semaphore:
+        try:
+            return await asyncio.wait_for(
+                # In the request's context, so stage timings recorded on the thread reach its Server-Timing
+                loop.run_in_executor(None, contextvars.copy_context().run, functools.partial(func, *args, **kwargs)),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            raise BackendTimeout(f"Storage call {func.__name__} timed out after {timeout:.0f}s")
+
+
+def admission_slot(route, messages):
+    """The current tenant's turn in the shared fair queue, sized by the call's estimated tokens"""
+    return core.admission.async_slot(core.current_tenant(), core.estimate_call_tokens(route, messages))
+
+
+async def complete(route, messages, temperature, **options):
+    """Non-blocking completion from the route's best model, once admitted and within the model semaphore"""
+    async with admission_slot(route, messages), llm_semaphore:
+        try:
+            return await asyncio.wait_for(
+                core.model_router.acomplete(route, messages, temperature, **options),
+                LLM_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            raise BackendTimeout(f"Model call timed out after {LLM_TIMEOUT_SECONDS:.0f}s")
+
+
+async def stream_completion(route, messages, temperature):
+    """Yield content deltas from a non-blocking streamed completion within one overall deadline"""
+    loop = asyncio.get_running_loop()
+    async with admission_slot(route, messages), llm_semaphore:
+        deadline = loop.time() + LLM_TIMEOUT_SECONDS
+        chunks = core.model_router.astream(route, messages, temperature)
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                yield delta
+        except asyncio.TimeoutError:
+            raise BackendTimeout(f"Model stream timed out after {LLM_TIMEOUT_SECONDS:.0f}s")
+        finally:
+            await chunks.aclose()
+
+
+def sse_response(chunks, result_field, extra=None, on_complete=None, preliminary=None):
+    """Stream async text chunks as Server-Sent Events, mirroring the Flask app's format
+
+    on_complete, if given, is a coroutine function awaited with the full text
+    before the final event.
+    """
+    async def generate():
+        parts = []
+        try:
+            for event, payload in preliminary or []:
+                yield core.sse_event(payload, event=event)
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield core.sse_event({'delta': chunk})
+            text = "".join(parts)
+            if on_complete is not None:
+                await on_complete(text)
+            yield core.sse_event(dict(extra or {}, **{result_field: text}), event='done')
+        except Exception as e:
+            print(f"Error while streaming response: {e}")
+            yield core.sse_event({'error': str(e)}, event='error')
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def summarize_turns(summary, turns):
+    """Non-blocking version of core.summarize_turns"""
+    try:
+        content = await complete('summary', core.build_summary_messages(summary, turns, core.CHAT_SUMMARY_TOKEN_BUDGET), 0)
+        return core.truncate_to_tokens(content.strip(), core.CHAT_SUMMARY_TOKEN_BUDGET)
+    except Exception as e:
+        print(f"Error summarizing conversation, using extractive summary: {e}")
+        return core.extractive_summary(summary, turns, core.CHAT_SUMMARY_TOKEN_BUDGET)
+
+
+async def record_chat_turn(session_id, user_message, assistant_response):
+    """Non-blocking version of core.record_chat_turn: the turn is saved now, older turns are summarized in a background task"""
+    turn = {'user': user_message, 'assistant': assistant_response}
+    session = await run_storage(core.session_store.update, session_id, lambda session: session['messages'].append(turn))
+    if core.turns_to_summarize(session) and session_id not in summary_tasks:
+        task = summary_tasks[session_id] = asyncio.ensure_future(summarize_chat_session(session_id))
+        task.add_done_callback(lambda _: summary_tasks.pop(session_id, None))
+
+
+async def summarize_chat_session(session_id):
+    """Non-blocking version of core.summarize_chat_session"""
+    try:
+        session = await run_storage(core.load_session, session_id)
+        older = core.turns_to_summarize(session)
+        if older:
+            previous = session.get('summary', '')
+            summary = await summarize_turns(previous, older)
+            await run_storage(core.fold_chat_summary, session_id, older, previous, summary)
+    except Exception as e:
+        print(f"Error summarizing chat session {session_id}: {e}")
+
+
+async def finish_chat_turn(session_id, user_message, fingerprint, assistant_response):
+    """Non-blocking version of core.finish_chat_turn"""
+    if fingerprint is not None:
+        await run_storage(core.chat_answer_cache.set, fingerprint, user_message, assistant_response)
+    await record_chat_turn(session_id, user_message, assistant_response)
+
+
+def error_response(e, status):
+    if isinstance(e, BackendTimeout):
+        return JSONResponse({'error': str(e)}, status_code=504)
+    if isinstance(e, core.AdmissionRejected):
+        body, status, headers = core.admission_rejection(e)
+        return JSONResponse(body, status_code=status, headers=headers)
+    return JSONResponse({'error': str(e)}, status_code=status)
+
+
+def admit(request, data):
+    """Per-tenant rate limiting and load shedding; the request's model calls then queue under its tenant"""
+    tenant = core.request_tenant(request.headers, data.get('sessionId'), request.client.host if request.client else None)
+    core.set_current_tenant(tenant)
+    core.admit_request(request.url.path, data, tenant)
+    return tenant
+
+
+async def hazard_analysis_api(request):
+    try:
+        data = await request.json()
+        admit(request, data)
+        params = core.parse_hazard_request(data)
+
+        # Update chat session with process data for context
+        session_id = data.get('sessionId', 'default')
+        await run_storage(core.update_session_process_data, session_id, core.describe_process(params))
+
+        screening = core.screen_hazards(params)
+        structured = core.wants_structured_report(data)
+        if data.get('stream') or request.query_params.get('stream') in ('1', 'true'):
+            if structured:
+                return JSONResponse({'error': 'Streaming is not available for the JSON report format'}, status_code=400)
+            # Send the rule-engine flags before retrieval and the model call start
+            async def chunks():
+                prepared = await run_storage(core.prepare_hazard_analysis, **params)
+                if prepared['cached_report'] is not None:
+                    yield prepared['cached_report']
+                    return
+                parts = []
+                async for delta in stream_completion('hazard', prepared['messages'], 0.3):
+                    parts.append(delta)
+                    yield delta
+                core.cache_hazard_report(prepared, "".join(parts))
+
+            # Identical requests already streaming are joined and replayed from the start
+            key = core.hazard_request_key(core.normalize_process_params(**params))
+            return sse_response(hazard_flights.stream(key, chunks), 'report', {'screening': screening},
+                                preliminary=[('screening', screening)])
+
+        async def analyze():
+            prepared = await run_storage(core.prepare_hazard_analysis, **params, structured=structured)
+            if prepared['cached_report'] is not None:
+                return prepared['cached_report']
+            content = await complete('hazard', prepared['messages'], 0.3, **core.hazard_completion_options(prepared))
+            return core.finish_hazard_report(prepared, content)
+
+        # Concurrent identical requests share one retrieval and model call
+        key = core.hazard_request_key(core.normalize_process_params(**params), structured=structured)
+        report = await hazard_flights.do(key, analyze)
+        if structured:
+            await run_storage(core.update_session_analysis, session_id, report)
+            return JSONResponse({'report': core.render_hazard_report(report), 'structured': report, 'screening': screening})
+        return JSONResponse({'report': report, 'screening': screening})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def hazard_screening_api(request):
+    """Instant rule-based pre-screening, without retrieval or a model call"""
+    try:
+        return JSONResponse({'screening': core.screen_hazards(core.parse_hazard_request(await request.json()))})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def hazard_report_view_api(request):
+    """Filter, sort and re-render a structured report without a model call"""
+    try:
+        data = await request.json()
+        report = core.filter_hazard_report(core.validate_hazard_report(data['report']), **core.parse_report_view_args(data))
+        return JSONResponse({'report': core.render_hazard_report(report), 'structured': report})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def hazard_analysis_batch_api(request):
+    """Analyze every unit of a flowsheet in one request"""
+    try:
+        data = await request.json()
+        admit(request, data)
+        unit_specs = data['units']
+        error = core.check_batch_units(unit_specs)
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+
+        results, unique_specs, assignments = core.plan_hazard_batch(unit_specs)
+        try:
+            relevant = await run_storage(core.retrieve_for_batch, unique_specs)
+        except Exception as e:
+            print(f"Error retrieving documents for batch: {e}")
+            relevant = [None] * len(unique_specs)
+
+        # Like the Flask thread pool, one batch runs at most BATCH_MAX_PARALLEL units at once
+        parallel = asyncio.Semaphore(core.BATCH_MAX_PARALLEL)
+
+        async def analyze(position):
+            async with parallel:
+                try:
+                    prepared = await run_storage(core.prepare_hazard_analysis, **unique_specs[position], relevant_docs=relevant[position])
+                    report = prepared['cached_report']
+                    if report is None:
+                        content = await complete('hazard', prepared['messages'], 0.3, **core.hazard_completion_options(prepared))
+                        report = core.finish_hazard_report(prepared, content)
+                    return {'status': 'ok', 'report': report}
+                except Exception as e:
+                    return {'status': 'error', 'error': str(e)}
+
+        outcomes = await asyncio.gather(*(analyze(position) for position in range(len(unique_specs))))
+        return JSONResponse(core.summarize_hazard_batch(core.assemble_hazard_batch(results, unique_specs, assignments, outcomes)))
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def hazard_analysis_sweep_api(request):
+    """What-if analysis over temperature and pressure ranges: one model call per distinct flag region"""
+    try:
+        data = await request.json()
+        admit(request, data)
+        params, temps, pressures = core.parse_sweep_request(data)
+        sweep = await run_storage(core.ai_hazard_analysis_sweep, params, temps, pressures, analyze=False)
+        if not data.get('analyze', True):
+            return JSONResponse({'sweep': sweep})
+
+        # Retrieval does not depend on temperature or pressure, so every region shares it
+        query = core.hazard_retrieval_query(params['unit'], params['chemicals'], params['operation_phase'], params['phase'], params['location'])
+        relevant_docs = await run_storage(core.get_relevant_documents, query, limit=5, token_budget=core.HAZARD_CONTEXT_TOKEN_BUDGET)
+
+        parallel = asyncio.Semaphore(core.BATCH_MAX_PARALLEL)
+
+        async def analyze_region(region):
+            point = region['representative']
+            async with parallel:
+                try:
+                    prepared = await run_storage(core.prepare_hazard_analysis, **dict(params, temp=point['temp'], pressure=point['pressure']),
+                                                 relevant_docs=relevant_docs, operating_envelope=region['envelope'])
+                    report = prepared['cached_report']
+                    if report is None:
+                        report = await complete('hazard', prepared['messages'], 0.3)
+                        core.cache_hazard_report(prepared, report)
+                    region.update(report=report, status='ok')
+                except Exception as e:
+                    region.update(error=str(e), status='error')
+
+        max_regions = core.parse_max_regions(data)
+        await asyncio.gather(*(analyze_region(region) for region in sweep['regions'][:max_regions]))
+        for region in sweep['regions'][max_regions:]:
+            region['status'] = 'not_analyzed'
+        return JSONResponse({'sweep': sweep})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def submit_hazard_analysis_job(request):
+    """Queue a hazard analysis (a batch with "units", or a sweep with temp/pressure ranges) and return its job ID immediately"""
+    try:
+        data = await request.json()
+        tenant = admit(request, data)
+        kind = core.hazard_job_kind(data)
+        if kind == 'hazard_analysis':
+            await run_storage(core.update_session_process_data, data.get('sessionId', 'default'),
+                              core.describe_process(core.parse_hazard_request(data)))
+        return JSONResponse(await run_storage(core.submit_hazard_job, kind, data, tenant), status_code=202)
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def get_job(request):
+    """Poll a job's status and result"""
+    try:
+        job = await run_storage(core.get_job_queue().get, request.path_params['job_id'])
+        if job is None:
+            return JSONResponse({'error': 'Job not found'}, status_code=404)
+        return JSONResponse(core.describe_job(job))
+    except Exception as e:
+        return error_response(e, 500)
+
+
+async def job_events(request):
+    """Subscribe to a job's status changes as Server-Sent Events"""
+    job_id = request.path_params['job_id']
+    queue = await run_storage(core.get_job_queue)
+    if await run_storage(queue.get, job_id) is None:
+        return JSONResponse({'error': 'Job not found'}, status_code=404)
+
+    async def generate():
+        last_seen = None
+        deadline = time.time() + core.JOB_EVENTS_TIMEOUT_SECONDS
+        while time.time() < deadline:
+            job = await run_storage(queue.get, job_id)
+            if job is None:
+                yield core.sse_event({'error': 'Job not found'}, event='error')
+                return
+            state = (job['status'], job['attempts'])
+            if job['status'] in core.TERMINAL_STATUSES:
+                yield core.sse_event(core.describe_job(job), event='done')
+                return
+            if state != last_seen:
+                last_seen = state
+                yield core.sse_event(core.describe_job(job), event='status')
+            await asyncio.sleep(1.0)
+        yield core.sse_event({'error': 'Timed out waiting for job'}, event='error')
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def chat_api(request):
+    try:
+        data = await request.json()
+        admit(request, data)
+        session_id = data.get('sessionId', 'default')
+        user_message = data['message']
+        current_analysis = data.get('currentAnalysis')
+
+        # Update session with current analysis if provided (a structured report is kept by prepare_chat_turn)
+        if current_analysis and not core.is_hazard_report(current_analysis):
+            await run_storage(core.update_session_process_data, session_id, current_analysis)
+
+        session = await run_storage(core.load_chat_session, session_id, current_analysis)
+        fingerprint, cached = await run_storage(core.cached_chat_answer, session, user_message)
+        wants_stream = data.get('stream') or request.query_params.get('stream') in ('1', 'true')
+        if cached is not None:
+            await record_chat_turn(session_id, user_message, cached)
+            if wants_stream:
+                async def replay():
+                    yield cached
+                return sse_response(replay(), 'response', {'sessionId': session_id})
+            return JSONResponse({'response': cached, 'sessionId': session_id})
+
+        _, messages = await run_storage(core.prepare_chat_turn, session_id, user_message, session=session)
+
+        if wants_stream:
+            return sse_response(
+                stream_completion('chat', messages, 0.7), 'response', {'sessionId': session_id},
+                on_complete=functools.partial(finish_chat_turn, session_id, user_message, fingerprint)
+            )
+
+        response = await complete('chat', messages, 0.7)
+        await finish_chat_turn(session_id, user_message, fingerprint, response)
+        return JSONResponse({'response': response, 'sessionId': session_id})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def chat_cache_stats(request):
+    return JSONResponse(core.chat_answer_cache.stats())
+
+
+async def clear_chat_session(request):
+    """Clear a specific chat session"""
+    try:
+        await run_storage(core.session_store.delete, request.path_params['session_id'])
+        return JSONResponse({'message': 'Session cleared'})
+    except Exception as e:
+        return error_response(e, 400)
+
+
+async def upload_document(request):
+    """Upload and process engineering documents"""
+    try:
+        if core.get_document_store() is None:
+            return JSONResponse({'error': 'Document storage temporarily unavailable. Please try again later.'}, status_code=503)
+
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No file provided'}, status_code=400)
+        if not file.filename:
+            return JSONResponse({'error': 'No file selected'}, status_code=400)
+
+        upload_id = form.get('uploadId')
+        replaces_id = form.get('replacesDocumentId')
+        path, file_size, content_hash = await run_storage(core.spool_request_file, file.file, file.filename)
+        try:
+            body, status = await run_storage(
+                core.save_uploaded_document, path, file.filename, file_size, content_hash, upload_id, replaces_id,
+                timeout=UPLOAD_TIMEOUT_SECONDS
+            )
+        finally:
+            os.remove(path)
+        return JSONResponse(body, status_code=status)
+    except Exception as e:
+        return error_response(e, 500)
+
+
+async def upload_document_progress(request):
+    """Extraction progress for an upload started with an uploadId form field"""
+    progress = core.get_upload_progress(request.path_params['upload_id'])
+    if progress is None:
+        return JSONResponse({'error': 'Upload not found'}, status_code=404)
+    return JSONResponse(progress)
+
+
+def not_modified(request, etag, last_modified):
+    """True if the client's cached copy (If-None-Match / If-Modified-Since) is still current"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        return f'"{etag}"' in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def list_documents(request):
+    """List uploaded documents a page at a time"""
+    try:
+        if core.get_document_store() is None:
+            return JSONResponse({'error': 'Document storage temporarily unavailable. Please try again later.'}, status_code=503)
+
+        list_args = core.parse_document_list_args(request.query_params)
+        body = await run_storage(core.fetch_document_list, **list_args)
+
+        etag, last_modified = core.document_list_validators(body)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if last_modified is not None:
+            headers['Last-Modified'] = email.utils.format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+        if not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(body, headers=headers)
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e, 500)
+
+
+async def admission_stats(request):
+    return JSONResponse(core.admission.stats())
+
+
+async def chemical_knowledge_api(request):
+    try:
+        return JSONResponse(await run_storage(core.chemical_knowledge_lookup, request.query_params.get('chemicals', '')))
+    except Exception as e:
+        return error_response(e, 500)
+
+
+async def metrics_api(request):
+    """Prometheus metrics for this process"""
+    return Response(metrics.render_metrics(), media_type='text/plain; version=0.0.4')
+
+
+class RequestTimingMiddleware:
+    """Per-request stage timings, the request duration histogram and the optional Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token = metrics.begin_request()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                elapsed = time.perf_counter() - started
+                endpoint = ROUTE_PATHS.get(scope.get('endpoint'), 'unmatched')
+                metrics.HTTP_SECONDS.observe(elapsed, method=scope['method'], endpoint=endpoint, status=message['status'])
+                if core.TIMING_HEADER:
+                    header = metrics.server_timing_header(dict(metrics.current_timings(), total=elapsed))
+                    message = dict(message, headers=list(message.get('headers', [])) + [(b'server-timing', header.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.end_request(token)
+
+
+async def startup():
+    global llm_semaphore, storage_semaphore, hazard_flights
+    llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    storage_semaphore = asyncio.Semaphore(STORAGE_CONCURRENCY)
+    hazard_flights = AsyncSingleFlight(enabled=core.hazard_flights.enabled)
+
+
+async def shutdown():
+    await core.model_router.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/hazard_analysis', hazard_analysis_api, methods=['POST']),
+        Route('/api/hazard_screening', hazard_screening_api, methods=['POST']),
+        Route('/api/hazard_analysis/batch', hazard_analysis_batch_api, methods=['POST']),
+        Route('/api/hazard_analysis/sweep', hazard_analysis_sweep_api, methods=['POST']),
+        Route('/api/hazard_analysis/jobs', submit_hazard_analysis_job, methods=['POST']),
+        Route('/api/jobs/{job_id}', get_job, methods=['GET']),
+        Route('/api/jobs/{job_id}/events', job_events, methods=['GET']),
+        Route('/api/hazard_report/view', hazard_report_view_api, methods=['POST']),
+        Route('/api/chat', chat_api, methods=['POST']),
+        Route('/api/chat/cache', chat_cache_stats, methods=['GET']),
+        Route('/api/chat/session/{session_id}', clear_chat_session, methods=['DELETE']),
+        Route('/api/upload-document', upload_document, methods=['POST']),
+        Route('/api/upload-document/progress/{upload_id}', upload_document_progress, methods=['GET']),
+        Route('/api/documents', list_documents, methods=['GET']),
+        Route('/api/admission', admission_stats, methods=['GET']),
+        Route('/api/chemical_knowledge', chemical_knowledge_api, methods=['GET']),
+        Route('/metrics', metrics_api, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(RequestTimingMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown]
+)
+
+ROUTE_PATHS = {route.endpoint: route.path for route in app.routes}
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv("PORT", 5002)))
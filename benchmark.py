@@ -0,0 +1,476 @@
+"""Offline benchmark and load test for the API hot paths.
+
+Run with:  python benchmark.py --output bench.json [--baseline previous.json]
+
+Everything runs against the mock model backend and a throwaway SQLite
+document store in a temporary directory, so no API keys, network or
+Supabase project are needed and results are comparable between runs.
+Corpora and process specs are generated from a fixed seed.
+
+Suites:
+  retrieval   get_relevant_documents latency over synthetic corpora of each --sizes
+  extraction  extract_text_from_pdf and the upload page pipeline on a synthetic PDF
+  chat        chat prompt size and build time as a conversation grows
+  load        requests/sec and p50/p99 latency under concurrent clients against the Flask app
+
+The report is JSON. With --baseline, metrics that got worse by more than
+--tolerance are listed and the exit status is 1, so a release job can fail
+on regressions.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_VERSION = 1
+
+PROCESS_TERMS = [
+    'relief valve', 'overpressure', 'runaway reaction', 'flash point', 'autoignition', 'vapor cloud',
+    'heat exchanger', 'distillation column', 'reactor jacket', 'cooling water', 'nitrogen purge',
+    'flare header', 'rupture disk', 'interlock', 'HAZOP', 'LOPA', 'SIL', 'corrosion', 'embrittlement',
+    'API 521', 'OSHA 1910.119', 'NFPA 30', 'static discharge', 'inerting', 'thermal expansion',
+    'pump cavitation', 'blocked outlet', 'loss of containment', 'toxic release', 'deflagration'
+]
+FILLER_WORDS = (
+    'the operator shall verify that each line is isolated before maintenance and that pressure is '
+    'relieved to a safe location while monitoring temperature trends during startup shutdown and '
+    'normal operation with documented procedures and periodic inspection of all safeguards'
+).split()
+UNITS = ['reactor', 'distillation column', 'storage tank', 'heat exchanger', 'compressor', 'separator', 'absorber']
+PHASES = ['startup', 'normal operation', 'shutdown', 'maintenance']
+
+
+def progress(message):
+    print(message, file=sys.stderr)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def latency_summary(seconds):
+    """count, mean and p50/p95/p99 in milliseconds"""
+    return {
+        'count': len(seconds),
+        'mean_ms': round(sum(seconds) / len(seconds) * 1000, 3) if seconds else None,
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 3) if seconds else None,
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 3) if seconds else None,
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3) if seconds else None
+    }
+
+
+def synthetic_text(rng, words):
+    """Handbook-like prose mixing process-safety terms, chemical names and filler"""
+    from hazard_rules import CHEMICAL_PROPERTIES
+
+    chemicals = sorted(CHEMICAL_PROPERTIES)
+    parts = []
+    for i in range(words):
+        roll = rng.random()
+        if roll < 0.08:
+            parts.append(rng.choice(PROCESS_TERMS))
+        elif roll < 0.14:
+            parts.append(rng.choice(chemicals))
+        else:
+            parts.append(FILLER_WORDS[i % len(FILLER_WORDS)])
+        if i % 18 == 17:
+            parts[-1] += '.'
+    return " ".join(parts)
+
+
+def synthetic_corpus(count, rng, words_per_document=300):
+    """[(filename, text), ...]"""
+    return [(f"handbook-{i:06d}.txt", synthetic_text(rng, words_per_document)) for i in range(count)]
+
+
+def synthetic_process_specs(count, rng):
+    """Hazard-analysis request bodies with plausible, varied parameters"""
+    from hazard_rules import CHEMICAL_PROPERTIES
+
+    chemicals = sorted(CHEMICAL_PROPERTIES)
+    return [{
+        'unit': rng.choice(UNITS),
+        'temp': round(rng.uniform(250, 800), 1),
+        'pressure': round(rng.uniform(0.5, 150), 1),
+        'chemicals': rng.sample(chemicals, rng.randint(1, 3)),
+        'operationPhase': rng.choice(PHASES),
+        'phase': rng.choice(['gas', 'liquid']),
+        'utilities': rng.sample(['steam', 'cooling water', 'nitrogen', 'instrument air'], 2)
+    } for _ in range(count)]
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def synthetic_pdf(pages, rng, lines_per_page=45):
+    """Bytes of a valid text PDF (Helvetica, one content stream per page)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        lines = [synthetic_text(rng, 12) for _ in range(lines_per_page)]
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode('latin-1', 'replace')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{i} 0 R" for i in page_ids).encode(), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def configure_environment(workdir, args):
+    """Point the app at the mock model and throwaway local storage; must run before importing it"""
+    os.environ.update({
+        'MODEL_PROVIDER': 'mock',
+        'HAZARD_MODEL': 'gpt-4o',
+        'CHAT_MODEL': 'gpt-4o-mini',
+        'SUMMARY_MODEL': 'gpt-4o-mini',
+        'MOCK_LATENCY_SECONDS': str(args.mock_latency),
+        'MOCK_TOKENS_PER_SECOND': str(args.mock_tokens_per_second),
+        'MOCK_OUTPUT_TOKENS': str(args.mock_output_tokens),
+        'MOCK_ERROR_RATE': '0',
+        'DOCUMENT_STORE': 'sqlite',
+        'DOCUMENT_STORE_PATH': os.path.join(workdir, 'documents.db'),
+        'DOCUMENT_INDEX_PATH': os.path.join(workdir, 'document_index.json'),
+        'DOCUMENT_INDEX_SYNC_SECONDS': '3600',
+        'RETRIEVAL_MODE': 'keyword',
+        'SESSION_STORE': 'memory',
+        'UPLOAD_SPOOL_DIR': workdir,
+        'CHEMICAL_KNOWLEDGE_PATH': os.path.join(workdir, 'chemical_knowledge.db'),
+        # Every request must reach the model; cached or coalesced reports would flatter the numbers
+        'ANALYSIS_CACHE_SIZE': '0',
+        'REQUEST_COALESCING': '0',
+        # The load clients share one address; per-tenant rate limits would cap the measured throughput
+        'ADMISSION_CONTROL': '0'
+    })
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+
+def load_corpus(core, corpus):
+    """Replace the app's keyword index with one built from the corpus; returns build seconds"""
+    from document_index import DocumentIndex, chunk_text
+
+    core.sync_document_index(force=True)   # first sync against the empty store, so searches never trigger one
+    core.document_index = DocumentIndex()
+    core.document_index.synced_through = ''
+    started = time.perf_counter()
+    for number, (filename, text) in enumerate(corpus):
+        core.index_document(f"bench-{number}", filename, chunk_text(text), '')
+    return time.perf_counter() - started
+
+
+def bench_retrieval(core, sizes, rng, queries):
+    results = []
+    specs = synthetic_process_specs(queries, rng)
+    for size in sizes:
+        corpus = synthetic_corpus(size, rng)
+        build_seconds = load_corpus(core, corpus)
+        query_texts = [
+            core.hazard_retrieval_query(spec['unit'], spec['chemicals'], spec['operationPhase'], spec['phase'])
+            for spec in specs
+        ]
+        core.get_relevant_documents(query_texts[0], limit=5, token_budget=core.HAZARD_CONTEXT_TOKEN_BUDGET)   # warm-up
+        seconds = []
+        for query in query_texts:
+            started = time.perf_counter()
+            core.get_relevant_documents(query, limit=5, token_budget=core.HAZARD_CONTEXT_TOKEN_BUDGET)
+            seconds.append(time.perf_counter() - started)
+        results.append(dict(
+            latency_summary(seconds),
+            documents=size,
+            passages=len(core.document_index.passages),
+            index_build_seconds=round(build_seconds, 3)
+        ))
+        progress(f"retrieval {size} docs: p50 {results[-1]['p50_ms']} ms, p99 {results[-1]['p99_ms']} ms")
+    return results
+
+
+def bench_extraction(core, pages, rng, workdir):
+    from document_extraction import iter_document_pages
+
+    content = synthetic_pdf(pages, rng)
+    path = os.path.join(workdir, 'bench.pdf')
+    with open(path, 'wb') as handle:
+        handle.write(content)
+
+    started = time.perf_counter()
+    text = core.extract_text_from_pdf(content)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    streamed_chars = sum(len(page) for _, page in iter_document_pages(path, 'bench.pdf', workers=core.EXTRACTION_WORKERS))
+    streamed_seconds = time.perf_counter() - started
+
+    result = {
+        'pages': pages,
+        'bytes': len(content),
+        'extract_text_from_pdf': {
+            'seconds': round(legacy_seconds, 3),
+            'pages_per_second': round(pages / legacy_seconds, 1),
+            'megabytes_per_second': round(len(content) / legacy_seconds / 1e6, 3),
+            'characters': len(text)
+        },
+        'upload_pipeline': {
+            'seconds': round(streamed_seconds, 3),
+            'pages_per_second': round(pages / streamed_seconds, 1),
+            'megabytes_per_second': round(len(content) / streamed_seconds / 1e6, 3),
+            'characters': streamed_chars,
+            'workers': core.EXTRACTION_WORKERS
+        }
+    }
+    progress(f"extraction {pages} pages: {result['extract_text_from_pdf']['pages_per_second']} pages/s legacy, "
+          f"{result['upload_pipeline']['pages_per_second']} pages/s pipeline")
+    return result
+
+
+def bench_chat(core, max_turns, rng):
+    """Prompt size and build time for the next turn after 0, 1, 2, 5, 10, ... completed turns"""
+    from prompt_builder import count_tokens
+
+    load_corpus(core, synthetic_corpus(200, rng))
+    session_id = 'benchmark-chat'
+    core.session_store.delete(session_id)
+    core.update_session_process_data(session_id, synthetic_text(rng, 120))
+    checkpoints = sorted({0, 1, 2} | {n for n in (5, 10, 20, 50, 100, 200, 500) if n <= max_turns} | {max_turns})
+    results = []
+    turns = 0
+    for checkpoint in checkpoints:
+        while turns < checkpoint:
+            core.record_chat_turn(session_id, synthetic_text(rng, 30), synthetic_text(rng, 250))
+            turns += 1
+        question = f"What if the {rng.choice(PROCESS_TERMS)} fails during {rng.choice(PHASES)}?"
+        started = time.perf_counter()
+        _, messages = core.prepare_chat_turn(session_id, question)
+        build_seconds = time.perf_counter() - started
+        prompt = "\n".join(message['content'] for message in messages)
+        results.append({
+            'turns': turns,
+            'prompt_characters': len(prompt),
+            'prompt_tokens': count_tokens(prompt),
+            'build_ms': round(build_seconds * 1000, 3)
+        })
+    progress(f"chat prompt: {results[0]['prompt_tokens']} tokens at turn 0, {results[-1]['prompt_tokens']} at turn {results[-1]['turns']}")
+    return results
+
+
+def start_server(core):
+    """Serve the Flask app on a free local port from a background thread; returns (host, port, server)"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)   # no access log line per request
+    server = make_server('127.0.0.1', 0, core.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return '127.0.0.1', server.server_port, server
+
+
+def load_request(rng, specs, endpoint):
+    """A request body for endpoint"""
+    if endpoint in ('/api/hazard_analysis', '/api/hazard_screening'):
+        return rng.choice(specs)
+    return {'sessionId': f"load-{rng.randrange(1000)}", 'message': f"How do we protect against {rng.choice(PROCESS_TERMS)}?"}
+
+
+def bench_load(core, url, concurrency_levels, requests_per_level, endpoints, rng):
+    from urllib.parse import urlsplit
+
+    server = None
+    if url:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        load_corpus(core, synthetic_corpus(1000, rng))
+        host, port, server = start_server(core)
+    specs = synthetic_process_specs(200, rng)
+
+    results = []
+    try:
+        for endpoint in endpoints:
+            for concurrency in concurrency_levels:
+                bodies = [json.dumps(load_request(rng, specs, endpoint)) for _ in range(requests_per_level)]
+                seconds = []
+                errors = []
+                lock = threading.Lock()
+                cursor = iter(bodies)
+
+                def client():
+                    connection = http.client.HTTPConnection(host, port, timeout=120)
+                    while True:
+                        with lock:
+                            body = next(cursor, None)
+                        if body is None:
+                            break
+                        started = time.perf_counter()
+                        try:
+                            connection.request('POST', endpoint, body, {'Content-Type': 'application/json'})
+                            response = connection.getresponse()
+                            response.read()
+                            failed = response.status >= 400
+                        except Exception:
+                            connection.close()
+                            connection = http.client.HTTPConnection(host, port, timeout=120)
+                            failed = True
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            (errors if failed else seconds).append(elapsed)
+                    connection.close()
+
+                started = time.perf_counter()
+                clients = [threading.Thread(target=client) for _ in range(concurrency)]
+                for thread in clients:
+                    thread.start()
+                for thread in clients:
+                    thread.join()
+                wall_seconds = time.perf_counter() - started
+
+                results.append(dict(
+                    latency_summary(seconds),
+                    endpoint=endpoint,
+                    concurrency=concurrency,
+                    errors=len(errors),
+                    requests_per_second=round(len(seconds) / wall_seconds, 2)
+                ))
+                progress(f"load {endpoint} x{concurrency}: {results[-1]['requests_per_second']} req/s, "
+                      f"p50 {results[-1]['p50_ms']} ms, p99 {results[-1]['p99_ms']} ms, {len(errors)} errors")
+    finally:
+        if server is not None:
+            server.shutdown()
+    return results
+
+
+def comparable_metrics(report):
+    """Flatten a report to {name: (value, higher_is_better)} for the metrics worth tracking between releases"""
+    results = report.get('results', {})
+    metrics = {}
+    for row in results.get('retrieval', []):
+        for field in ('p50_ms', 'p99_ms'):
+            metrics[f"retrieval.{row['documents']}.{field}"] = (row[field], False)
+    extraction = results.get('extraction')
+    if extraction:
+        for path in ('extract_text_from_pdf', 'upload_pipeline'):
+            metrics[f"extraction.{path}.pages_per_second"] = (extraction[path]['pages_per_second'], True)
+    for row in results.get('chat', []):
+        metrics[f"chat.{row['turns']}.prompt_tokens"] = (row['prompt_tokens'], False)
+    for row in results.get('load', []):
+        name = f"load.{row['endpoint']}.{row['concurrency']}"
+        metrics[f"{name}.requests_per_second"] = (row['requests_per_second'], True)
+        metrics[f"{name}.p99_ms"] = (row['p99_ms'], False)
+    return metrics
+
+
+def compare_reports(report, baseline, tolerance):
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)"""
+    current = comparable_metrics(report)
+    regressions = []
+    for name, (old, higher_is_better) in comparable_metrics(baseline).items():
+        if name not in current or not old or current[name][0] is None:
+            continue
+        new = current[name][0]
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({'metric': name, 'baseline': old, 'current': new, 'change': round(change, 3)})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--suites', default='retrieval,extraction,chat,load', help='comma-separated suites to run')
+    parser.add_argument('--sizes', default='100,1000,10000', help='corpus sizes for the retrieval suite (up to 100000)')
+    parser.add_argument('--queries', type=int, default=200, help='retrieval queries per corpus size')
+    parser.add_argument('--pdf-pages', type=int, default=100)
+    parser.add_argument('--chat-turns', type=int, default=50)
+    parser.add_argument('--concurrency', default='1,8,32', help='concurrent clients per load level')
+    parser.add_argument('--requests', type=int, default=200, help='requests per load level')
+    parser.add_argument('--endpoints', default='/api/hazard_analysis,/api/hazard_screening,/api/chat')
+    parser.add_argument('--url', help='load-test a running server (e.g. http://127.0.0.1:5002) instead of an in-process one')
+    parser.add_argument('--mock-latency', type=float, default=0.05, help='mock model seconds to first token')
+    parser.add_argument('--mock-tokens-per-second', type=float, default=2000)
+    parser.add_argument('--mock-output-tokens', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed fractional regression against the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    suites = [suite.strip() for suite in args.suites.split(',') if suite.strip()]
+    workdir = tempfile.mkdtemp(prefix='hazard-bench-')
+    configure_environment(workdir, args)
+    import safety_assistant as core
+
+    rng = random.Random(args.seed)
+    results = {}
+    if 'retrieval' in suites:
+        results['retrieval'] = bench_retrieval(core, [int(size) for size in args.sizes.split(',')], rng, args.queries)
+    if 'extraction' in suites:
+        results['extraction'] = bench_extraction(core, args.pdf_pages, rng, workdir)
+    if 'chat' in suites:
+        results['chat'] = bench_chat(core, args.chat_turns, rng)
+    if 'load' in suites:
+        results['load'] = bench_load(
+            core, args.url, [int(level) for level in args.concurrency.split(',')], args.requests,
+            [endpoint.strip() for endpoint in args.endpoints.split(',')], rng
+        )
+
+    report = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as handle:
+            report['regressions'] = compare_reports(report, json.load(handle), args.tolerance)
+        for regression in report['regressions']:
+            progress(f"Regression: {regression['metric']} {regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})")
+        exit_code = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
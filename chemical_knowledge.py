@@ -0,0 +1,308 @@
+"""Precomputed per-chemical and per-pair knowledge for hazard prompts.
+
+Each chemical in a request is reduced to a canonical key (name, formula,
+synonym or CAS number all map to the same entry) and each pair of chemicals
+to an order-free pair key. An entry holds the compact facts a prompt needs:
+the property-table summary, reactive-group incompatibilities and a few
+short excerpts from indexed passages that mention the chemical (or both
+chemicals of a pair). Entries are built on first use, kept in an in-process
+LRU and an optional SQLite file, and stamped with the document corpus they
+were built from so uploads make them stale rather than wrong.
+"""
+
+import itertools
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from hazard_rules import (CHEMICAL_ALIASES, CHEMICAL_CAS, CHEMICAL_PROPERTIES, HAZARD_RULES_VERSION,
+                          INCOMPATIBLE_GROUPS, normalize_chemical)
+from prompt_builder import count_tokens
+
+# Bump whenever the content or layout of an entry changes
+KNOWLEDGE_VERSION = "knowledge-v1"
+EXCERPT_CHARS = 240
+SEVERITY_RANK = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+
+def chemical_key(name):
+    """Cache key for one chemical: its canonical table name, else its normalized text"""
+    canonical = normalize_chemical(name)
+    if canonical is not None:
+        return canonical
+    text = ' '.join(str(name).lower().split())
+    return f"text:{text}" if text else None
+
+
+def pair_key(first, second):
+    return '|'.join(sorted((first, second)))
+
+
+def chemical_terms(key):
+    """Names a passage may use for the chemical behind key"""
+    if key.startswith('text:'):
+        return [key[5:]]
+    terms = {key}
+    if key in CHEMICAL_CAS:
+        terms.add(CHEMICAL_CAS[key])
+    for alias, canonical in CHEMICAL_ALIASES.items():
+        # Short aliases ("co", "na") match too many unrelated words; short formulas ("nh3") do not
+        if canonical == key and (len(alias) >= 4 or (len(alias) >= 3 and any(c.isdigit() for c in alias))):
+            terms.add(alias)
+    return sorted(terms, key=len, reverse=True)
+
+
+def _terms_pattern(terms):
+    return re.compile(r"(?<![\w-])(?:" + "|".join(re.escape(term) for term in terms) + r")(?![\w-])", re.IGNORECASE)
+
+
+def _excerpt(content, match):
+    """About EXCERPT_CHARS of content centred on a match, on one line"""
+    start = max(0, match.start() - EXCERPT_CHARS // 2)
+    text = ' '.join(content[start:start + EXCERPT_CHARS].split())
+    return ("..." if start else "") + text + ("..." if start + EXCERPT_CHARS < len(content) else "")
+
+
+def _format_value(value, unit):
+    return f"{value:g} {unit}" if value is not None else None
+
+
+def chemical_profile(key):
+    """One-line summary of the property-table row, or None for chemicals outside the table"""
+    props = CHEMICAL_PROPERTIES.get(key)
+    if props is None:
+        return None
+    health, flammability, instability = props['nfpa']
+    facts = [f"NFPA health {health}, flammability {flammability}, instability {instability}"]
+    for label, field, unit in (('flash point', 'flash_point', 'K'), ('autoignition', 'autoignition', 'K'),
+                               ('boiling point', 'boiling_point', 'K')):
+        value = _format_value(props[field], unit)
+        if value:
+            facts.append(f"{label} {value}")
+    if props['lel'] is not None:
+        facts.append(f"flammable range {props['lel']:g}-{props['uel']:g} vol%")
+    facts.append(f"reactive groups: {', '.join(props['groups'])}")
+    return "; ".join(facts)
+
+
+def pair_incompatibilities(first, second):
+    """(severity, message) for every reactive-group clash between two table chemicals"""
+    first_groups = CHEMICAL_PROPERTIES.get(first, {}).get('groups', ())
+    second_groups = CHEMICAL_PROPERTIES.get(second, {}).get('groups', ())
+    found = set()
+    for a in first_groups:
+        for b in second_groups:
+            rule = INCOMPATIBLE_GROUPS.get(frozenset((a, b)))
+            if rule is not None and a != b:
+                found.add(rule)
+    return sorted(found, key=lambda rule: SEVERITY_RANK.get(rule[0], len(SEVERITY_RANK)))
+
+
+class KnowledgeCache:
+    """Two-tier store for knowledge entries, in the style of AnalysisCache.
+
+    Entries carry the stamp they were built under; a lookup with a different
+    stamp is a miss, and the rebuilt entry replaces the stale one.
+    """
+
+    def __init__(self, max_entries=2048, sqlite_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()   # key -> (stamp, value)
+        self._lock = threading.RLock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS chemical_knowledge (
+                    key TEXT PRIMARY KEY,
+                    stamp TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self._db.commit()
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT stamp, value FROM chemical_knowledge WHERE key = ?', (key,)).fetchone()
+                if row is not None and row[0] == stamp:
+                    value = json.loads(row[1])
+                    self._remember(key, stamp, value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key, stamp, value):
+        with self._lock:
+            self._remember(key, stamp, value)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO chemical_knowledge (key, stamp, value, updated_at) VALUES (?, ?, ?, ?)',
+                    (key, stamp, json.dumps(value), time.time())
+                )
+                self._db.commit()
+
+    def _remember(self, key, stamp, value):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (stamp, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM chemical_knowledge')
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            disk = None
+            if self._db is not None:
+                disk = self._db.execute('SELECT COUNT(*) FROM chemical_knowledge').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._memory), 'disk_entries': disk}
+
+
+class ChemicalKnowledge:
+    """Builds, caches and formats knowledge entries for sets of chemicals.
+
+    `search_passages(query, limit)` returns candidate passages (dicts with
+    chunk_id, filename and content) and `corpus_stamp()` a string that
+    changes whenever the indexed documents do.
+    """
+
+    def __init__(self, search_passages, corpus_stamp, cache=None, passages_per_entry=2, enabled=True):
+        self.search_passages = search_passages
+        self.corpus_stamp = corpus_stamp
+        self.cache = cache or KnowledgeCache()
+        self.passages_per_entry = passages_per_entry
+        self.enabled = enabled
+        self.builds = 0
+        self._warm_lock = threading.Lock()
+
+    def _stamp(self):
+        return f"{KNOWLEDGE_VERSION}:{HAZARD_RULES_VERSION}:{self.corpus_stamp()}"
+
+    def _find_passages(self, term_groups):
+        """Passages that mention a name from every group, best BM25 match first"""
+        if self.passages_per_entry <= 0:
+            return []
+        patterns = [_terms_pattern(terms) for terms in term_groups]
+        query = ' '.join(terms[0] for terms in term_groups)
+        found = []
+        for passage in self.search_passages(query, self.passages_per_entry * 10):
+            if passage is None:
+                continue
+            matches = [pattern.search(passage['content']) for pattern in patterns]
+            if all(matches):
+                found.append({
+                    'chunk_id': passage['chunk_id'],
+                    'filename': passage.get('filename', ''),
+                    'excerpt': _excerpt(passage['content'], matches[-1] if len(matches) > 1 else matches[0])
+                })
+                if len(found) >= self.passages_per_entry:
+                    break
+        return found
+
+    def _build_chemical(self, key):
+        terms = chemical_terms(key)
+        return {
+            'key': key,
+            'name': key[5:] if key.startswith('text:') else key,
+            'known': key in CHEMICAL_PROPERTIES,
+            'cas': CHEMICAL_CAS.get(key),
+            'synonyms': [term for term in terms if term != key and term != CHEMICAL_CAS.get(key)],
+            'profile': chemical_profile(key),
+            'passages': self._find_passages([terms])
+        }
+
+    def _build_pair(self, first, second):
+        return {
+            'key': pair_key(first, second),
+            'chemicals': sorted((first, second)),
+            'incompatibilities': [list(rule) for rule in pair_incompatibilities(first, second)],
+            'passages': self._find_passages([chemical_terms(first), chemical_terms(second)])
+        }
+
+    def _entry(self, key, stamp, build):
+        value = self.cache.get(key, stamp)
+        if value is None:
+            value = build()
+            self.builds += 1
+            self.cache.set(key, stamp, value)
+        return value
+
+    def lookup(self, chemicals):
+        """{'chemicals': [...], 'pairs': [...]} for a list of chemical names, building missing entries"""
+        keys = list(dict.fromkeys(key for key in (chemical_key(name) for name in chemicals) if key))
+        stamp = self._stamp()
+        return {
+            'chemicals': [self._entry(key, stamp, lambda key=key: self._build_chemical(key)) for key in keys],
+            'pairs': [
+                self._entry(pair_key(first, second), stamp, lambda first=first, second=second: self._build_pair(first, second))
+                for first, second in itertools.combinations(keys, 2)
+            ]
+        }
+
+    def warm(self, chemicals):
+        """Build every chemical and pair entry for an inventory; returns how many were rebuilt"""
+        with self._warm_lock:
+            before = self.builds
+            self.lookup(chemicals)
+            return self.builds - before
+
+    def stats(self):
+        return dict(self.cache.stats(), enabled=self.enabled, builds=self.builds)
+
+
+def format_knowledge_context(knowledge, token_budget, skip_chunk_ids=()):
+    """Render lookup() output as a compact prompt section within token_budget.
+
+    Pair incompatibilities are left to the rule screening section, which
+    already states them, and so are excerpts from passages already in the
+    prompt. Returns (section text, chunk IDs of the excerpts included).
+    """
+    skip_chunk_ids = set(skip_chunk_ids)
+    lines = []   # (chunk ID or None, line)
+    for chemical in knowledge['chemicals']:
+        if chemical['profile']:
+            names = [f"CAS {chemical['cas']}"] if chemical['cas'] else []
+            names += chemical['synonyms'][:3]
+            lines.append((None, f"- {chemical['name']} ({'; '.join(names)}): {chemical['profile']}"))
+    for entry in knowledge['pairs'] + knowledge['chemicals']:
+        label = ' + '.join(entry['chemicals']) if 'chemicals' in entry else entry['name']
+        for passage in entry['passages']:
+            if passage['chunk_id'] not in skip_chunk_ids:
+                skip_chunk_ids.add(passage['chunk_id'])
+                lines.append((passage['chunk_id'], f"- {label}, {passage['filename']} (passage {passage['chunk_id']}): {passage['excerpt']}"))
+
+    heading = "\n\nChemical Knowledge (precomputed reference data):\n"
+    context = ""
+    chunk_ids = []
+    used = count_tokens(heading)
+    for chunk_id, line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > token_budget:
+            continue
+        context += line + "\n"
+        used += cost
+        if chunk_id is not None:
+            chunk_ids.append(chunk_id)
+    return (heading + context if context else ""), chunk_ids
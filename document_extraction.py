@@ -0,0 +1,202 @@
+import codecs
+import functools
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+PDF_PAGES_PER_TASK = 8
+TEXT_READ_CHARS = 64 * 1024
+DOCX_PARAGRAPHS_PER_PAGE = 50
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def spool_upload(stream, directory=None, suffix=''):
+    """Copy an upload stream to a temporary file in fixed-size pieces, hashing it on the way.
+
+    Returns (path, size in bytes, SHA-256 hex digest).
+    """
+    handle = tempfile.NamedTemporaryFile(delete=False, dir=directory, suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with handle:
+            while True:
+                piece = stream.read(SPOOL_CHUNK_BYTES)
+                if not piece:
+                    break
+                handle.write(piece)
+                digest.update(piece)
+                size += len(piece)
+    except Exception:
+        os.remove(handle.name)
+        raise
+    return handle.name, size, digest.hexdigest()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_extraction_pool(workers):
+    """Shared process pool for page extraction, created on first use.
+
+    Uses the spawn start method: forking a threaded web server can copy
+    locks held by other threads into the children.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def reset_extraction_pool(pool):
+    """Drop a broken pool (e.g. a worker was OOM-killed) so the next upload starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_hash(page):
+    """Fingerprint of a PDF page's drawing instructions, cheap next to text extraction"""
+    contents = page.get_contents()
+    return hashlib.sha256(contents.get_data() if contents is not None else b'').hexdigest()
+
+
+def _extract_pdf_pages(path, numbers):
+    """Worker: (page hash, text) for the given page numbers of the PDF at path"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(path)
+    pages = []
+    for number in numbers:
+        try:
+            page = reader.pages[number]
+            pages.append((_page_hash(page), page.extract_text() or ''))
+        except Exception as e:
+            print(f"Error extracting PDF page {number + 1}: {e}")
+            pages.append((None, ''))
+    return pages
+
+
+def pdf_page_count(path):
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def pdf_page_hashes(path):
+    """Page hashes for every page of a PDF, without extracting any text"""
+    import PyPDF2
+
+    hashes = []
+    for page in PyPDF2.PdfReader(path).pages:
+        try:
+            hashes.append(_page_hash(page))
+        except Exception as e:
+            print(f"Error hashing PDF page {len(hashes) + 1}: {e}")
+            hashes.append(None)
+    return hashes
+
+
+def iter_pdf_pages(path, workers=None, parallel_min_pages=16, progress=None, known_pages=None):
+    """Yield (page hash, text) for each PDF page in order.
+
+    Pages in `known_pages` (page number -> (hash, text)) are passed through
+    without extraction. The rest are split into batches extracted across a
+    process pool. Only a few batches are in flight at a time, so memory holds
+    a few pages, not the whole book.
+    """
+    known_pages = known_pages or {}
+    total = pdf_page_count(path)
+    workers = workers or os.cpu_count() or 1
+    missing = [number for number in range(total) if number not in known_pages]
+    batches = deque(missing[start:start + PDF_PAGES_PER_TASK] for start in range(0, len(missing), PDF_PAGES_PER_TASK))
+
+    pool = submit = None
+    if len(missing) >= parallel_min_pages and workers > 1:
+        pool = get_extraction_pool(workers)
+        submit = functools.partial(pool.submit, _extract_pdf_pages, path)
+
+    in_flight = deque()   # (page numbers, future or None)
+    extracted = {}
+    try:
+        for number in range(total):
+            if number in known_pages:
+                page = known_pages[number]
+            else:
+                while number not in extracted:
+                    while batches and len(in_flight) < max(workers * 2, 1):
+                        batch = batches.popleft()
+                        in_flight.append((batch, submit(batch) if submit else None))
+                    batch, future = in_flight.popleft()
+                    pages = future.result() if future is not None else _extract_pdf_pages(path, batch)
+                    extracted.update(zip(batch, pages))
+                page = extracted.pop(number)
+            if progress:
+                progress(number + 1, total)
+            yield page
+    except BrokenProcessPool:
+        reset_extraction_pool(pool)
+        raise
+    finally:
+        for _, future in in_flight:
+            if future is not None:
+                future.cancel()
+
+
+def iter_docx_pages(path, progress=None):
+    """Yield DOCX text in groups of paragraphs (DOCX files have no fixed pages)"""
+    import docx
+
+    paragraphs = docx.Document(path).paragraphs
+    total = (len(paragraphs) + DOCX_PARAGRAPHS_PER_PAGE - 1) // DOCX_PARAGRAPHS_PER_PAGE
+    for number, start in enumerate(range(0, len(paragraphs), DOCX_PARAGRAPHS_PER_PAGE), 1):
+        if progress:
+            progress(number, total)
+        yield "".join(p.text + "\n" for p in paragraphs[start:start + DOCX_PARAGRAPHS_PER_PAGE])
+
+
+def iter_txt_pages(path, progress=None):
+    """Yield a UTF-8 text file in fixed-size pieces"""
+    total_bytes = os.path.getsize(path)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as handle:
+        while True:
+            raw = handle.read(TEXT_READ_CHARS)
+            if not raw:
+                break
+            if progress:
+                progress(handle.tell(), total_bytes)
+            yield decoder.decode(raw)
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+
+def iter_document_pages(path, filename, workers=None, progress=None, known_pages=None):
+    """Yield (page hash, text) for an uploaded file page by page; each text ends with a newline, as before.
+
+    Only PDF pages are hashed; other formats yield None hashes.
+    """
+    file_extension = filename.lower().split('.')[-1]
+
+    if file_extension == 'pdf':
+        for page_hash, text in iter_pdf_pages(path, workers=workers, progress=progress, known_pages=known_pages):
+            yield page_hash, text + "\n"
+    elif file_extension in ['docx', 'doc']:
+        for text in iter_docx_pages(path, progress=progress):
+            yield None, text
+    elif file_extension == 'txt':
+        for text in iter_txt_pages(path, progress=progress):
+            yield None, text
@@ -0,0 +1,306 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Tokens keep internal dots/dashes so "h2so4", "api-521" and "1.5" survive intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have if in into is it its no not of on or
+such that the their then there these they this to was were will with none
+""".split())
+
+INDEX_FORMAT_VERSION = 3
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP_CHARS = 200
+
+
+def tokenize(text):
+    """Lowercase text and split it into index terms"""
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return (len(text) + 3) // 4
+
+
+def make_chunk_id(doc_id, chunk_index):
+    """Stable passage ID derived from the owning document and the passage position"""
+    return f"{doc_id}:{chunk_index}"
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS, overlap_chars=CHUNK_OVERLAP_CHARS):
+    """Split text into overlapping passages.
+
+    Passage boundaries snap back to the nearest paragraph or whitespace break
+    so words are not cut in half. Each passage records its character offsets
+    in the original text, so the same text always yields the same passages.
+    """
+    chunker = StreamingChunker(chunk_chars, overlap_chars)
+    return chunker.feed(text or '') + chunker.finish()
+
+
+def rebuild_text(chunks):
+    """Reassemble the chunked text from passages and their offsets.
+
+    Passages are stored stripped, so whitespace that no passage covers comes
+    back as spaces; callers must verify any span they reuse.
+    """
+    pieces = []
+    length = 0
+    previous_start, previous_content = 0, ''
+    for chunk in sorted(chunks, key=lambda chunk: chunk['chunk_index']):
+        start, content = chunk['start_offset'], chunk['content']
+        # Find where the stripped content sat inside its window, using the overlap with the previous passage
+        slack = max(chunk['end_offset'] - start - len(content), 0)
+        position = start
+        for lead in range(slack + 1):
+            overlap = previous_content[start + lead - previous_start:] if start + lead >= previous_start else ''
+            if content.startswith(overlap[:len(content)]):
+                position = start + lead
+                break
+
+        if position > length:
+            pieces.append(' ' * (position - length))
+            length = position
+        if position + len(content) > length:
+            pieces.append(content[length - position:])
+            length = position + len(content)
+        previous_start, previous_content = position, content
+    return ''.join(pieces)
+
+
+class StreamingChunker:
+    """Incremental chunk_text: feed text as it arrives and get passages as soon as they are final.
+
+    Only the unfinished tail is buffered, so memory stays at about one passage
+    plus one fed piece no matter how long the document is. Feeding a text in
+    pieces yields exactly the passages chunk_text gives for the whole text.
+    """
+
+    def __init__(self, chunk_chars=CHUNK_CHARS, overlap_chars=CHUNK_OVERLAP_CHARS):
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self.buffer = ''
+        self.buffer_offset = 0   # offset of buffer[0] in the whole text
+        self.chunk_count = 0
+
+    def feed(self, text):
+        """Add text and return the passages completed by it"""
+        self.buffer += text
+        return self._drain(final=False)
+
+    def finish(self):
+        """Return the remaining passages at the end of the text"""
+        return self._drain(final=True)
+
+    def _drain(self, final):
+        chunks = []
+        text = self.buffer
+        length = len(text)
+        start = 0
+        # A passage is final once the text runs past its window (or the text has ended)
+        while start < length and (final or length - start > self.chunk_chars):
+            end = min(start + self.chunk_chars, length)
+            if end < length:
+                floor = start + self.chunk_chars // 2
+                for separator in ('\n\n', '\n', ' '):
+                    cut = text.rfind(separator, floor, end)
+                    if cut != -1:
+                        end = cut + len(separator)
+                        break
+
+            content = text[start:end].strip()
+            if content:
+                chunks.append({
+                    'chunk_index': self.chunk_count,
+                    'start_offset': self.buffer_offset + start,
+                    'end_offset': self.buffer_offset + end,
+                    'content': content
+                })
+                self.chunk_count += 1
+
+            if end >= length:
+                start = length
+                break
+            next_start = max(end - self.overlap_chars, start + 1)
+            # Begin the overlap on a word boundary as well
+            space = text.find(' ', next_start, end)
+            start = space + 1 if space != -1 else next_start
+
+        self.buffer = text[start:]
+        self.buffer_offset += start
+        return chunks
+
+
+class DocumentIndex:
+    """In-memory inverted index over document passages with Okapi BM25 ranking.
+
+    Documents are split into passages and tokenized once when they are added;
+    queries only touch the posting lists of their own terms, so search cost is
+    independent of how much text the corpus holds.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}        # term -> {chunk_id: term frequency}
+        self.chunk_lengths = {}   # chunk_id -> number of terms
+        self.chunk_terms = {}     # chunk_id -> terms, so removal is cheap
+        self.passages = {}        # chunk_id -> passage text and metadata
+        self.documents = {}       # doc_id -> document metadata and chunk IDs
+        self.total_length = 0
+        self.synced_through = None  # newest upload_date pulled from storage
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def add_document(self, doc_id, filename, chunks, upload_date=''):
+        """Index a document's passages, replacing any previous version with the same ID"""
+        filename_terms = Counter(tokenize(filename))
+        indexed = []
+        for chunk in chunks:
+            term_counts = Counter(tokenize(chunk['content']))
+            term_counts.update(filename_terms)
+            indexed.append((make_chunk_id(doc_id, chunk['chunk_index']), chunk, term_counts))
+
+        with self._lock:
+            if doc_id in self.documents:
+                self.remove_document(doc_id)
+
+            for chunk_id, chunk, term_counts in indexed:
+                for term, count in term_counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = count
+
+                length = sum(term_counts.values())
+                self.chunk_lengths[chunk_id] = length
+                self.chunk_terms[chunk_id] = tuple(term_counts)
+                self.total_length += length
+                self.passages[chunk_id] = {
+                    'document_id': doc_id,
+                    'chunk_index': chunk['chunk_index'],
+                    'start_offset': chunk['start_offset'],
+                    'end_offset': chunk['end_offset'],
+                    'content': chunk['content']
+                }
+
+            self.documents[doc_id] = {
+                'filename': filename,
+                'upload_date': upload_date or '',
+                'chunk_ids': [chunk_id for chunk_id, _, _ in indexed]
+            }
+
+    def remove_document(self, doc_id):
+        """Drop a document and all of its passages from the index"""
+        with self._lock:
+            document = self.documents.pop(doc_id, None)
+            if document is None:
+                return False
+
+            for chunk_id in document['chunk_ids']:
+                for term in self.chunk_terms.pop(chunk_id):
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        continue
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+                self.total_length -= self.chunk_lengths.pop(chunk_id)
+                del self.passages[chunk_id]
+            return True
+
+    def search(self, query, limit=5, candidates=None):
+        """Return up to `limit` (chunk_id, score) pairs ordered by BM25 score.
+
+        If `candidates` is given, only those chunk IDs are scored.
+        """
+        terms = set(tokenize(query))
+
+        with self._lock:
+            chunk_count = len(self.passages)
+            if not terms or chunk_count == 0:
+                return []
+
+            avg_length = self.total_length / chunk_count or 1.0
+            scores = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+
+                df = len(posting)
+                idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in posting.items():
+                    if candidates is not None and chunk_id not in candidates:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def get_passage(self, chunk_id):
+        """Return a passage merged with its document's filename and upload date, or None"""
+        with self._lock:
+            passage = self.passages.get(chunk_id)
+            if passage is None:
+                return None
+            document = self.documents[passage['document_id']]
+            return dict(passage, chunk_id=chunk_id, filename=document['filename'], upload_date=document['upload_date'])
+
+    # 💾 Snapshot persistence so workers and restarts skip the full rebuild
+    def save(self, path):
+        """Atomically write the index to `path` as JSON"""
+        with self._lock:
+            state = {
+                'version': INDEX_FORMAT_VERSION,
+                'postings': self.postings,
+                'chunk_lengths': self.chunk_lengths,
+                'chunk_terms': self.chunk_terms,
+                'passages': self.passages,
+                # Document IDs may be integers, which JSON object keys cannot hold
+                'documents': list(self.documents.items()),
+                'total_length': self.total_length,
+                'synced_through': self.synced_through
+            }
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(state, handle, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load a snapshot written by `save`, or return an empty index"""
+        index = cls(**kwargs)
+        if not path or not os.path.exists(path):
+            return index
+
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                state = json.load(handle)
+            if state.get('version') != INDEX_FORMAT_VERSION:
+                return index
+            index.postings = state['postings']
+            index.chunk_lengths = state['chunk_lengths']
+            index.chunk_terms = {chunk_id: tuple(terms) for chunk_id, terms in state['chunk_terms'].items()}
+            index.passages = state['passages']
+            index.documents = {doc_id: document for doc_id, document in state['documents']}
+            index.total_length = state['total_length']
+            index.synced_through = state['synced_through']
+        except Exception as e:
+            print(f"Warning: could not load document index from {path}: {e}")
+            return cls(**kwargs)
+
+        return index
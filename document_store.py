@@ -0,0 +1,376 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from document_index import make_chunk_id
+
+WRITE_BATCH_SIZE = 100
+
+DOCUMENT_COLUMNS = ('id', 'filename', 'content', 'upload_date', 'file_size', 'content_length', 'content_hash')
+CHUNK_COLUMNS = ('document_id', 'chunk_index', 'start_offset', 'end_offset', 'content')
+PAGE_COLUMNS = ('page_number', 'page_hash', 'text_hash', 'start_offset', 'end_offset')
+
+
+def parse_list_cursor(after):
+    """(ISO upload_date, integer id) from a list cursor, or ValueError; the values end up in query filters"""
+    try:
+        upload_date, document_id = after
+        datetime.fromisoformat(str(upload_date).replace('Z', '+00:00'))
+        if isinstance(document_id, bool):
+            raise TypeError('id must be an integer')
+        return str(upload_date), int(document_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def chunk_rows(document_id, chunks):
+    """Storage rows for a document's passages, keyed by their stable chunk IDs"""
+    return [
+        {
+            'document_id': document_id,
+            'chunk_id': make_chunk_id(document_id, chunk['chunk_index']),
+            'chunk_index': chunk['chunk_index'],
+            'start_offset': chunk['start_offset'],
+            'end_offset': chunk['end_offset'],
+            'content': chunk['content']
+        }
+        for chunk in chunks
+    ]
+
+
+class SupabaseDocumentStore:
+    """Documents, passages and page hashes in Supabase tables (documents, document_chunks, document_pages)"""
+
+    name = 'supabase'
+
+    def __init__(self, client):
+        self.client = client
+
+    def documents_since(self, since, start, count):
+        """Metadata of documents uploaded at or after `since` in (upload_date, id) order, rows [start, start + count).
+
+        Rows sharing the `since` timestamp are returned again rather than
+        risk skipping one that landed after the last sync; the caller skips
+        documents it has already indexed.
+        """
+        query = self.client.table('documents').select('id, filename, upload_date').order('upload_date').order('id')
+        if since:
+            query = query.gte('upload_date', since)
+        return query.range(start, start + count - 1).execute().data
+
+    def get_content(self, document_id):
+        response = self.client.table('documents').select('content').eq('id', document_id).execute()
+        return response.data[0].get('content', '') if response.data else ''
+
+    def find_by_hash(self, content_hash):
+        response = self.client.table('documents').select('id, filename, content_length').eq('content_hash', content_hash).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def find_previous_versions(self, filename, document_id=None, limit=3):
+        """[the document named by `document_id`], else the latest `limit` documents with this filename"""
+        query = self.client.table('documents').select('id, filename, content_hash, content_length')
+        if document_id:
+            query = query.eq('id', document_id).limit(1)
+        else:
+            query = query.eq('filename', filename).order('upload_date', desc=True).order('id', desc=True).limit(limit)
+        return query.execute().data or []
+
+    def insert_document(self, fields):
+        """Store a new document stamped with the upload time; returns the stored row"""
+        response = self.client.table('documents').insert(dict(fields, upload_date='now()')).execute()
+        return response.data[0] if response.data else {}
+
+    def update_document(self, document_id, fields, touch=False):
+        """Update a document; `touch` re-stamps its upload time so other workers re-sync it"""
+        if touch:
+            fields = dict(fields, upload_date='now()')
+        response = self.client.table('documents').update(fields).eq('id', document_id).execute()
+        return response.data[0] if response.data else {}
+
+    def list_documents(self, columns, limit, after=None, filename=None, uploaded_after=None, uploaded_before=None, count=False):
+        """Up to `limit` rows newest first, starting past the (upload_date, id) key `after`; returns (rows, total or None)"""
+        def filtered(query):
+            if filename:
+                query = query.ilike('filename', f"%{filename}%")
+            if uploaded_after:
+                query = query.gte('upload_date', uploaded_after)
+            if uploaded_before:
+                query = query.lt('upload_date', uploaded_before)
+            return query
+
+        # Without a cursor the total comes back with the page itself
+        query = filtered(self.client.table('documents').select(columns, count='exact' if count and not after else None))
+        if after:
+            upload_date, document_id = parse_list_cursor(after)
+            query = query.or_(f'upload_date.lt."{upload_date}",and(upload_date.eq."{upload_date}",id.lt.{document_id})')
+        response = query.order('upload_date', desc=True).order('id', desc=True).limit(limit).execute()
+
+        total = response.count
+        if count and after:
+            total = filtered(self.client.table('documents').select('id', count='exact')).limit(1).execute().count
+        return response.data, total
+
+    def fetch_chunks(self, document_ids):
+        """Stored passages for the given documents, grouped by document ID"""
+        response = self.client.table('document_chunks').select(
+            ', '.join(CHUNK_COLUMNS)
+        ).in_('document_id', document_ids).order('chunk_index').execute()
+
+        chunks_by_doc = {}
+        for row in response.data:
+            chunks_by_doc.setdefault(row['document_id'], []).append(row)
+        return chunks_by_doc
+
+    def store_chunks(self, document_id, chunks):
+        rows = chunk_rows(document_id, chunks)
+        # Upsert so a revised document overwrites the passages that changed in place
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            self.client.table('document_chunks').upsert(rows[start:start + WRITE_BATCH_SIZE], on_conflict='chunk_id').execute()
+
+    def delete_chunks_from(self, document_id, chunk_index):
+        """Drop a document's passages from `chunk_index` on"""
+        self.client.table('document_chunks').delete().eq('document_id', document_id).gte('chunk_index', chunk_index).execute()
+
+    def replace_version(self, document_id, fields, changed_chunks, chunk_count, pages):
+        """Switch a document to a new version whose passages and pages are all known.
+
+        PostgREST has no multi-statement transactions, so the metadata is
+        written last: other workers only re-sync the document once its new
+        passages are in place.
+        """
+        self.store_chunks(document_id, changed_chunks)
+        self.delete_chunks_from(document_id, chunk_count)
+        self.replace_pages(document_id, pages)
+        return self.update_document(document_id, fields, touch=True)
+
+    def fetch_pages(self, document_id):
+        return self.client.table('document_pages').select(', '.join(PAGE_COLUMNS)).eq('document_id', document_id).execute().data
+
+    def replace_pages(self, document_id, pages):
+        self.client.table('document_pages').delete().eq('document_id', document_id).execute()
+        rows = [dict(page, document_id=document_id) for page in pages]
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            self.client.table('document_pages').insert(rows[start:start + WRITE_BATCH_SIZE]).execute()
+
+
+class SQLiteDocumentStore:
+    """The same tables in a local SQLite database (WAL mode), for single-node and offline deployments"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                content TEXT,
+                upload_date TEXT NOT NULL,
+                file_size INTEGER,
+                content_length INTEGER,
+                content_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_upload_date ON documents(upload_date, id);
+            CREATE INDEX IF NOT EXISTS documents_filename ON documents(filename);
+            CREATE INDEX IF NOT EXISTS documents_content_hash ON documents(content_hash);
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id INTEGER NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                start_offset INTEGER,
+                end_offset INTEGER,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS document_chunks_document ON document_chunks(document_id, chunk_index);
+            CREATE TABLE IF NOT EXISTS document_pages (
+                document_id INTEGER NOT NULL,
+                page_number INTEGER NOT NULL,
+                page_hash TEXT,
+                text_hash TEXT,
+                start_offset INTEGER,
+                end_offset INTEGER,
+                PRIMARY KEY (document_id, page_number)
+            );
+        ''')
+
+    def _db(self):
+        # sqlite3 connections must not be shared across threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat()
+
+    def documents_since(self, since, start, count):
+        rows = self._db().execute(
+            'SELECT id, filename, upload_date FROM documents WHERE upload_date >= ? ORDER BY upload_date, id LIMIT ? OFFSET ?',
+            (since or '', count, start)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_content(self, document_id):
+        row = self._db().execute('SELECT content FROM documents WHERE id = ?', (document_id,)).fetchone()
+        return row['content'] or '' if row is not None else ''
+
+    def find_by_hash(self, content_hash):
+        row = self._db().execute(
+            'SELECT id, filename, content_length FROM documents WHERE content_hash = ? LIMIT 1', (content_hash,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_previous_versions(self, filename, document_id=None, limit=3):
+        if document_id:
+            rows = self._db().execute(
+                'SELECT id, filename, content_hash, content_length FROM documents WHERE id = ?', (document_id,)
+            ).fetchall()
+        else:
+            rows = self._db().execute(
+                'SELECT id, filename, content_hash, content_length FROM documents WHERE filename = ? '
+                'ORDER BY upload_date DESC, id DESC LIMIT ?', (filename, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def insert_document(self, fields):
+        fields = dict(fields, upload_date=self._now())
+        columns = [column for column in DOCUMENT_COLUMNS if column in fields]
+        cursor = self._db().execute(
+            f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            [fields[column] for column in columns]
+        )
+        return dict(fields, id=cursor.lastrowid)
+
+    def update_document(self, document_id, fields, touch=False):
+        if touch:
+            fields = dict(fields, upload_date=self._now())
+        columns = [column for column in DOCUMENT_COLUMNS if column in fields and column != 'id']
+        self._db().execute(
+            f"UPDATE documents SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+            [fields[column] for column in columns] + [document_id]
+        )
+        row = self._db().execute('SELECT * FROM documents WHERE id = ?', (document_id,)).fetchone()
+        return dict(row) if row is not None else {}
+
+    def list_documents(self, columns, limit, after=None, filename=None, uploaded_after=None, uploaded_before=None, count=False):
+        conditions = []
+        params = []
+        if filename:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            params.append('%' + filename.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if uploaded_after:
+            conditions.append('upload_date >= ?')
+            params.append(uploaded_after)
+        if uploaded_before:
+            conditions.append('upload_date < ?')
+            params.append(uploaded_before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        total = None
+        if count:
+            total = self._db().execute(f'SELECT COUNT(*) FROM documents {where}', params).fetchone()[0]
+
+        if after:
+            upload_date, document_id = parse_list_cursor(after)
+            conditions.append('(upload_date < ? OR (upload_date = ? AND id < ?))')
+            params += [upload_date, upload_date, document_id]
+            where = f"WHERE {' AND '.join(conditions)}"
+        rows = self._db().execute(
+            f'SELECT {columns} FROM documents {where} ORDER BY upload_date DESC, id DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def fetch_chunks(self, document_ids):
+        chunks_by_doc = {}
+        for start in range(0, len(document_ids), WRITE_BATCH_SIZE):
+            batch = list(document_ids[start:start + WRITE_BATCH_SIZE])
+            rows = self._db().execute(
+                f"SELECT {', '.join(CHUNK_COLUMNS)} FROM document_chunks "
+                f"WHERE document_id IN ({', '.join('?' for _ in batch)}) ORDER BY document_id, chunk_index",
+                batch
+            ).fetchall()
+            for row in rows:
+                chunks_by_doc.setdefault(row['document_id'], []).append(dict(row))
+        return chunks_by_doc
+
+    @staticmethod
+    def _write_chunks(db, document_id, chunks):
+        db.executemany(
+            'INSERT OR REPLACE INTO document_chunks (chunk_id, document_id, chunk_index, start_offset, end_offset, content) '
+            'VALUES (:chunk_id, :document_id, :chunk_index, :start_offset, :end_offset, :content)',
+            chunk_rows(document_id, chunks)
+        )
+
+    @staticmethod
+    def _write_pages(db, document_id, pages):
+        db.execute('DELETE FROM document_pages WHERE document_id = ?', (document_id,))
+        db.executemany(
+            'INSERT INTO document_pages (document_id, page_number, page_hash, text_hash, start_offset, end_offset) '
+            'VALUES (:document_id, :page_number, :page_hash, :text_hash, :start_offset, :end_offset)',
+            [dict(page, document_id=document_id) for page in pages]
+        )
+
+    def store_chunks(self, document_id, chunks):
+        db = self._db()
+        db.execute('BEGIN')
+        try:
+            self._write_chunks(db, document_id, chunks)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def delete_chunks_from(self, document_id, chunk_index):
+        self._db().execute('DELETE FROM document_chunks WHERE document_id = ? AND chunk_index >= ?', (document_id, chunk_index))
+
+    def fetch_pages(self, document_id):
+        rows = self._db().execute(
+            f"SELECT {', '.join(PAGE_COLUMNS)} FROM document_pages WHERE document_id = ? ORDER BY page_number", (document_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def replace_pages(self, document_id, pages):
+        db = self._db()
+        db.execute('BEGIN')
+        try:
+            self._write_pages(db, document_id, pages)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def replace_version(self, document_id, fields, changed_chunks, chunk_count, pages):
+        """Switch a document to a new version in one transaction; readers see the old or the new one, never a mix"""
+        db = self._db()
+        db.execute('BEGIN')
+        try:
+            self._write_chunks(db, document_id, changed_chunks)
+            db.execute('DELETE FROM document_chunks WHERE document_id = ? AND chunk_index >= ?', (document_id, chunk_count))
+            self._write_pages(db, document_id, pages)
+            stored = self.update_document(document_id, fields, touch=True)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return stored
+
+
+def create_document_store(kind, supabase_client=None, path=None):
+    """Build the document store named by `kind` ('supabase' or 'sqlite'), or None if it is unavailable"""
+    if kind == 'sqlite':
+        try:
+            return SQLiteDocumentStore(path)
+        except Exception as e:
+            print(f"Warning: local document store unavailable: {e}")
+            return None
+    if kind != 'supabase':
+        print(f"Warning: unknown document store '{kind}', using supabase")
+    return SupabaseDocumentStore(supabase_client) if supabase_client is not None else None
@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from document_index import tokenize
+
+EMBEDDING_DIM = 384
+EMBEDDING_FORMAT_VERSION = 2
+
+# Phrases that mean the same thing in process-safety text. Every phrase in a
+# group contributes the same concept feature, so "H2S" and "hydrogen sulfide"
+# land near each other even though they share no words.
+SYNONYM_GROUPS = [
+    ["runaway", "runaway reaction", "thermal runaway", "thermal excursion", "uncontrolled exotherm"],
+    ["h2s", "hydrogen sulfide", "hydrogen sulphide", "sour gas"],
+    ["h2so4", "sulfuric acid", "sulphuric acid", "oil of vitriol"],
+    ["hcl", "hydrochloric acid", "hydrogen chloride", "muriatic acid"],
+    ["naoh", "sodium hydroxide", "caustic soda", "caustic"],
+    ["nh3", "ammonia", "anhydrous ammonia"],
+    ["cl2", "chlorine"],
+    ["co", "carbon monoxide"],
+    ["overpressure", "overpressurization", "over-pressure", "pressure excursion"],
+    ["relief valve", "psv", "prv", "pressure safety valve", "safety relief valve", "rupture disc", "rupture disk"],
+    ["loss of containment", "loc", "leak", "release", "spill"],
+    ["loss of cooling", "cooling failure", "cooling water failure", "loss of cooling water"],
+    ["flammable", "combustible", "ignitable"],
+    ["explosion", "deflagration", "detonation", "bleve", "vce"],
+    ["toxic", "toxicity", "poisonous"],
+    ["corrosion", "corrosive", "corrodes"],
+    ["lel", "lfl", "lower explosive limit", "lower flammable limit"],
+    ["uel", "ufl", "upper explosive limit", "upper flammable limit"],
+    ["ait", "autoignition", "auto-ignition", "autoignition temperature"],
+    ["hazop", "hazard and operability"],
+]
+
+_CONCEPTS = {}
+for _group in SYNONYM_GROUPS:
+    for _phrase in _group:
+        _CONCEPTS[_phrase] = _group[0]
+_CONCEPT_PATTERN = re.compile(
+    r"(?<![a-z0-9])(" + "|".join(re.escape(p) for p in sorted(_CONCEPTS, key=len, reverse=True)) + r")(?![a-z0-9])"
+)
+
+
+def _feature_slot(feature, dim):
+    """Hash a feature to (slot, sign) with a stable, process-independent hash"""
+    h = zlib.crc32(feature.encode('utf-8'))
+    return h % dim, 1.0 if (h >> 31) & 1 else -1.0
+
+
+class HashingEmbedder:
+    """Offline text embedder built on the hashing trick.
+
+    Features are words, word bigrams, character trigrams of longer words, and
+    synonym-group concepts; counts are log-scaled and the vector L2-normalized
+    so dot products are cosine similarities. No model files, no GPU.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        lowered = (text or '').lower()
+        tokens = tokenize(lowered)
+        features = list(tokens)
+        features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        for token in tokens:
+            if len(token) > 4:
+                padded = f"#{token}#"
+                features.extend(f"#3{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        # Concepts are weighted up so a synonym hit outweighs incidental overlap
+        for match in _CONCEPT_PATTERN.finditer(lowered):
+            features.extend([f"concept:{_CONCEPTS[match.group(1)]}"] * 3)
+        return features
+
+    def embed(self, texts):
+        """Embed a list of texts into an (n, dim) float32 array of unit vectors"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self._features(text):
+                slot, sign = _feature_slot(feature, self.dim)
+                counts[slot] = counts.get(slot, 0.0) + sign
+            if counts:
+                slots = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+                values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+                vectors[row, slots] = np.sign(values) * np.log1p(np.abs(values))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model pinned to the CPU"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts):
+        """Embed a list of texts into an (n, dim) float32 array of unit vectors"""
+        vectors = self.model.encode(list(texts), batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+def create_embedder(model_name=None):
+    """Return a local model embedder if one is configured and installed, else the hashing embedder"""
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            print(f"Warning: could not load embedding model {model_name}, using hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+def fuse_rankings(rankings, k=60):
+    """Reciprocal rank fusion of several [(id, score), ...] rankings"""
+    fused = {}
+    for ranking in rankings:
+        for rank, (item_id, _) in enumerate(ranking):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class EmbeddingIndex:
+    """Passage vectors in a NumPy array backed by a memory-mapped .npy file.
+
+    Snapshots are opened copy-on-write, so worker processes share the page
+    cache for the vectors and only copy pages they modify. Queries are a
+    single matrix product plus argpartition, batched across queries.
+    """
+
+    def __init__(self, dim, model_name):
+        self.dim = dim
+        self.model_name = model_name
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0              # rows in use, including freed rows
+        self.chunk_ids = []        # row -> chunk_id, None for freed rows
+        self.rows = {}             # chunk_id -> row
+        self.free_rows = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.rows
+
+    def _reserve(self, count):
+        needed = self.size + count
+        if needed <= self.vectors.shape[0]:
+            return
+        capacity = max(needed, self.vectors.shape[0] * 2, 1024)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self.size] = self.vectors[:self.size]
+        self.vectors = grown
+
+    def add(self, chunk_ids, vectors):
+        """Store vectors for the given chunk IDs, overwriting existing ones"""
+        with self._lock:
+            new_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in self.rows]
+            self._reserve(max(0, len(new_ids) - len(self.free_rows)))
+
+            for chunk_id, vector in zip(chunk_ids, vectors):
+                row = self.rows.get(chunk_id)
+                if row is None:
+                    if self.free_rows:
+                        row = self.free_rows.pop()
+                        self.chunk_ids[row] = chunk_id
+                    else:
+                        row = self.size
+                        self.size += 1
+                        self.chunk_ids.append(chunk_id)
+                    self.rows[chunk_id] = row
+                self.vectors[row] = vector
+
+    def get_vectors(self, chunk_ids):
+        """Copies of the stored vectors for whichever of the chunk IDs are present"""
+        with self._lock:
+            return {chunk_id: np.array(self.vectors[self.rows[chunk_id]]) for chunk_id in chunk_ids if chunk_id in self.rows}
+
+    def remove(self, chunk_ids):
+        """Free the rows of the given chunk IDs"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                row = self.rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                self.vectors[row] = 0.0
+                self.chunk_ids[row] = None
+                self.free_rows.append(row)
+
+    def search_batch(self, query_vectors, limit=5, candidates=None):
+        """Return one [(chunk_id, cosine), ...] list per query vector.
+
+        If `candidates` is given, only those chunk IDs are scored.
+        """
+        with self._lock:
+            if candidates is not None:
+                chunk_ids = [chunk_id for chunk_id in candidates if chunk_id in self.rows]
+                matrix = self.vectors[[self.rows[chunk_id] for chunk_id in chunk_ids]]
+            else:
+                chunk_ids = list(self.chunk_ids)
+                matrix = self.vectors[:self.size]
+            if not self.rows or not chunk_ids:
+                return [[] for _ in range(len(query_vectors))]
+            scores = np.asarray(query_vectors, dtype=np.float32) @ matrix.T
+
+        k = min(limit, scores.shape[1])
+        results = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append([
+                (chunk_ids[i], float(row_scores[i]))
+                for i in top
+                if chunk_ids[i] is not None and row_scores[i] > 0
+            ])
+        return results
+
+    def search(self, query_vector, limit=5, candidates=None):
+        """Return [(chunk_id, cosine), ...] for a single query vector"""
+        return self.search_batch(query_vector.reshape(1, -1), limit, candidates)[0]
+
+    # 💾 Snapshot persistence: <path>.npy holds vectors, <path>.ids.json the row map
+    def save(self, path):
+        """Atomically write the vectors and row map, then re-map the vector file"""
+        with self._lock:
+            pid = os.getpid()
+            vectors_tmp = f"{path}.{pid}.tmp.npy"
+            ids_tmp = f"{path}.ids.{pid}.tmp"
+            np.save(vectors_tmp, self.vectors[:self.size], allow_pickle=False)
+            with open(ids_tmp, 'w', encoding='utf-8') as handle:
+                json.dump({
+                    'version': EMBEDDING_FORMAT_VERSION,
+                    'model_name': self.model_name,
+                    'dim': self.dim,
+                    'chunk_ids': self.chunk_ids,
+                    'free_rows': self.free_rows
+                }, handle, separators=(',', ':'))
+            os.replace(vectors_tmp, f"{path}.npy")
+            os.replace(ids_tmp, f"{path}.ids.json")
+            self.vectors = np.load(f"{path}.npy", mmap_mode='c', allow_pickle=False)
+
+    @classmethod
+    def load(cls, path, dim, model_name):
+        """Memory-map a snapshot written by `save`, or return an empty index"""
+        index = cls(dim, model_name)
+        if not path or not os.path.exists(f"{path}.npy") or not os.path.exists(f"{path}.ids.json"):
+            return index
+
+        try:
+            with open(f"{path}.ids.json", 'r', encoding='utf-8') as handle:
+                state = json.load(handle)
+            # Vectors from a different embedder are not comparable; start over
+            if (state.get('version') != EMBEDDING_FORMAT_VERSION
+                    or state.get('model_name') != model_name or state.get('dim') != dim):
+                return index
+            vectors = np.load(f"{path}.npy", mmap_mode='c', allow_pickle=False)
+            if vectors.dtype != np.float32 or vectors.shape != (len(state['chunk_ids']), dim):
+                return index
+            index.vectors = vectors
+            index.size = vectors.shape[0]
+            index.chunk_ids = state['chunk_ids']
+            index.free_rows = state['free_rows']
+            index.rows = {chunk_id: row for row, chunk_id in enumerate(index.chunk_ids) if chunk_id is not None}
+        except Exception as e:
+            print(f"Warning: could not load embedding index from {path}: {e}")
+            return cls(dim, model_name)
+
+        return index
@@ -0,0 +1,371 @@
+"""Deterministic hazard pre-screening.
+
+Checks process conditions against a compact chemical property table and a
+reactive-group incompatibility matrix. Runs in microseconds, so its flags can
+be returned immediately and handed to the model as established facts.
+Temperatures are in K and pressures in atm, as in the API.
+"""
+
+import re
+
+import numpy as np
+
+HAZARD_RULES_VERSION = "rules-v2"
+
+SEVERITY_ORDER = ('critical', 'high', 'medium', 'low')
+
+# Margin below the autoignition temperature treated as "approaching" it
+AIT_MARGIN_K = 50.0
+# Typical MAWP of general-purpose carbon steel vessels (~150 psig)
+TYPICAL_MAWP_ATM = 11.0
+HIGH_PRESSURE_ATM = 100.0
+# Typical minimum design metal temperature of carbon steel (-29 °C)
+CARBON_STEEL_MDMT_K = 244.0
+HIGH_TEMPERATURE_K = 673.0
+
+# flash point / autoignition / normal boiling point in K, LEL/UEL in vol %, NFPA 704 (health, flammability, instability)
+CHEMICAL_PROPERTIES = {
+    'methane':             {'flash_point': None,  'autoignition': 810.0, 'boiling_point': 111.6, 'lel': 5.0,  'uel': 15.0,  'nfpa': (2, 4, 0), 'groups': ('fuel',)},
+    'ethane':              {'flash_point': None,  'autoignition': 745.0, 'boiling_point': 184.5, 'lel': 3.0,  'uel': 12.4,  'nfpa': (1, 4, 0), 'groups': ('fuel',)},
+    'propane':             {'flash_point': None,  'autoignition': 723.0, 'boiling_point': 231.0, 'lel': 2.1,  'uel': 9.5,   'nfpa': (2, 4, 0), 'groups': ('fuel',)},
+    'butane':              {'flash_point': None,  'autoignition': 678.0, 'boiling_point': 272.6, 'lel': 1.8,  'uel': 8.4,   'nfpa': (1, 4, 0), 'groups': ('fuel',)},
+    'hexane':              {'flash_point': 251.0, 'autoignition': 498.0, 'boiling_point': 342.0, 'lel': 1.1,  'uel': 7.5,   'nfpa': (2, 3, 0), 'groups': ('fuel',)},
+    'heptane':             {'flash_point': 269.0, 'autoignition': 477.0, 'boiling_point': 371.6, 'lel': 1.05, 'uel': 6.7,   'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'octane':              {'flash_point': 286.0, 'autoignition': 479.0, 'boiling_point': 398.8, 'lel': 1.0,  'uel': 6.5,   'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'cyclohexane':         {'flash_point': 253.0, 'autoignition': 518.0, 'boiling_point': 353.9, 'lel': 1.3,  'uel': 8.0,   'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'benzene':             {'flash_point': 262.0, 'autoignition': 771.0, 'boiling_point': 353.2, 'lel': 1.2,  'uel': 7.8,   'nfpa': (2, 3, 0), 'groups': ('fuel',)},
+    'toluene':             {'flash_point': 277.0, 'autoignition': 753.0, 'boiling_point': 383.8, 'lel': 1.1,  'uel': 7.1,   'nfpa': (2, 3, 0), 'groups': ('fuel',)},
+    'xylene':              {'flash_point': 300.0, 'autoignition': 736.0, 'boiling_point': 411.7, 'lel': 0.9,  'uel': 7.0,   'nfpa': (2, 3, 0), 'groups': ('fuel',)},
+    'styrene':             {'flash_point': 304.0, 'autoignition': 763.0, 'boiling_point': 418.0, 'lel': 0.9,  'uel': 6.8,   'nfpa': (2, 3, 2), 'groups': ('fuel', 'polymerizable')},
+    'gasoline':            {'flash_point': 230.0, 'autoignition': 553.0, 'boiling_point': None,  'lel': 1.4,  'uel': 7.6,   'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'diesel':              {'flash_point': 325.0, 'autoignition': 483.0, 'boiling_point': None,  'lel': 0.6,  'uel': 7.5,   'nfpa': (1, 2, 0), 'groups': ('fuel',)},
+    'methanol':            {'flash_point': 284.0, 'autoignition': 737.0, 'boiling_point': 337.9, 'lel': 6.0,  'uel': 36.0,  'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'ethanol':             {'flash_point': 286.0, 'autoignition': 636.0, 'boiling_point': 351.5, 'lel': 3.3,  'uel': 19.0,  'nfpa': (2, 3, 0), 'groups': ('fuel',)},
+    'isopropanol':         {'flash_point': 285.0, 'autoignition': 672.0, 'boiling_point': 355.8, 'lel': 2.0,  'uel': 12.7,  'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'acetone':             {'flash_point': 253.0, 'autoignition': 738.0, 'boiling_point': 329.2, 'lel': 2.5,  'uel': 12.8,  'nfpa': (1, 3, 0), 'groups': ('fuel',)},
+    'diethyl ether':       {'flash_point': 228.0, 'autoignition': 433.0, 'boiling_point': 307.8, 'lel': 1.9,  'uel': 36.0,  'nfpa': (2, 4, 1), 'groups': ('fuel', 'peroxide_former')},
+    'acetic acid':         {'flash_point': 312.0, 'autoignition': 700.0, 'boiling_point': 391.0, 'lel': 4.0,  'uel': 19.9,  'nfpa': (3, 2, 0), 'groups': ('fuel', 'acid_organic')},
+    'ethylene':            {'flash_point': None,  'autoignition': 763.0, 'boiling_point': 169.5, 'lel': 2.7,  'uel': 36.0,  'nfpa': (2, 4, 2), 'groups': ('fuel', 'polymerizable')},
+    'propylene':           {'flash_point': None,  'autoignition': 728.0, 'boiling_point': 225.5, 'lel': 2.0,  'uel': 11.1,  'nfpa': (1, 4, 1), 'groups': ('fuel', 'polymerizable')},
+    'acetylene':           {'flash_point': None,  'autoignition': 578.0, 'boiling_point': 189.0, 'lel': 2.5,  'uel': 100.0, 'nfpa': (0, 4, 3), 'groups': ('fuel', 'unstable')},
+    'ethylene oxide':      {'flash_point': 253.0, 'autoignition': 702.0, 'boiling_point': 283.9, 'lel': 3.0,  'uel': 100.0, 'nfpa': (3, 4, 3), 'groups': ('fuel', 'polymerizable')},
+    'vinyl chloride':      {'flash_point': 195.0, 'autoignition': 745.0, 'boiling_point': 259.8, 'lel': 3.6,  'uel': 33.0,  'nfpa': (2, 4, 2), 'groups': ('fuel', 'polymerizable')},
+    'hydrogen':            {'flash_point': None,  'autoignition': 773.0, 'boiling_point': 20.3,  'lel': 4.0,  'uel': 75.0,  'nfpa': (0, 4, 0), 'groups': ('fuel',)},
+    'carbon monoxide':     {'flash_point': None,  'autoignition': 882.0, 'boiling_point': 81.6,  'lel': 12.5, 'uel': 74.0,  'nfpa': (3, 4, 0), 'groups': ('fuel',)},
+    'hydrogen sulfide':    {'flash_point': None,  'autoignition': 533.0, 'boiling_point': 213.0, 'lel': 4.0,  'uel': 44.0,  'nfpa': (4, 4, 0), 'groups': ('fuel',)},
+    'hydrogen cyanide':    {'flash_point': 255.0, 'autoignition': 811.0, 'boiling_point': 299.0, 'lel': 5.6,  'uel': 40.0,  'nfpa': (4, 4, 2), 'groups': ('fuel', 'cyanide')},
+    'ammonia':             {'flash_point': None,  'autoignition': 924.0, 'boiling_point': 239.8, 'lel': 15.0, 'uel': 28.0,  'nfpa': (3, 1, 0), 'groups': ('ammonia', 'base')},
+    'chlorine':            {'flash_point': None,  'autoignition': None,  'boiling_point': 239.1, 'lel': None, 'uel': None,  'nfpa': (4, 0, 0), 'groups': ('oxidizer', 'halogen')},
+    'oxygen':              {'flash_point': None,  'autoignition': None,  'boiling_point': 90.2,  'lel': None, 'uel': None,  'nfpa': (0, 0, 0), 'groups': ('oxidizer',)},
+    'nitrogen':            {'flash_point': None,  'autoignition': None,  'boiling_point': 77.4,  'lel': None, 'uel': None,  'nfpa': (0, 0, 0), 'groups': ('asphyxiant',)},
+    'carbon dioxide':      {'flash_point': None,  'autoignition': None,  'boiling_point': 194.7, 'lel': None, 'uel': None,  'nfpa': (2, 0, 0), 'groups': ('asphyxiant',)},
+    'phosgene':            {'flash_point': None,  'autoignition': None,  'boiling_point': 281.5, 'lel': None, 'uel': None,  'nfpa': (4, 0, 1), 'groups': ('water_reactive',)},
+    'sulfuric acid':       {'flash_point': None,  'autoignition': None,  'boiling_point': 610.0, 'lel': None, 'uel': None,  'nfpa': (3, 0, 2), 'groups': ('acid_mineral', 'acid_oxidizing', 'water_reactive')},
+    'nitric acid':         {'flash_point': None,  'autoignition': None,  'boiling_point': 356.0, 'lel': None, 'uel': None,  'nfpa': (4, 0, 0), 'groups': ('acid_mineral', 'acid_oxidizing', 'oxidizer')},
+    'hydrochloric acid':   {'flash_point': None,  'autoignition': None,  'boiling_point': None,  'lel': None, 'uel': None,  'nfpa': (3, 0, 1), 'groups': ('acid_mineral',)},
+    'sodium hydroxide':    {'flash_point': None,  'autoignition': None,  'boiling_point': None,  'lel': None, 'uel': None,  'nfpa': (3, 0, 1), 'groups': ('base',)},
+    'hydrogen peroxide':   {'flash_point': None,  'autoignition': None,  'boiling_point': 423.0, 'lel': None, 'uel': None,  'nfpa': (3, 0, 1), 'groups': ('oxidizer', 'unstable')},
+    'sodium hypochlorite': {'flash_point': None,  'autoignition': None,  'boiling_point': None,  'lel': None, 'uel': None,  'nfpa': (3, 0, 1), 'groups': ('oxidizer', 'hypochlorite')},
+    'sodium cyanide':      {'flash_point': None,  'autoignition': None,  'boiling_point': None,  'lel': None, 'uel': None,  'nfpa': (3, 0, 0), 'groups': ('cyanide',)},
+    'sodium':              {'flash_point': None,  'autoignition': 388.0, 'boiling_point': 1156.0, 'lel': None, 'uel': None, 'nfpa': (3, 3, 2), 'groups': ('water_reactive', 'alkali_metal')},
+    'water':               {'flash_point': None,  'autoignition': None,  'boiling_point': 373.2, 'lel': None, 'uel': None,  'nfpa': (0, 0, 0), 'groups': ('water',)},
+}
+
+CHEMICAL_ALIASES = {
+    'ch4': 'methane', 'natural gas': 'methane', 'c2h6': 'ethane', 'c3h8': 'propane', 'lpg': 'propane',
+    'n-butane': 'butane', 'c4h10': 'butane', 'n-hexane': 'hexane', 'n-heptane': 'heptane', 'n-octane': 'octane',
+    'c6h6': 'benzene', 'methylbenzene': 'toluene', 'xylenes': 'xylene', 'petrol': 'gasoline', 'diesel fuel': 'diesel',
+    'meoh': 'methanol', 'methyl alcohol': 'methanol', 'etoh': 'ethanol', 'ethyl alcohol': 'ethanol',
+    'ipa': 'isopropanol', 'isopropyl alcohol': 'isopropanol', '2-propanol': 'isopropanol',
+    'ether': 'diethyl ether', 'ethyl ether': 'diethyl ether', 'ethene': 'ethylene', 'propene': 'propylene',
+    'ethyne': 'acetylene', 'eo': 'ethylene oxide', 'vcm': 'vinyl chloride', 'vinyl chloride monomer': 'vinyl chloride',
+    'h2': 'hydrogen', 'co': 'carbon monoxide', 'h2s': 'hydrogen sulfide', 'hcn': 'hydrogen cyanide',
+    'nh3': 'ammonia', 'anhydrous ammonia': 'ammonia', 'cl2': 'chlorine', 'o2': 'oxygen', 'n2': 'nitrogen',
+    'co2': 'carbon dioxide', 'cocl2': 'phosgene', 'h2so4': 'sulfuric acid', 'oleum': 'sulfuric acid',
+    'hno3': 'nitric acid', 'hcl': 'hydrochloric acid', 'muriatic acid': 'hydrochloric acid',
+    'naoh': 'sodium hydroxide', 'caustic soda': 'sodium hydroxide', 'caustic': 'sodium hydroxide',
+    'h2o2': 'hydrogen peroxide', 'bleach': 'sodium hypochlorite', 'naocl': 'sodium hypochlorite',
+    'nacn': 'sodium cyanide', 'na': 'sodium', 'h2o': 'water', 'steam': 'water', 'cooling water': 'water',
+    'sulphuric acid': 'sulfuric acid', 'hydrogen sulphide': 'hydrogen sulfide', 'hydrochloric': 'hydrochloric acid',
+    'hydrogen chloride': 'hydrochloric acid', 'lye': 'sodium hydroxide', 'peroxide': 'hydrogen peroxide',
+}
+
+CHEMICAL_CAS = {
+    'methane': '74-82-8', 'ethane': '74-84-0', 'propane': '74-98-6', 'butane': '106-97-8', 'hexane': '110-54-3',
+    'heptane': '142-82-5', 'octane': '111-65-9', 'cyclohexane': '110-82-7', 'benzene': '71-43-2', 'toluene': '108-88-3',
+    'xylene': '1330-20-7', 'styrene': '100-42-5', 'gasoline': '86290-81-5', 'diesel': '68334-30-5',
+    'methanol': '67-56-1', 'ethanol': '64-17-5', 'isopropanol': '67-63-0', 'acetone': '67-64-1',
+    'diethyl ether': '60-29-7', 'acetic acid': '64-19-7', 'ethylene': '74-85-1', 'propylene': '115-07-1',
+    'acetylene': '74-86-2', 'ethylene oxide': '75-21-8', 'vinyl chloride': '75-01-4', 'hydrogen': '1333-74-0',
+    'carbon monoxide': '630-08-0', 'hydrogen sulfide': '7783-06-4', 'hydrogen cyanide': '74-90-8',
+    'ammonia': '7664-41-7', 'chlorine': '7782-50-5', 'oxygen': '7782-44-7', 'nitrogen': '7727-37-9',
+    'carbon dioxide': '124-38-9', 'phosgene': '75-44-5', 'sulfuric acid': '7664-93-9', 'nitric acid': '7697-37-2',
+    'hydrochloric acid': '7647-01-0', 'sodium hydroxide': '1310-73-2', 'hydrogen peroxide': '7722-84-1',
+    'sodium hypochlorite': '7681-52-9', 'sodium cyanide': '143-33-9', 'sodium': '7440-23-5', 'water': '7732-18-5',
+}
+CAS_TO_CHEMICAL = {cas: name for name, cas in CHEMICAL_CAS.items()}
+
+# "98% sulfuric acid", "sulfuric acid (98 wt%)", "aqueous ammonia", "liquid chlorine", "CAS 7664-93-9"
+_CONCENTRATION = re.compile(r"\([^)]*\)|\b\d+(?:\.\d+)?\s*(?:%|wt\s*%|wt%|vol\s*%|ppm)|\b(?:aqueous|anhydrous|liquid|gaseous|concentrated|dilute|solution|cas(?:\s*no\.?)?)\b")
+_CAS_NUMBER = re.compile(r"\b\d{2,7}-\d{2}-\d\b")
+
+# Unordered reactive-group pairs -> (severity, consequence)
+INCOMPATIBLE_GROUPS = {
+    frozenset(('oxidizer', 'fuel')): ('critical', "oxidizer with a fuel: fire or explosion on mixing or release"),
+    frozenset(('acid_oxidizing', 'fuel')): ('critical', "oxidizing acid with organics: violent oxidation, possible explosion"),
+    frozenset(('acid_mineral', 'base')): ('high', "acid with base: violent neutralization with heat release and spattering"),
+    frozenset(('acid_organic', 'base')): ('medium', "acid with base: exothermic neutralization"),
+    frozenset(('acid_mineral', 'cyanide')): ('critical', "acid with cyanide: releases hydrogen cyanide gas"),
+    frozenset(('acid_mineral', 'hypochlorite')): ('critical', "acid with hypochlorite: releases chlorine gas"),
+    frozenset(('acid_organic', 'hypochlorite')): ('high', "acid with hypochlorite: releases chlorine gas"),
+    frozenset(('hypochlorite', 'ammonia')): ('critical', "hypochlorite with ammonia: forms toxic chloramines"),
+    frozenset(('halogen', 'ammonia')): ('critical', "chlorine with ammonia: forms chloramines and explosive nitrogen trichloride"),
+    frozenset(('water_reactive', 'water')): ('critical', "water-reactive material with water: violent reaction, heat and gas release"),
+    frozenset(('alkali_metal', 'acid_mineral')): ('critical', "alkali metal with acid: violent reaction releasing hydrogen"),
+    frozenset(('alkali_metal', 'acid_organic')): ('critical', "alkali metal with acid: violent reaction releasing hydrogen"),
+    frozenset(('polymerizable', 'acid_mineral')): ('high', "acid can initiate runaway polymerization"),
+    frozenset(('polymerizable', 'base')): ('high', "base can initiate runaway polymerization"),
+    frozenset(('polymerizable', 'oxidizer')): ('high', "oxidizer can initiate runaway polymerization"),
+    frozenset(('peroxide_former', 'oxidizer')): ('high', "peroxide former with oxidizer: shock-sensitive peroxides"),
+    frozenset(('unstable', 'base')): ('high', "base can catalyze decomposition of an unstable material"),
+}
+
+
+def normalize_chemical(name):
+    """Canonical table name for a chemical name, formula or CAS number, or None if it is not in the table"""
+    key = ' '.join(str(name).lower().replace('_', ' ').split())
+    key = CHEMICAL_ALIASES.get(key, key)
+    if key in CHEMICAL_PROPERTIES:
+        return key
+    cas = _CAS_NUMBER.search(key)
+    if cas:
+        return CAS_TO_CHEMICAL.get(cas.group(0))
+    # Grades and states ("98% sulfuric acid", "anhydrous ammonia") name the same material
+    stripped = ' '.join(_CONCENTRATION.sub(' ', key).split())
+    stripped = CHEMICAL_ALIASES.get(stripped, stripped)
+    return stripped if stripped in CHEMICAL_PROPERTIES else None
+
+
+def _flag(flags, rule, severity, chemicals, message, **values):
+    flags.append(dict({'rule': rule, 'severity': severity, 'chemicals': chemicals, 'message': message}, **values))
+
+
+def resolve_chemicals(chemicals):
+    """Split chemical names into ({canonical name: label as given}, [names not in the table])"""
+    known = {}
+    unknown = []
+    for chemical in chemicals:
+        canonical = normalize_chemical(chemical)
+        if canonical is None:
+            unknown.append(chemical)
+        elif canonical not in known:
+            known[canonical] = chemical
+    return known, unknown
+
+
+def static_flags(known, utilities=None):
+    """Flags that depend only on which chemicals and utilities are present"""
+    flags = []
+    for canonical, label in known.items():
+        props = CHEMICAL_PROPERTIES[canonical]
+        health, flammability, instability = props['nfpa']
+        if props['flash_point'] is None and props['lel'] is not None:
+            _flag(flags, 'flammable_gas', 'high' if flammability >= 4 else 'medium', [label],
+                  f"{label} is a flammable gas (LEL {props['lel']} vol%, UEL {props['uel']} vol%)")
+        if health >= 3:
+            _flag(flags, 'toxic', 'critical' if health == 4 else 'high', [label],
+                  f"{label} is {'extremely' if health == 4 else 'highly'} toxic (NFPA health {health})")
+        if instability >= 2:
+            _flag(flags, 'unstable', 'high' if instability >= 3 else 'medium', [label],
+                  f"{label} is reactive/unstable (NFPA instability {instability}): check for decomposition or polymerization")
+        if 'asphyxiant' in props['groups']:
+            _flag(flags, 'asphyxiant', 'medium', [label], f"{label} displaces oxygen: asphyxiation in confined spaces")
+
+    # Incompatible pairs, including water-reactive chemicals against water-based utilities
+    groups = [(label, group) for canonical, label in known.items() for group in CHEMICAL_PROPERTIES[canonical]['groups']]
+    for utility in utilities or []:
+        if 'water' in str(utility).lower() or 'steam' in str(utility).lower():
+            groups.append((f"{utility} (utility)", 'water'))
+    worst = {}   # (label, label) -> most severe (severity, consequence) for that pair
+    for i, (label_a, group_a) in enumerate(groups):
+        for label_b, group_b in groups[i + 1:]:
+            rule = INCOMPATIBLE_GROUPS.get(frozenset((group_a, group_b)))
+            if label_a == label_b or rule is None:
+                continue
+            pair = (label_a, label_b)
+            if pair not in worst or SEVERITY_ORDER.index(rule[0]) < SEVERITY_ORDER.index(worst[pair][0]):
+                worst[pair] = rule
+    for (label_a, label_b), (severity, consequence) in worst.items():
+        _flag(flags, 'incompatible_pair', severity, [label_a, label_b], f"{label_a} + {label_b}: {consequence}")
+    return flags
+
+
+def condition_rules(known, phase=None):
+    """Rules that depend on operating temperature and pressure.
+
+    Each rule's `test(temp, pressure)` uses only comparisons and `&`, so it
+    works on plain numbers and, elementwise, on NumPy grids alike.
+    `message(temp, pressure)` renders the flag text for one point.
+    """
+    rules = []
+
+    def add(rule, severity, chemicals, test, message, variable, limit):
+        rules.append({'rule': rule, 'severity': severity, 'chemicals': chemicals,
+                      'test': test, 'message': message, 'variable': variable, 'limit': limit})
+
+    for canonical, label in known.items():
+        props = CHEMICAL_PROPERTIES[canonical]
+
+        ait = props['autoignition']
+        if ait is not None:
+            add('above_autoignition', 'critical', [label],
+                lambda t, p, ait=ait: t >= ait,
+                lambda t, p, ait=ait, label=label: f"{label} is above its autoignition temperature ({t:.0f} K >= {ait:.0f} K): any release ignites without a source",
+                'temp', ait)
+            add('near_autoignition', 'high', [label],
+                lambda t, p, ait=ait: (t >= ait - AIT_MARGIN_K) & (t < ait),
+                lambda t, p, ait=ait, label=label: f"{label} is within {AIT_MARGIN_K:.0f} K of its autoignition temperature ({ait:.0f} K)",
+                'temp', ait)
+
+        flash_point = props['flash_point']
+        if flash_point is not None:
+            add('above_flash_point', 'high', [label],
+                lambda t, p, fp=flash_point: t >= fp,
+                lambda t, p, fp=flash_point, label=label, props=props: f"{label} is above its flash point ({t:.0f} K >= {fp:.0f} K): vapor can reach the flammable range "
+                f"({props['lel']}-{props['uel']} vol%)",
+                'temp', flash_point)
+
+        boiling_point = props['boiling_point']
+        if boiling_point is not None and (phase or '').lower() != 'gas':
+            # Guldberg's rule (Tc ~ 1.5 Tb): above the critical point there is no liquid left to flash
+            add('pressurized_above_boiling', 'medium', [label],
+                lambda t, p, bp=boiling_point: (t > bp) & (t < 1.5 * bp) & (p > 1.0),
+                lambda t, p, bp=boiling_point, label=label: f"{label} is held above its normal boiling point ({bp:.0f} K) under pressure: "
+                "flashing release or BLEVE on loss of containment",
+                'temp', boiling_point)
+
+    add('high_pressure', 'high', [],
+        lambda t, p: p > HIGH_PRESSURE_ATM,
+        lambda t, p: f"{p:g} atm is high-pressure service: verify design pressure, relief sizing and stored energy",
+        'pressure', HIGH_PRESSURE_ATM)
+    add('above_typical_mawp', 'medium', [],
+        lambda t, p: (p > TYPICAL_MAWP_ATM) & (p <= HIGH_PRESSURE_ATM),
+        lambda t, p: f"{p:g} atm exceeds the MAWP of typical general-purpose vessels (~{TYPICAL_MAWP_ATM:g} atm / 150 psig): confirm the rating",
+        'pressure', TYPICAL_MAWP_ATM)
+    flammable = [label for canonical, label in known.items() if CHEMICAL_PROPERTIES[canonical]['lel'] is not None]
+    add('vacuum', 'medium' if flammable else 'low', flammable,
+        lambda t, p: p < 1.0,
+        lambda t, p: f"Vacuum service ({p:g} atm): check the vacuum rating" + (" and air ingress into flammable atmosphere" if flammable else ""),
+        'pressure', 1.0)
+
+    add('low_temperature', 'medium', [],
+        lambda t, p: t < CARBON_STEEL_MDMT_K,
+        lambda t, p: f"{t:.0f} K is below the typical carbon steel minimum design metal temperature ({CARBON_STEEL_MDMT_K:.0f} K): brittle fracture risk",
+        'temp', CARBON_STEEL_MDMT_K)
+    add('high_temperature', 'medium', [],
+        lambda t, p: t > HIGH_TEMPERATURE_K,
+        lambda t, p: f"{t:.0f} K is high-temperature service: creep, hot surfaces and thermal expansion",
+        'temp', HIGH_TEMPERATURE_K)
+    return rules
+
+
+def condition_flag(rule, temp, pressure):
+    """Materialize a condition rule as a flag at one operating point"""
+    return {
+        'rule': rule['rule'],
+        'severity': rule['severity'],
+        'chemicals': rule['chemicals'],
+        'message': rule['message'](temp, pressure),
+        'value': temp if rule['variable'] == 'temp' else pressure,
+        'limit': rule['limit']
+    }
+
+
+def sort_flags(flags):
+    flags.sort(key=lambda flag: SEVERITY_ORDER.index(flag['severity']))
+    return flags
+
+
+def screen_process(temp, pressure, chemicals, phase=None, utilities=None):
+    """Evaluate the deterministic hazard rules; returns flags ordered most severe first"""
+    known, unknown = resolve_chemicals(chemicals)
+    flags = [condition_flag(rule, temp, pressure) for rule in condition_rules(known, phase) if rule['test'](temp, pressure)]
+    flags += static_flags(known, utilities)
+    return {
+        'rules_version': HAZARD_RULES_VERSION,
+        'flags': sort_flags(flags),
+        'chemicals': {label: dict(CHEMICAL_PROPERTIES[canonical], name=canonical) for canonical, label in known.items()},
+        'unknown_chemicals': unknown
+    }
+
+
+def screen_grid(temps, pressures, chemicals, phase=None, utilities=None):
+    """Evaluate the rules over every (temperature, pressure) pair and group the points into regions.
+
+    A region is the set of grid points that raise exactly the same flags,
+    so one analysis per region covers the whole grid. Regions are returned
+    most severe and then largest first; `point_regions[i][j]` is the region
+    of (temps[i], pressures[j]).
+    """
+    temps = np.asarray(temps, dtype=float)
+    pressures = np.asarray(pressures, dtype=float)
+    known, unknown = resolve_chemicals(chemicals)
+    rules = condition_rules(known, phase)
+    fixed = static_flags(known, utilities)
+
+    grid_t, grid_p = np.meshgrid(temps, pressures, indexing='ij')
+    flat_t, flat_p = grid_t.ravel(), grid_p.ravel()
+    masks = np.zeros((flat_t.size, len(rules)), dtype=bool)
+    for k, rule in enumerate(rules):
+        masks[:, k] = np.broadcast_to(rule['test'](flat_t, flat_p), flat_t.shape)
+    patterns, inverse = np.unique(masks, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    t_span = max(float(np.ptp(temps)), 1e-9)
+    p_span = max(float(np.ptp(pressures)), 1e-9)
+    regions = []
+    for code, pattern in enumerate(patterns):
+        members = np.flatnonzero(inverse == code)
+        t, p = flat_t[members], flat_p[members]
+        # Represent the region by its member closest to its centroid
+        distance = ((t - t.mean()) / t_span) ** 2 + ((p - p.mean()) / p_span) ** 2
+        chosen = members[int(np.argmin(distance))]
+        point_t, point_p = float(flat_t[chosen]), float(flat_p[chosen])
+        flags = sort_flags([condition_flag(rules[k], point_t, point_p) for k in np.flatnonzero(pattern)] + [dict(flag) for flag in fixed])
+        regions.append({
+            'code': code,
+            'point_count': int(members.size),
+            'temp_range': [float(t.min()), float(t.max())],
+            'pressure_range': [float(p.min()), float(p.max())],
+            'representative': {'temp': point_t, 'pressure': point_p},
+            'flags': flags,
+            'max_severity': flags[0]['severity'] if flags else None
+        })
+
+    rank = lambda region: (SEVERITY_ORDER.index(region['max_severity']) if region['max_severity'] else len(SEVERITY_ORDER), -region['point_count'])
+    regions.sort(key=rank)
+    renumber = np.empty(len(regions), dtype=int)
+    for position, region in enumerate(regions):
+        renumber[region.pop('code')] = position
+        region['region'] = position
+
+    return {
+        'rules_version': HAZARD_RULES_VERSION,
+        'temps': temps.tolist(),
+        'pressures': pressures.tolist(),
+        'regions': regions,
+        'point_regions': renumber[inverse].reshape(grid_t.shape).tolist(),
+        'unknown_chemicals': unknown
+    }
+
+
+def format_screening_context(screening):
+    """Prompt section listing the rule-engine findings"""
+    if not screening['flags'] and not screening['unknown_chemicals']:
+        return ""
+    lines = ["Deterministic Pre-Screening Findings (from property tables; confirm and build on these):"]
+    for flag in screening['flags']:
+        lines.append(f"- [{flag['severity'].upper()}] {flag['message']}")
+    if screening['unknown_chemicals']:
+        lines.append(f"- Not in the property table, assess from your own knowledge: {', '.join(screening['unknown_chemicals'])}")
+    return "\n".join(lines)
@@ -0,0 +1,284 @@
+import json
+import re
+
+from hazard_rules import SEVERITY_ORDER
+
+HAZARD_SCHEMA_VERSION = "hazard-schema-v1"
+LIKELIHOOD_ORDER = ('frequent', 'likely', 'possible', 'unlikely', 'rare')
+SAFEGUARD_TYPES = ('prevention', 'detection', 'mitigation', 'emergency_response')
+
+# Shown to the model and published for API clients
+HAZARD_REPORT_SCHEMA = {
+    'type': 'object',
+    'required': ['summary', 'hazards', 'safeguards'],
+    'properties': {
+        'summary': {'type': 'string'},
+        'hazards': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['id', 'title', 'description', 'severity', 'likelihood'],
+                'properties': {
+                    'id': {'type': 'string', 'pattern': '^H[0-9]+$'},
+                    'title': {'type': 'string'},
+                    'description': {'type': 'string'},
+                    'severity': {'enum': list(SEVERITY_ORDER)},
+                    'likelihood': {'enum': list(LIKELIHOOD_ORDER)},
+                    'causes': {'type': 'array', 'items': {'type': 'string'}},
+                    'consequences': {'type': 'array', 'items': {'type': 'string'}},
+                    'standards': {'type': 'array', 'items': {'type': 'string'}},
+                    'citations': {'type': 'array', 'items': {'type': 'string', 'description': 'passage ID, e.g. 12:3'}}
+                }
+            }
+        },
+        'safeguards': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['id', 'hazard_ids', 'description', 'type'],
+                'properties': {
+                    'id': {'type': 'string', 'pattern': '^S[0-9]+$'},
+                    'hazard_ids': {'type': 'array', 'items': {'type': 'string'}},
+                    'description': {'type': 'string'},
+                    'type': {'enum': list(SAFEGUARD_TYPES)},
+                    'standards': {'type': 'array', 'items': {'type': 'string'}},
+                    'citations': {'type': 'array', 'items': {'type': 'string'}}
+                }
+            }
+        }
+    }
+}
+
+# Short keys for the stored form; reports are cached and kept on chat sessions
+_PACKED_KEYS = {
+    'summary': 'm', 'hazards': 'h', 'safeguards': 'g', 'id': 'i', 'title': 't', 'description': 'd',
+    'severity': 's', 'likelihood': 'l', 'causes': 'c', 'consequences': 'q', 'standards': 'r',
+    'citations': 'x', 'hazard_ids': 'k', 'type': 'y', 'schema_version': 'v'
+}
+_UNPACKED_KEYS = {short: key for key, short in _PACKED_KEYS.items()}
+
+_REFERENCE_PATTERN = re.compile(r'\b([HS][0-9]+)\b', re.IGNORECASE)
+
+
+class HazardReportError(ValueError):
+    """A structured report that does not match the schema"""
+
+
+def _text(value, field, required=True):
+    if value is None and not required:
+        return ''
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise HazardReportError(f"{field} must be a non-empty string")
+    return value.strip()
+
+
+def _text_list(value, field):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise HazardReportError(f"{field} must be a list of strings")
+    return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+
+
+def _choice(value, choices, field):
+    normalized = str(value or '').strip().lower().replace(' ', '_')
+    if normalized not in choices:
+        raise HazardReportError(f"{field} must be one of {', '.join(choices)}")
+    return normalized
+
+
+def _citations(value, field, known_chunk_ids):
+    """Passage IDs cited by an item; IDs that were never retrieved are dropped, not trusted"""
+    citations = []
+    for citation in _text_list(value, field):
+        if known_chunk_ids is not None and citation not in known_chunk_ids:
+            continue
+        if citation not in citations:
+            citations.append(citation)
+    return citations
+
+
+def _item_ids(items, prefix):
+    """Keep well-formed unique IDs; number the rest after the highest one used"""
+    ids = []
+    used = set()
+    for item in items:
+        item_id = str(item.get('id') or '').strip().upper()
+        ids.append(item_id if re.fullmatch(f'{prefix}[0-9]+', item_id) and item_id not in used else None)
+        if ids[-1]:
+            used.add(item_id)
+    next_number = max([int(item_id[1:]) for item_id in used] or [0]) + 1
+    for position, item_id in enumerate(ids):
+        if item_id is None:
+            ids[position] = f"{prefix}{next_number}"
+            next_number += 1
+    return ids
+
+
+def validate_hazard_report(data, known_chunk_ids=None):
+    """Check a structured report against the schema and return its normalized form.
+
+    Raises HazardReportError for anything a renderer could not trust.
+    Citations are limited to `known_chunk_ids` (the passages given to the
+    model) when that is passed.
+    """
+    if not isinstance(data, dict):
+        raise HazardReportError("report must be a JSON object")
+    hazards = data.get('hazards')
+    safeguards = data.get('safeguards', [])
+    if not isinstance(hazards, list) or not all(isinstance(item, dict) for item in hazards):
+        raise HazardReportError("hazards must be a list of objects")
+    if not isinstance(safeguards, list) or not all(isinstance(item, dict) for item in safeguards):
+        raise HazardReportError("safeguards must be a list of objects")
+
+    report = {
+        'schema_version': HAZARD_SCHEMA_VERSION,
+        'summary': _text(data.get('summary'), 'summary', required=False),
+        'hazards': [],
+        'safeguards': []
+    }
+    for item, item_id in zip(hazards, _item_ids(hazards, 'H')):
+        field = f"hazards[{item_id}]"
+        report['hazards'].append({
+            'id': item_id,
+            'title': _text(item.get('title'), f"{field}.title"),
+            'description': _text(item.get('description'), f"{field}.description"),
+            'severity': _choice(item.get('severity'), SEVERITY_ORDER, f"{field}.severity"),
+            'likelihood': _choice(item.get('likelihood'), LIKELIHOOD_ORDER, f"{field}.likelihood"),
+            'causes': _text_list(item.get('causes'), f"{field}.causes"),
+            'consequences': _text_list(item.get('consequences'), f"{field}.consequences"),
+            'standards': _text_list(item.get('standards'), f"{field}.standards"),
+            'citations': _citations(item.get('citations'), f"{field}.citations", known_chunk_ids)
+        })
+
+    hazard_ids = {hazard['id'] for hazard in report['hazards']}
+    for item, item_id in zip(safeguards, _item_ids(safeguards, 'S')):
+        field = f"safeguards[{item_id}]"
+        report['safeguards'].append({
+            'id': item_id,
+            'hazard_ids': [hazard_id for hazard_id in (h.upper() for h in _text_list(item.get('hazard_ids'), f"{field}.hazard_ids")) if hazard_id in hazard_ids],
+            'description': _text(item.get('description'), f"{field}.description"),
+            'type': _choice(item.get('type'), SAFEGUARD_TYPES, f"{field}.type"),
+            'standards': _text_list(item.get('standards'), f"{field}.standards"),
+            'citations': _citations(item.get('citations'), f"{field}.citations", known_chunk_ids)
+        })
+    return report
+
+
+def parse_hazard_report(text, known_chunk_ids=None):
+    """Parse and validate a model reply in structured mode"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = re.sub(r'^```[a-zA-Z]*\s*|\s*```$', '', text)
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise HazardReportError(f"report is not valid JSON: {e}")
+    return validate_hazard_report(data, known_chunk_ids)
+
+
+def pack_hazard_report(report):
+    """Compact JSON for storage: short keys, no whitespace, empty fields left out"""
+    def pack(value):
+        if isinstance(value, dict):
+            return {_PACKED_KEYS.get(key, key): pack(item) for key, item in value.items() if item not in ('', [], None)}
+        if isinstance(value, list):
+            return [pack(item) for item in value]
+        return value
+    return json.dumps(pack(report), separators=(',', ':'))
+
+
+def unpack_hazard_report(packed):
+    """Inverse of pack_hazard_report"""
+    def unpack(value):
+        if isinstance(value, dict):
+            return {_UNPACKED_KEYS.get(key, key): unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [unpack(item) for item in value]
+        return value
+    return validate_hazard_report(unpack(json.loads(packed)))
+
+
+def filter_hazard_report(report, min_severity=None, hazard_ids=None, sort_by=None):
+    """A view of a report without a model call: hazards at or above `min_severity`, or with the given IDs.
+
+    `sort_by` is 'severity', 'likelihood' or 'risk' (severity, then likelihood).
+    Safeguards are kept when they cover at least one remaining hazard.
+    """
+    hazards = report['hazards']
+    if min_severity:
+        cutoff = SEVERITY_ORDER.index(_choice(min_severity, SEVERITY_ORDER, 'min_severity'))
+        hazards = [hazard for hazard in hazards if SEVERITY_ORDER.index(hazard['severity']) <= cutoff]
+    if hazard_ids:
+        wanted = {hazard_id.upper() for hazard_id in hazard_ids}
+        hazards = [hazard for hazard in hazards if hazard['id'] in wanted]
+    if sort_by == 'severity':
+        hazards = sorted(hazards, key=lambda hazard: SEVERITY_ORDER.index(hazard['severity']))
+    elif sort_by == 'likelihood':
+        hazards = sorted(hazards, key=lambda hazard: LIKELIHOOD_ORDER.index(hazard['likelihood']))
+    elif sort_by == 'risk':
+        hazards = sorted(hazards, key=lambda hazard: (SEVERITY_ORDER.index(hazard['severity']), LIKELIHOOD_ORDER.index(hazard['likelihood'])))
+    elif sort_by:
+        raise HazardReportError("sort_by must be severity, likelihood or risk")
+
+    kept = {hazard['id'] for hazard in hazards}
+    safeguards = [safeguard for safeguard in report['safeguards']
+                  if not safeguard['hazard_ids'] or kept.intersection(safeguard['hazard_ids'])]
+    return dict(report, hazards=hazards, safeguards=safeguards)
+
+
+def format_hazard(hazard):
+    lines = [f"{hazard['id']}. {hazard['title']} (severity: {hazard['severity']}, likelihood: {hazard['likelihood']})",
+             f"   {hazard['description']}"]
+    if hazard['causes']:
+        lines.append(f"   Causes: {'; '.join(hazard['causes'])}")
+    if hazard['consequences']:
+        lines.append(f"   Consequences: {'; '.join(hazard['consequences'])}")
+    if hazard['standards']:
+        lines.append(f"   Standards: {', '.join(hazard['standards'])}")
+    if hazard['citations']:
+        lines.append(f"   Sources: passages {', '.join(hazard['citations'])}")
+    return "\n".join(lines)
+
+
+def format_safeguard(safeguard):
+    covers = f" [covers {', '.join(safeguard['hazard_ids'])}]" if safeguard['hazard_ids'] else ""
+    lines = [f"{safeguard['id']}. ({safeguard['type'].replace('_', ' ')}){covers} {safeguard['description']}"]
+    if safeguard['standards']:
+        lines.append(f"   Standards: {', '.join(safeguard['standards'])}")
+    if safeguard['citations']:
+        lines.append(f"   Sources: passages {', '.join(safeguard['citations'])}")
+    return "\n".join(lines)
+
+
+def render_hazard_report(report):
+    """Plain-text report in the Hazards/Safeguards layout of the free-text mode"""
+    sections = []
+    if report['summary']:
+        sections.append(f"Summary:\n{report['summary']}")
+    sections.append("Hazards:\n" + ("\n\n".join(format_hazard(hazard) for hazard in report['hazards']) or "None identified."))
+    sections.append("Safeguards:\n" + ("\n\n".join(format_safeguard(safeguard) for safeguard in report['safeguards']) or "None listed."))
+    return "\n\n".join(sections)
+
+
+def hazard_digest(report):
+    """One line per hazard and safeguard, so chat can refer to them by ID without the full text"""
+    lines = [f"{hazard['id']} [{hazard['severity']}/{hazard['likelihood']}] {hazard['title']}" for hazard in report['hazards']]
+    lines += [f"{safeguard['id']} ({', '.join(safeguard['hazard_ids']) or 'general'}) {safeguard['description'][:80]}"
+              for safeguard in report['safeguards']]
+    return "\n".join(lines)
+
+
+def referenced_items(report, text):
+    """Full text of the hazards and safeguards a message mentions by ID (e.g. "what about H3?")"""
+    wanted = set(match.upper() for match in _REFERENCE_PATTERN.findall(text or ''))
+    items = [format_hazard(hazard) for hazard in report['hazards'] if hazard['id'] in wanted]
+    items += [format_safeguard(safeguard) for safeguard in report['safeguards'] if safeguard['id'] in wanted]
+    return "\n\n".join(items)
+
+
+def is_hazard_report(value):
+    """True for a structured report (as opposed to a free-text one)"""
+    return isinstance(value, dict) and isinstance(value.get('hazards'), list)
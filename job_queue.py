@@ -0,0 +1,231 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+
+class JobQueue:
+    """Persistent job queue in a local SQLite database.
+
+    Jobs survive restarts and can be shared by every worker process on the
+    host. A claimed job holds a lease that its worker renews while the job
+    runs; if the worker dies, the lease expires and another worker picks the
+    job up again, until the job has used up its attempts.
+    """
+
+    def __init__(self, path, lease_seconds=600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, run_after);
+        ''')
+        db.commit()
+
+    def _db(self):
+        # sqlite3 connections must not be shared across threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def submit(self, kind, payload, max_attempts=3):
+        """Queue a job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._db().execute(
+            'INSERT INTO jobs (id, kind, payload, status, max_attempts, run_after, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(payload), 'queued', max_attempts, now, now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """Atomically take the oldest runnable job (or one with an expired lease), or return None"""
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker died on its last attempt is not run again
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'Worker lease expired'), lease_until = NULL, "
+                "updated_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = db.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                db.execute('COMMIT')
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, now, row['id'])
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+        job = self._to_dict(row)
+        job['attempts'] += 1
+        job['status'] = 'running'
+        return job
+
+    def extend_lease(self, job_id):
+        """Renew a running job's lease; returns False if the job is no longer running"""
+        now = time.time()
+        cursor = self._db().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+            (now + self.lease_seconds, job_id)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, result):
+        """Mark a job succeeded and store its result"""
+        self._db().execute(
+            "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id)
+        )
+
+    def retry(self, job_id, error, delay):
+        """Put a job back in the queue after `delay` seconds"""
+        now = time.time()
+        self._db().execute(
+            "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (error, now + delay, now, job_id)
+        )
+
+    def fail(self, job_id, error):
+        """Mark a job permanently failed"""
+        self._db().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (error, time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        """Return a job as a dict, or None"""
+        row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def prune(self, older_than_seconds):
+        """Delete finished jobs last updated more than `older_than_seconds` ago"""
+        cursor = self._db().execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            (time.time() - older_than_seconds,)
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+
+class JobWorkerPool:
+    """Background threads that run queued jobs, retrying transient failures with exponential backoff"""
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=1.0, is_transient=None,
+                 backoff_base=2.0, backoff_max=120.0):
+        self.queue = queue
+        self.handlers = handlers          # kind -> callable(payload) returning a JSON-serializable result
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.is_transient = is_transient or (lambda e: False)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads once; later calls are no-ops"""
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def backoff_delay(self, attempts):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)))
+
+    def run_one(self, job):
+        """Run a claimed job and record its outcome"""
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            self.queue.fail(job['id'], f"Unknown job kind: {job['kind']}")
+            return
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], done), name=f"job-lease-{job['id'][:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            result = handler(job['payload'])
+        except Exception as e:
+            if self.is_transient(e) and job['attempts'] < job['max_attempts']:
+                delay = self.backoff_delay(job['attempts'])
+                print(f"Job {job['id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {e}")
+                self.queue.retry(job['id'], str(e), delay)
+            else:
+                print(f"Job {job['id']} failed: {e}")
+                self.queue.fail(job['id'], str(e))
+            return
+        finally:
+            done.set()
+
+        self.queue.complete(job['id'], result)
+
+    def _heartbeat(self, job_id, done):
+        """Renew a job's lease every third of the lease period until done is set"""
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not done.wait(interval):
+            try:
+                if not self.queue.extend_lease(job_id):
+                    return
+            except Exception as e:
+                print(f"Error extending lease for job {job_id}: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run_one(job)
@@ -0,0 +1,174 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; wide enough for sub-millisecond index lookups and minute-long model calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_registry = []
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Prometheus histogram with labels; observe() is a bisect and a few additions under a lock"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter with labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram('hazard_stage_duration_seconds', 'Time spent in each processing stage', ['stage'])
+MODEL_SECONDS = Histogram('hazard_model_duration_seconds', 'Model call latency to the first token and in total', ['route', 'model', 'phase'])
+MODEL_TOKENS = Histogram('hazard_model_tokens', 'Estimated prompt and completion tokens per model call', ['route', 'model', 'kind'], TOKEN_BUCKETS)
+MODEL_ERRORS = Counter('hazard_model_errors_total', 'Failed model calls by error type', ['route', 'model', 'error'])
+CHAT_ANSWER_LOOKUPS = Counter('hazard_chat_answer_cache_lookups_total', 'Chat answer cache lookups by result', ['result'])
+HTTP_SECONDS = Histogram('hazard_http_request_duration_seconds', 'Request handling time until the response starts', ['method', 'endpoint', 'status'])
+
+
+def begin_request():
+    """Start collecting stage timings for the current request; returns a token for end_request"""
+    return _request_timings.set({})
+
+
+def end_request(token):
+    """Stop collecting and return {stage: seconds} for the request"""
+    timings = _request_timings.get()
+    try:
+        _request_timings.reset(token)
+    except ValueError:
+        # Streamed responses can finish in a different context than the one they started in
+        _request_timings.set(None)
+    return timings or {}
+
+
+def current_timings():
+    return _request_timings.get() or {}
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Record the time spent in a with-block as a stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable, stage):
+    """Yield from iterable, recording the total time spent waiting on it as one stage"""
+    iterator = iter(iterable)
+    waited = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                waited += time.perf_counter() - started
+            yield item
+    finally:
+        record_stage(stage, waited)
+
+
+def record_model_call(route, model, total_seconds, prompt_chars, completion_chars, first_token_seconds=None):
+    """Observe one finished model call; token counts are estimated at 4 characters per token"""
+    MODEL_SECONDS.observe(total_seconds, route=route, model=model, phase='total')
+    record_stage(f"model_{route}", total_seconds)
+    if first_token_seconds is not None:
+        MODEL_SECONDS.observe(first_token_seconds, route=route, model=model, phase='first_token')
+        record_stage(f"model_{route}_first_token", first_token_seconds)
+    MODEL_TOKENS.observe(prompt_chars // 4, route=route, model=model, kind='prompt')
+    MODEL_TOKENS.observe(completion_chars // 4, route=route, model=model, kind='completion')
+
+
+def server_timing_header(timings):
+    """Server-Timing header value (milliseconds) for a request's stages"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
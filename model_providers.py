@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+import openai
+
+import metrics
+
+TRANSIENT_MODEL_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain
+)
+
+
+def parse_model_spec(spec, default_provider='openai'):
+    """"provider:model" (or a bare model name for the default provider) -> (provider, model)"""
+    provider, _, model = spec.strip().rpartition(':')
+    return (provider or default_provider, model)
+
+
+def is_transient_error(e):
+    """True for model errors worth retrying: rate limits, timeouts, connection and 5xx errors"""
+    if isinstance(e, TRANSIENT_MODEL_ERRORS):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status or 500) >= 500
+
+
+class OpenAIProvider:
+    """OpenAI chat completions over pooled keep-alive HTTP connections.
+
+    The legacy SDK opens a session per thread and recycles it every few
+    minutes; this shares one connection pool across all threads instead.
+    Retries are left to the router.
+    """
+
+    name = 'openai'
+
+    def __init__(self, pool_size=32):
+        import requests
+
+        self.pool_size = pool_size
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        openai.requestssession = session
+        self._async_sessions = {}   # event loop -> aiohttp session
+
+    def _use_async_session(self):
+        """Point the SDK at this event loop's pooled aiohttp session"""
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            session = self._async_sessions[loop] = aiohttp.ClientSession(connector=connector)
+        openai.aiosession.set(session)
+
+    async def aclose(self):
+        """Close the running event loop's pooled session (call on server shutdown)"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def complete(self, model, messages, temperature, **options):
+        response = openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature, **options)
+        return response.choices[0].message["content"]
+
+    def stream(self, model, messages, temperature):
+        response = openai.ChatCompletion.create(model=model, messages=messages, temperature=temperature, stream=True)
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+    async def acomplete(self, model, messages, temperature, **options):
+        self._use_async_session()
+        response = await openai.ChatCompletion.acreate(model=model, messages=messages, temperature=temperature, **options)
+        return response.choices[0].message["content"]
+
+    async def astream(self, model, messages, temperature):
+        self._use_async_session()
+        response = await openai.ChatCompletion.acreate(model=model, messages=messages, temperature=temperature, stream=True)
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+class MockProvider:
+    """Deterministic local backend for load tests and offline development.
+
+    Replies depend only on the model name and the messages. Each call waits
+    `latency_seconds` before the first token and then emits tokens at
+    `tokens_per_second`. With `error_rate`, a seeded sequence of calls fails
+    with rate-limit errors. Models named like "slow" or "fast" scale the
+    latency, so routing can be exercised without a network.
+    """
+
+    name = 'mock'
+
+    def __init__(self, latency_seconds=0.2, tokens_per_second=80.0, output_tokens=200, error_rate=0.0, seed=0):
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _latency(self, model):
+        if 'slow' in model:
+            return self.latency_seconds * 4
+        if 'fast' in model:
+            return self.latency_seconds / 4
+        return self.latency_seconds
+
+    def _maybe_fail(self, model):
+        with self._lock:
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        if failed:
+            raise openai.error.RateLimitError(f"Mock rate limit on {model}")
+
+    def _reply(self, model, messages, options):
+        prompt = messages[-1]['content']
+        digest = hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode()).hexdigest()
+        if (options.get('response_format') or {}).get('type') == 'json_object':
+            return json.dumps(self._report(prompt, digest))
+        words = [f"Mock {model} reply {digest[:8]}."]
+        vocabulary = re.findall(r'[A-Za-z]{4,}', prompt) or ['hazard']
+        for i in range(self.output_tokens - len(words)):
+            words.append(vocabulary[int(digest[i % 64], 16) * (i + 1) % len(vocabulary)])
+        return " ".join(words)
+
+    def _report(self, prompt, digest):
+        """A small report that satisfies the structured hazard schema"""
+        match = re.search(r'- Chemicals: (.+)', prompt)
+        chemicals = [c.strip() for c in match.group(1).split(',')] if match else ['process fluid']
+        passages = re.findall(r'\(passage ([^)]+)\)', prompt)
+        hazards = [
+            {'id': f"H{i}", 'title': f"Loss of containment of {chemical}", 'description': f"Mock hazard {digest[:8]}",
+             'severity': ('high', 'medium')[i % 2], 'likelihood': 'possible', 'citations': passages[:1]}
+            for i, chemical in enumerate(chemicals, 1)
+        ]
+        safeguards = [{'id': 'S1', 'hazard_ids': [hazard['id'] for hazard in hazards],
+                       'description': "Mock safeguard: inspect and maintain containment", 'type': 'prevention'}]
+        return {'summary': f"Mock analysis {digest[:8]}", 'hazards': hazards, 'safeguards': safeguards}
+
+    def _pieces(self, text):
+        return re.findall(r'\S+\s*', text)
+
+    def complete(self, model, messages, temperature, **options):
+        self._maybe_fail(model)
+        text = self._reply(model, messages, options)
+        time.sleep(self._latency(model) + len(self._pieces(text)) / self.tokens_per_second)
+        return text
+
+    def stream(self, model, messages, temperature):
+        self._maybe_fail(model)
+        time.sleep(self._latency(model))
+        for piece in self._pieces(self._reply(model, messages, {})):
+            time.sleep(1.0 / self.tokens_per_second)
+            yield piece
+
+    async def acomplete(self, model, messages, temperature, **options):
+        self._maybe_fail(model)
+        text = self._reply(model, messages, options)
+        await asyncio.sleep(self._latency(model) + len(self._pieces(text)) / self.tokens_per_second)
+        return text
+
+    async def astream(self, model, messages, temperature):
+        self._maybe_fail(model)
+        await asyncio.sleep(self._latency(model))
+        for piece in self._pieces(self._reply(model, messages, {})):
+            await asyncio.sleep(1.0 / self.tokens_per_second)
+            yield piece
+
+
+class ModelRouter:
+    """Per-route model selection with retry, failover and latency-aware ordering.
+
+    Each route ("hazard", "chat", "summary") has a list of candidate models
+    written as "provider:model" or a bare model name for the default
+    provider. Calls go to the candidate with the lowest recent latency
+    (exponentially weighted); a model that fails with a transient error is
+    cooled down and the retry goes to the next candidate, after a backoff.
+    """
+
+    def __init__(self, routes, providers, default_provider='openai', retries=2, backoff_seconds=0.5,
+                 cooldown_seconds=30.0, smoothing=0.3, explore_rate=0.05):
+        self.routes = {route: [parse_model_spec(spec, default_provider) for spec in specs] for route, specs in routes.items()}
+        self.providers = providers
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.smoothing = smoothing
+        self.explore_rate = explore_rate
+        self._latency = {}         # (provider, model) -> smoothed seconds
+        self._cooling_until = {}   # (provider, model) -> time
+        self._lock = threading.Lock()
+        self.listeners = []         # called with (route, "provider:model", error or None) after every upstream attempt
+
+    def route_key(self, route):
+        """Stable description of a route's candidates, for cache keys"""
+        return ",".join(f"{provider}:{model}" for provider, model in self.routes[route])
+
+    def candidates(self, route):
+        """The route's models, best first: not cooling down, then lowest observed latency (untried first)"""
+        now = time.time()
+        with self._lock:
+            ordered = sorted(
+                self.routes[route],
+                key=lambda candidate: (self._cooling_until.get(candidate, 0) > now, self._latency.get(candidate, 0.0))
+            )
+        if len(ordered) > 1 and random.random() < self.explore_rate:
+            # Occasionally re-measure a model that lost the ranking, so a recovered model can win again
+            ordered.insert(0, ordered.pop(random.randrange(1, len(ordered))))
+        return ordered
+
+    def record(self, candidate, seconds):
+        with self._lock:
+            previous = self._latency.get(candidate)
+            self._latency[candidate] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, route, candidate, error=None):
+        for listener in self.listeners:
+            try:
+                listener(route, f"{candidate[0]}:{candidate[1]}", error)
+            except Exception as e:
+                print(f"Error in model router listener: {e}")
+
+    def _finished(self, route, candidate, messages, completion_chars, total_seconds, first_token_seconds=None):
+        self.record(candidate, total_seconds)
+        self._notify(route, candidate)
+        metrics.record_model_call(route, f"{candidate[0]}:{candidate[1]}", total_seconds,
+                                  sum(len(message.get('content') or '') for message in messages), completion_chars,
+                                  first_token_seconds)
+
+    def _failed(self, route, candidate, e, attempt):
+        """Cool a model down after a transient error and return the backoff before the retry"""
+        metrics.MODEL_ERRORS.inc(route=route, model=f"{candidate[0]}:{candidate[1]}", error=type(e).__name__)
+        self._notify(route, candidate, e)
+        if not is_transient_error(e) or attempt >= self.retries:
+            raise e
+        print(f"Error from model {candidate[0]}:{candidate[1]}, retrying: {e}")
+        with self._lock:
+            self._cooling_until[candidate] = time.time() + self.cooldown_seconds
+        return self.backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                f"{provider}:{model}": {
+                    'latency_seconds': self._latency.get((provider, model)),
+                    'cooling_down': self._cooling_until.get((provider, model), 0) > now
+                }
+                for candidates in self.routes.values() for provider, model in candidates
+            }
+
+    async def aclose(self):
+        for provider in self.providers.values():
+            if hasattr(provider, 'aclose'):
+                await provider.aclose()
+
+    def complete(self, route, messages, temperature, **options):
+        """Full reply text from the best available model for the route"""
+        for attempt in range(self.retries + 1):
+            candidate = self.candidates(route)[0]
+            started = time.time()
+            try:
+                text = self.providers[candidate[0]].complete(candidate[1], messages, temperature, **options)
+            except Exception as e:
+                time.sleep(self._failed(route, candidate, e, attempt))
+                continue
+            self._finished(route, candidate, messages, len(text or ""), time.time() - started)
+            return text
+
+    def stream(self, route, messages, temperature):
+        """Yield reply deltas; a failure before the first delta is retried, a failure mid-stream is raised"""
+        for attempt in range(self.retries + 1):
+            candidate = self.candidates(route)[0]
+            started = time.time()
+            first_token_seconds = None
+            length = 0
+            try:
+                for delta in self.providers[candidate[0]].stream(candidate[1], messages, temperature):
+                    if first_token_seconds is None:
+                        first_token_seconds = time.time() - started
+                    length += len(delta)
+                    yield delta
+            except Exception as e:
+                if first_token_seconds is not None:
+                    metrics.MODEL_ERRORS.inc(route=route, model=f"{candidate[0]}:{candidate[1]}", error=type(e).__name__)
+                    self._notify(route, candidate, e)
+                    raise
+                time.sleep(self._failed(route, candidate, e, attempt))
+                continue
+            self._finished(route, candidate, messages, length, time.time() - started, first_token_seconds)
+            return
+
+    async def acomplete(self, route, messages, temperature, **options):
+        for attempt in range(self.retries + 1):
+            candidate = self.candidates(route)[0]
+            started = time.time()
+            try:
+                text = await self.providers[candidate[0]].acomplete(candidate[1], messages, temperature, **options)
+            except Exception as e:
+                await asyncio.sleep(self._failed(route, candidate, e, attempt))
+                continue
+            self._finished(route, candidate, messages, len(text or ""), time.time() - started)
+            return text
+
+    async def astream(self, route, messages, temperature):
+        for attempt in range(self.retries + 1):
+            candidate = self.candidates(route)[0]
+            started = time.time()
+            first_token_seconds = None
+            length = 0
+            try:
+                async for delta in self.providers[candidate[0]].astream(candidate[1], messages, temperature):
+                    if first_token_seconds is None:
+                        first_token_seconds = time.time() - started
+                    length += len(delta)
+                    yield delta
+            except Exception as e:
+                if first_token_seconds is not None:
+                    metrics.MODEL_ERRORS.inc(route=route, model=f"{candidate[0]}:{candidate[1]}", error=type(e).__name__)
+                    self._notify(route, candidate, e)
+                    raise
+                await asyncio.sleep(self._failed(route, candidate, e, attempt))
+                continue
+            self._finished(route, candidate, messages, length, time.time() - started, first_token_seconds)
+            return
+
+
+def create_model_router(routes, default_provider='openai', pool_size=32, mock_options=None, **router_options):
+    """Build a router for {route: [model spec, ...]} with the providers those specs name"""
+    names = {parse_model_spec(spec, default_provider)[0] for specs in routes.values() for spec in specs}
+    providers = {}
+    for name in names:
+        if name == 'openai':
+            providers[name] = OpenAIProvider(pool_size)
+        elif name == 'mock':
+            providers[name] = MockProvider(**(mock_options or {}))
+        else:
+            raise ValueError(f"Unknown model provider: {name}")
+    return ModelRouter(routes, providers, default_provider, **router_options)
@@ -0,0 +1,100 @@
+from document_index import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # The BPE file is downloaded on first use; offline hosts fall back to estimates
+                print(f"Warning: tiktoken encoding unavailable, estimating token counts: {e}")
+    return _encoding
+
+
+def count_tokens(text):
+    """Token count with tiktoken when available, else a character-based estimate"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most `max_tokens` tokens, marking the cut"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    encoding = _get_encoding()
+    if encoding is None:
+        head = text[:max_tokens * 4]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return head.rstrip() + " ...[truncated]"
+
+
+def select_passages(relevant_docs, max_tokens):
+    """Keep ranked passages best-first until the budget is spent; the lowest-ranked are dropped first"""
+    kept = []
+    used = 0
+    for doc in relevant_docs:
+        tokens = count_tokens(doc['content'])
+        if used + tokens > max_tokens:
+            continue
+        kept.append(doc)
+        used += tokens
+    return kept
+
+
+def format_turn(turn):
+    return f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+
+
+def select_recent_turns(turns, max_tokens):
+    """Newest turns that fit in the budget, returned oldest first"""
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        tokens = count_tokens(format_turn(turn))
+        if used + tokens > max_tokens:
+            break
+        kept.append(turn)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def history_tokens(turns):
+    return sum(count_tokens(format_turn(turn)) for turn in turns)
+
+
+def extractive_summary(summary, turns, max_tokens):
+    """Model-free fallback summary: the questions asked and the opening of each answer"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        answer = ' '.join(turn['assistant'].split())[:200]
+        lines.append(f"- Asked: {turn['user']} -> {answer}")
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+
+def build_summary_messages(summary, turns, max_tokens):
+    """Messages asking a model to fold older turns into the running summary"""
+    transcript = "\n\n".join(format_turn(turn) for turn in turns)
+    return [
+        {"role": "system", "content": "You maintain a running summary of a process safety conversation. Keep process parameters, hazards discussed, what-if scenarios, conclusions and open questions. Be terse."},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew exchanges to fold in:\n{transcript}\n\nReturn the updated summary in at most {max_tokens} tokens."}
+    ]
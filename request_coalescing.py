@@ -0,0 +1,264 @@
+import asyncio
+import contextvars
+import threading
+
+
+class FlightCancelled(Exception):
+    """The caller running a flight was cancelled or interrupted before it finished"""
+
+
+def _flight_error(e):
+    """The error followers see: the leader's own exception, or FlightCancelled for a cancellation"""
+    return e if isinstance(e, Exception) else FlightCancelled(f"Coalesced computation was interrupted ({type(e).__name__})")
+
+
+class Flight:
+    """One in-flight computation: the chunks produced so far, then a result or an error"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self._condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._condition.notify_all()
+
+    def wait(self):
+        """Block until the computation ends; return its result or raise its error"""
+        with self._condition:
+            while not self.done:
+                self._condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Yield every chunk from the first one, as they are published"""
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                fresh = self.chunks[position:]
+                position = len(self.chunks)
+                finished = self.done
+            yield from fresh
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls (same key) into one computation.
+
+    The first caller for a key runs it; callers arriving while it is in
+    flight wait for and share its result or error. Streams are produced on
+    a background thread, so a follower sees every chunk from the start and
+    the computation finishes (and can be cached) even if the first client
+    disconnects. Nothing is kept once a flight ends; caching is separate.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counts = {'leaders': 0, 'followers': 0}
+
+    def _join(self, key):
+        """(flight, True if the caller must run it)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counts['followers'] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self._counts['leaders'] += 1
+            return flight, True
+
+    def _release(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key, func):
+        """Return func()'s result, sharing one call among concurrent callers with the same key"""
+        if not self.enabled:
+            return func()
+        flight, leader = self._join(key)
+        if not leader:
+            try:
+                return flight.wait()
+            except FlightCancelled:
+                # The leader was interrupted, not failed; take over the call
+                return self.do(key, func)
+        try:
+            result = func()
+        except BaseException as e:
+            self._release(key, flight)
+            flight.finish(error=_flight_error(e))
+            raise
+        if isinstance(result, str):
+            flight.publish(result)   # stream followers get the text as one chunk
+        self._release(key, flight)
+        flight.finish(result)
+        return result
+
+    def stream(self, key, func):
+        """Iterate func()'s text chunks, sharing one stream among concurrent callers with the same key"""
+        if not self.enabled:
+            return func()
+        flight, leader = self._join(key)
+        if leader:
+            # The producer runs in a copy of the caller's context (tenant, request timings)
+            threading.Thread(target=contextvars.copy_context().run, args=(self._produce, key, flight, func), daemon=True).start()
+        return flight.follow()
+
+    def _produce(self, key, flight, func):
+        try:
+            for chunk in func():
+                flight.publish(chunk)
+        except BaseException as e:
+            self._release(key, flight)
+            flight.finish(error=_flight_error(e))
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._release(key, flight)
+        flight.finish("".join(flight.chunks))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, in_flight=len(self._flights))
+
+
+class AsyncFlight:
+    """Event-loop counterpart of Flight"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done = True
+        self._notify()
+
+    async def wait(self):
+        while not self.done:
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def follow(self):
+        position = 0
+        while True:
+            if position >= len(self.chunks) and not self.done:
+                await self._changed.wait()
+                continue
+            fresh = self.chunks[position:]
+            position = len(self.chunks)
+            for chunk in fresh:
+                yield chunk
+            if self.done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop; streams are produced by a separate task"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._flights = {}
+        self._counts = {'leaders': 0, 'followers': 0}
+        self._tasks = set()
+
+    def _join(self, key):
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._counts['followers'] += 1
+            return flight, False
+        flight = self._flights[key] = AsyncFlight()
+        self._counts['leaders'] += 1
+        return flight, True
+
+    def _release(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key, func):
+        """Await func()'s result, sharing one call among concurrent callers with the same key"""
+        if not self.enabled:
+            return await func()
+        flight, leader = self._join(key)
+        if not leader:
+            try:
+                return await flight.wait()
+            except FlightCancelled:
+                # The leader was cancelled (e.g. its client disconnected); take over the call
+                return await self.do(key, func)
+        try:
+            result = await func()
+        except BaseException as e:
+            # CancelledError is not an Exception; the flight must still end or later callers wait forever
+            self._release(key, flight)
+            flight.finish(error=_flight_error(e))
+            raise
+        if isinstance(result, str):
+            flight.publish(result)
+        self._release(key, flight)
+        flight.finish(result)
+        return result
+
+    def stream(self, key, func):
+        """Async-iterate func()'s chunks, sharing one stream among concurrent callers with the same key"""
+        if not self.enabled:
+            return func()
+        flight, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(self._produce(key, flight, func))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return flight.follow()
+
+    async def _produce(self, key, flight, func):
+        try:
+            async for chunk in func():
+                flight.publish(chunk)
+        except BaseException as e:
+            self._release(key, flight)
+            flight.finish(error=_flight_error(e))
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._release(key, flight)
+        flight.finish("".join(flight.chunks))
+
+    def stats(self):
+        return dict(self._counts, in_flight=len(self._flights))
@@ -1,39 +1,98 @@
 import openai
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 import tempfile
-import PyPDF2
-import docx
 from io import BytesIO
-import requests
 import json
-from supabase import create_client, Client
+import base64
+import numpy as np
+import hashlib
+import contextvars
+import math
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from document_index import DocumentIndex, StreamingChunker, chunk_text, estimate_tokens, make_chunk_id, rebuild_text
+from document_extraction import iter_document_pages, pdf_page_hashes, spool_upload, text_hash
+from document_store import create_document_store, parse_list_cursor
+from hazard_rules import HAZARD_RULES_VERSION, format_screening_context, screen_grid, screen_process
+from hazard_schema import (
+    HAZARD_REPORT_SCHEMA, HAZARD_SCHEMA_VERSION, filter_hazard_report, hazard_digest, is_hazard_report,
+    pack_hazard_report, parse_hazard_report, referenced_items, render_hazard_report, unpack_hazard_report,
+    validate_hazard_report
+)
+from model_providers import create_model_router, is_transient_error
+from admission_control import AdmissionController, AdmissionRejected, current_tenant, parse_tenant_weights, set_current_tenant, tenant_context
+from embedding_index import EmbeddingIndex, create_embedder, fuse_rankings
+from analysis_cache import AnalysisCache, analysis_cache_key, normalize_process_params
+from chemical_knowledge import ChemicalKnowledge, KnowledgeCache, format_knowledge_context
+from answer_cache import SemanticAnswerCache, is_follow_up
+from request_coalescing import SingleFlight
+from job_queue import TERMINAL_STATUSES, JobQueue, JobWorkerPool
+from metrics import (
+    CHAT_ANSWER_LOOKUPS, HTTP_SECONDS, begin_request, current_timings, end_request, record_stage,
+    render_metrics, server_timing_header, timed, timed_iter
+)
+from session_store import create_session_store, new_session
+from prompt_builder import (
+    build_summary_messages, extractive_summary, format_turn, history_tokens,
+    select_passages, select_recent_turns, truncate_to_tokens
+)
 
 # 🔑 Set your API key from environment variable
 openai.api_key = os.getenv("OPENAI_API_KEY")
 if not openai.api_key:
     print("Warning: OPENAI_API_KEY environment variable not set!")
 
-# 🔥 Initialize Supabase
+# 🔥 Supabase credentials; the client is created on first use, so cold starts that never touch documents skip it
 SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+if not (SUPABASE_URL and SUPABASE_KEY):
+    print("Warning: Supabase credentials not found. Set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.")
+
+# 🗄️ Document storage: supabase, or sqlite for single-node and offline sites (the default without Supabase credentials)
+DOCUMENT_STORE = os.getenv("DOCUMENT_STORE", "supabase" if SUPABASE_URL and SUPABASE_KEY else "sqlite").lower()
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", os.path.join(tempfile.gettempdir(), "hazard_documents.db"))
+
+_document_store = None
+_document_store_ready = False
+_document_store_lock = threading.Lock()
 
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
+def create_supabase_client():
+    """Supabase client, or None without credentials or if it cannot be created"""
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        return None
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        from supabase import create_client
+        client = create_client(SUPABASE_URL, SUPABASE_KEY)
         print("Supabase initialized successfully")
+        return client
     except Exception as e:
         print(f"Warning: Supabase initialization failed: {e}")
         print("Document storage will not be available")
-else:
-    print("Warning: Supabase credentials not found. Set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.")
+        return None
+
+def get_document_store():
+    """The configured document store, created on first use; None if it is unavailable"""
+    global _document_store, _document_store_ready
+    with _document_store_lock:
+        if not _document_store_ready:
+            supabase_client = create_supabase_client() if DOCUMENT_STORE == 'supabase' else None
+            _document_store = create_document_store(DOCUMENT_STORE, supabase_client, DOCUMENT_STORE_PATH)
+            _document_store_ready = True
+            if _document_store is not None:
+                print(f"Document storage: {_document_store.name}")
+        return _document_store
 
 # 📄 Document Processing Functions
 def extract_text_from_pdf(file_content):
     """Extract text from PDF file content"""
     try:
+        import PyPDF2
+
         pdf_reader = PyPDF2.PdfReader(BytesIO(file_content))
         text = ""
         for page in pdf_reader.pages:
@@ -46,6 +105,8 @@ def extract_text_from_pdf(file_content):
 def extract_text_from_docx(file_content):
     """Extract text from DOCX file content"""
     try:
+        import docx
+
         doc = docx.Document(BytesIO(file_content))
         text = ""
         for paragraph in doc.paragraphs:
@@ -68,39 +129,407 @@ def extract_text_from_file(file_content, filename):
     else:
         return ""
 
-def get_relevant_documents(query, limit=5):
-    """Retrieve relevant documents from Supabase based on query"""
-    if supabase is None:
-        print("Supabase not available, returning empty document list")
+# 🔎 Document Index
+DOCUMENT_INDEX_PATH = os.getenv("DOCUMENT_INDEX_PATH", os.path.join(tempfile.gettempdir(), "hazard_document_index.json"))
+DOCUMENT_INDEX_SYNC_SECONDS = float(os.getenv("DOCUMENT_INDEX_SYNC_SECONDS", "30"))
+# Index changes within this many seconds share one snapshot write (0 writes on every change)
+DOCUMENT_INDEX_SAVE_SECONDS = float(os.getenv("DOCUMENT_INDEX_SAVE_SECONDS", "10"))
+DOCUMENT_SYNC_PAGE_SIZE = 100
+
+# Estimated-token budgets for retrieved passages in each prompt
+HAZARD_CONTEXT_TOKEN_BUDGET = int(os.getenv("HAZARD_CONTEXT_TOKEN_BUDGET", "2500"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+
+# keyword (BM25 only), semantic (embeddings only) or hybrid (rank fusion of both)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "keyword").lower()
+EMBEDDING_INDEX_PATH = os.getenv("EMBEDDING_INDEX_PATH", os.path.join(tempfile.gettempdir(), "hazard_embeddings"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+
+document_index = DocumentIndex.load(DOCUMENT_INDEX_PATH)
+_index_sync_lock = threading.Lock()
+_last_index_sync = 0.0
+
+embedder = None
+embedding_index = None
+if RETRIEVAL_MODE in ('semantic', 'hybrid'):
+    embedder = create_embedder(EMBEDDING_MODEL)
+    embedding_index = EmbeddingIndex.load(EMBEDDING_INDEX_PATH, embedder.dim, embedder.name)
+
+_index_save_timer = None
+_index_save_lock = threading.Lock()
+_index_write_lock = threading.Lock()
+
+def save_document_index():
+    """Schedule a snapshot write, so a burst of uploads or a sync costs one full write rather than one each"""
+    global _index_save_timer
+    if DOCUMENT_INDEX_SAVE_SECONDS <= 0:
+        write_document_index()
+        return
+    with _index_save_lock:
+        if _index_save_timer is None:
+            _index_save_timer = threading.Timer(DOCUMENT_INDEX_SAVE_SECONDS, write_document_index)
+            _index_save_timer.daemon = True
+            _index_save_timer.start()
+
+def write_document_index():
+    """Persist the index snapshots so other workers and restarts can reuse them"""
+    global _index_save_timer
+    with _index_save_lock:
+        _index_save_timer = None
+    try:
+        with _index_write_lock:
+            document_index.save(DOCUMENT_INDEX_PATH)
+            if embedding_index is not None:
+                embedding_index.save(EMBEDDING_INDEX_PATH)
+    except Exception as e:
+        print(f"Warning: could not save document index: {e}")
+
+def flush_document_index():
+    """Write a pending snapshot now (at exit)"""
+    with _index_save_lock:
+        timer = _index_save_timer
+    if timer is not None:
+        timer.cancel()
+        write_document_index()
+
+atexit.register(flush_document_index)
+
+def index_document(document_id, filename, chunks, upload_date=''):
+    """Add a document's passages to the keyword index and, if enabled, the embedding index"""
+    global _corpus_stamp
+    _corpus_stamp = None
+    previous = document_index.documents.get(document_id)
+    if previous is not None:
+        # Reports built from the old passages are no longer valid
+        analysis_cache.invalidate_documents([document_id])
+    if embedding_index is not None:
+        # Passages whose text survived a revision keep their vectors; only new text is embedded
+        reusable = {}
+        if previous:
+            old_vectors = embedding_index.get_vectors(previous['chunk_ids'])
+            for chunk_id, vector in old_vectors.items():
+                reusable[document_index.passages[chunk_id]['content']] = vector
+            embedding_index.remove(previous['chunk_ids'])
+        if chunks:
+            chunk_ids = [make_chunk_id(document_id, chunk['chunk_index']) for chunk in chunks]
+            fresh = [chunk['content'] for chunk in chunks if chunk['content'] not in reusable]
+            fresh_vectors = dict(zip(fresh, embedder.embed(fresh))) if fresh else {}
+            embedding_index.add(chunk_ids, [reusable.get(chunk['content'], fresh_vectors.get(chunk['content'])) for chunk in chunks])
+
+    document_index.add_document(document_id, filename, chunks, upload_date)
+
+def backfill_passage_embeddings():
+    """Embed indexed passages that have no vector yet, e.g. after switching RETRIEVAL_MODE on"""
+    if embedding_index is None:
+        return 0
+
+    missing = [chunk_id for chunk_id in list(document_index.passages) if chunk_id not in embedding_index]
+    for start in range(0, len(missing), DOCUMENT_SYNC_PAGE_SIZE):
+        batch = missing[start:start + DOCUMENT_SYNC_PAGE_SIZE]
+        embedding_index.add(batch, embedder.embed([document_index.passages[chunk_id]['content'] for chunk_id in batch]))
+    return len(missing)
+
+def sync_document_index(force=False):
+    """Pull documents uploaded since the last sync into the local index"""
+    global _last_index_sync
+
+    if get_document_store() is None:
+        return
+    if not force and time.time() - _last_index_sync < DOCUMENT_INDEX_SYNC_SECONDS:
+        return
+
+    # The very first sync must finish before anyone searches; later ones can be skipped
+    first_sync = document_index.synced_through is None
+    if not _index_sync_lock.acquire(blocking=first_sync):
+        return
+
+    try:
+        since = document_index.synced_through
+        newest = since
+        added = 0
+        start = 0
+        while True:
+            # Metadata only; passage text comes from document_chunks
+            rows = get_document_store().documents_since(since, start, DOCUMENT_SYNC_PAGE_SIZE)
+
+            # Skip documents this worker already indexed at upload time
+            stale = [row for row in rows if not is_document_indexed(row['id'], row.get('upload_date', ''))]
+            if stale:
+                chunks_by_doc = fetch_document_chunks([row['id'] for row in stale])
+                for row in stale:
+                    chunks = chunks_by_doc.get(row['id']) or chunk_legacy_document(row['id'])
+                    index_document(row['id'], row.get('filename', ''), chunks, row.get('upload_date', ''))
+                    added += 1
+            for row in rows:
+                newest = row.get('upload_date') or newest
+
+            if len(rows) < DOCUMENT_SYNC_PAGE_SIZE:
+                break
+            start += DOCUMENT_SYNC_PAGE_SIZE
+
+        document_index.synced_through = newest or ''
+        _last_index_sync = time.time()
+        added += backfill_passage_embeddings()
+        if added:
+            save_document_index()
+            warm_chemical_knowledge()
+    except Exception as e:
+        print(f"Error syncing document index: {e}")
+    finally:
+        _index_sync_lock.release()
+
+def is_document_indexed(document_id, upload_date):
+    """True if the index already holds this version of the document"""
+    document = document_index.documents.get(document_id)
+    return document is not None and document['upload_date'] == (upload_date or '')
+
+def fetch_document_chunks(document_ids):
+    """Fetch stored passages for the given documents, grouped by document ID"""
+    try:
+        return get_document_store().fetch_chunks(document_ids)
+    except Exception as e:
+        print(f"Error fetching document chunks: {e}")
+        return {}
+
+def chunk_legacy_document(document_id):
+    """Chunk a document uploaded before passages were stored, and backfill its chunks"""
+    chunks = chunk_text(get_document_store().get_content(document_id))
+    store_document_chunks(document_id, chunks)
+    return chunks
+
+def store_document_chunks(document_id, chunks):
+    """Persist a document's passages with their stable chunk IDs and offsets"""
+    try:
+        get_document_store().store_chunks(document_id, chunks)
+    except Exception as e:
+        print(f"Error storing document chunks: {e}")
+
+def rank_passages(query, limit, candidates=None):
+    """Rank passage IDs for query according to RETRIEVAL_MODE, optionally within a candidate set"""
+    if embedding_index is None:
+        return document_index.search(query, limit, candidates)
+
+    semantic_hits = embedding_index.search(embedder.embed([query])[0], limit, candidates)
+    if RETRIEVAL_MODE == 'semantic':
+        return semantic_hits
+
+    keyword_hits = document_index.search(query, limit, candidates)
+    return fuse_rankings([keyword_hits, semantic_hits])[:limit]
+
+def get_relevant_documents(query, limit=5, token_budget=None, candidates=None):
+    """Retrieve the passages most relevant to query, ranked by BM25 and/or embedding similarity.
+
+    Passages are taken best-first until `limit` passages or `token_budget`
+    estimated tokens are reached, whichever comes first. `candidates`
+    restricts ranking to a pre-retrieved set of chunk IDs.
+    """
+    if get_document_store() is None and len(document_index) == 0:
+        print("Document storage not available, returning empty document list")
         return []
-    
+
     try:
-        # Get all documents from Supabase
-        response = supabase.table('documents').select('*').execute()
-        
+        with timed('retrieval_fetch'):
+            sync_document_index()
+
+        with timed('retrieval_score'):
+            ranked = rank_passages(query, limit * 4, candidates)
+
         relevant_docs = []
-        for doc in response.data:
-            filename = doc.get('filename', '')
-            content = doc.get('content', '')
-            
-            # Simple relevance check - look for keywords in filename and content
-            query_lower = query.lower()
-            if (query_lower in filename.lower() or 
-                query_lower in content.lower() or
-                any(keyword in content.lower() for keyword in query_lower.split())):
-                relevant_docs.append({
-                    'filename': filename,
-                    'content': content[:2000],  # Limit content length
-                    'upload_date': doc.get('upload_date', '')
-                })
-        
-        return relevant_docs[:limit]
+        tokens_used = 0
+        for chunk_id, score in ranked:
+            passage = document_index.get_passage(chunk_id)
+            if passage is None:
+                continue
+
+            passage_tokens = estimate_tokens(passage['content'])
+            if token_budget is not None and tokens_used + passage_tokens > token_budget:
+                continue
+
+            passage['score'] = score
+            relevant_docs.append(passage)
+            tokens_used += passage_tokens
+            if len(relevant_docs) >= limit:
+                break
+
+        return relevant_docs
     except Exception as e:
         print(f"Error retrieving documents: {e}")
         return []
 
+def format_document_context(relevant_docs, heading):
+    """Render retrieved passages as a prompt section"""
+    if not relevant_docs:
+        return ""
+
+    document_context = f"\n\n{heading}:\n"
+    for doc in relevant_docs:
+        document_context += f"Document: {doc['filename']} (passage {doc['chunk_id']})\n{doc['content']}\n\n"
+    return document_context
+
+# 🗄️ Hazard Analysis Cache
+# Bump HAZARD_PROMPT_VERSION whenever the hazard prompt text changes so stale reports are not served
+HAZARD_PROMPT_VERSION = "hazard-v2"
+HAZARD_JSON_PROMPT_VERSION = f"hazard-json-v1+{HAZARD_SCHEMA_VERSION}"
+
+# 🤖 Model routing: each route lists candidate models ("gpt-4o", "mock:fast", ...), fastest healthy one first
+HAZARD_MODEL = os.getenv("HAZARD_MODEL", "gpt-4o")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "openai").lower()
+
+model_routes = {
+    'hazard': HAZARD_MODEL.split(','),
+    'chat': CHAT_MODEL.split(','),
+    'summary': SUMMARY_MODEL.split(',')
+}
+model_router = create_model_router(
+    model_routes,
+    default_provider=MODEL_PROVIDER,
+    pool_size=int(os.getenv("MODEL_POOL_SIZE", "32")),
+    mock_options={
+        'latency_seconds': float(os.getenv("MOCK_LATENCY_SECONDS", "0.2")),
+        'tokens_per_second': float(os.getenv("MOCK_TOKENS_PER_SECOND", "80")),
+        'output_tokens': int(os.getenv("MOCK_OUTPUT_TOKENS", "200")),
+        'error_rate': float(os.getenv("MOCK_ERROR_RATE", "0"))
+    },
+    retries=int(os.getenv("MODEL_RETRIES", "2")),
+    backoff_seconds=float(os.getenv("MODEL_BACKOFF_SECONDS", "0.5")),
+    cooldown_seconds=float(os.getenv("MODEL_COOLDOWN_SECONDS", "30"))
+)
+print("Model routes: " + "; ".join(f"{route}={model_router.route_key(route)}" for route in model_routes))
+
+# 🚦 Admission control: per-tenant rate limits at the door, a fair queue and an adaptive concurrency limit for model calls
+admission = AdmissionController(
+    enabled=os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes"),
+    rate_per_second=float(os.getenv("ADMISSION_RATE_PER_MINUTE", "60")) / 60,
+    burst=float(os.getenv("ADMISSION_BURST", "20")),
+    max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", "16")),
+    min_concurrency=int(os.getenv("MODEL_MIN_CONCURRENCY", "2")),
+    max_queue_depth=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+    token_budget=int(os.getenv("ADMISSION_TOKEN_BUDGET", "400000")),
+    max_wait_seconds=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "60")),
+    tenant_weights=parse_tenant_weights(os.getenv("ADMISSION_TENANT_WEIGHTS"))
+)
+# Typical reply length per route, added to the prompt size when budgeting a call
+EXPECTED_REPLY_TOKENS = {'hazard': 1500, 'chat': 800, 'summary': 300}
+
+def on_model_result(route, model, error):
+    """Upstream 429s shrink the model concurrency limit; successes grow it back"""
+    if error is None or isinstance(error, openai.error.RateLimitError):
+        admission.record_upstream(error is not None)
+
+model_router.add_listener(on_model_result)
+
+def estimate_call_tokens(route, messages):
+    return sum(estimate_tokens(message['content']) for message in messages) + EXPECTED_REPLY_TOKENS.get(route, 500)
+
+def model_complete(route, messages, temperature, **options):
+    """model_router.complete, once the current tenant's turn comes up in the admission queue"""
+    with admission.slot(current_tenant(), estimate_call_tokens(route, messages)):
+        return model_router.complete(route, messages, temperature, **options)
+
+def model_stream(route, messages, temperature):
+    """model_router.stream, holding an admission slot until the stream ends"""
+    with admission.slot(current_tenant(), estimate_call_tokens(route, messages)):
+        yield from model_router.stream(route, messages, temperature)
+
+# Per-section token budgets for chat prompts (documents use CHAT_CONTEXT_TOKEN_BUDGET)
+CHAT_ANALYSIS_TOKEN_BUDGET = int(os.getenv("CHAT_ANALYSIS_TOKEN_BUDGET", "1500"))
+CHAT_PROCESS_TOKEN_BUDGET = int(os.getenv("CHAT_PROCESS_TOKEN_BUDGET", "300"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "400"))
+# Turns kept verbatim, and how many extra accumulate before older ones are summarized
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "4"))
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "4"))
+
+analysis_cache = AnalysisCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400")),
+    sqlite_path=os.getenv("ANALYSIS_CACHE_PATH")
+)
+
+# Identical analyses requested while one is already running share it instead of starting their own
+hazard_flights = SingleFlight(enabled=os.getenv("REQUEST_COALESCING", "1") not in ("0", "false"))
+
+# 🧪 Chemical knowledge: per-chemical and per-pair reference entries, keyed by canonical name or CAS number
+CHEMICAL_KNOWLEDGE_TOKEN_BUDGET = int(os.getenv("CHEMICAL_KNOWLEDGE_TOKEN_BUDGET", "600"))
+# Plant inventory warmed in the background at startup and after new documents are indexed
+CHEMICAL_INVENTORY = [name.strip() for name in os.getenv("CHEMICAL_INVENTORY", "").split(",") if name.strip()]
+
+_corpus_stamp = None
+
+def corpus_stamp():
+    """Digest of the indexed document versions; knowledge built from an older corpus is rebuilt"""
+    global _corpus_stamp
+    stamp = _corpus_stamp
+    if stamp is None:
+        versions = sorted((str(doc_id), doc['upload_date']) for doc_id, doc in list(document_index.documents.items()))
+        stamp = _corpus_stamp = hashlib.sha256(json.dumps(versions).encode('utf-8')).hexdigest()[:16]
+    return stamp
+
+def search_knowledge_passages(query, limit):
+    return [document_index.get_passage(chunk_id) for chunk_id, _ in document_index.search(query, limit)]
+
+chemical_knowledge = ChemicalKnowledge(
+    search_knowledge_passages,
+    corpus_stamp,
+    cache=KnowledgeCache(
+        max_entries=int(os.getenv("CHEMICAL_KNOWLEDGE_CACHE_SIZE", "2048")),
+        sqlite_path=os.getenv("CHEMICAL_KNOWLEDGE_PATH", os.path.join(tempfile.gettempdir(), "hazard_chemical_knowledge.db"))
+    ),
+    passages_per_entry=int(os.getenv("CHEMICAL_KNOWLEDGE_PASSAGES", "2")),
+    enabled=os.getenv("CHEMICAL_KNOWLEDGE", "true").lower() in ("1", "true", "yes")
+)
+
+def warm_chemical_knowledge():
+    """Build the inventory's entries on a background thread so requests find them ready"""
+    if not chemical_knowledge.enabled or not CHEMICAL_INVENTORY:
+        return
+
+    def warm():
+        try:
+            sync_document_index()
+            built = chemical_knowledge.warm(CHEMICAL_INVENTORY)
+            if built:
+                print(f"Chemical knowledge: built {built} entries for {len(CHEMICAL_INVENTORY)} inventory chemicals")
+        except Exception as e:
+            print(f"Error warming chemical knowledge: {e}")
+
+    threading.Thread(target=warm, name="chemical-knowledge-warmup", daemon=True).start()
+
+def chemical_knowledge_context(chemicals, relevant_docs):
+    """Precomputed chemical and pair facts as a prompt section, plus the passage IDs it quotes"""
+    if not chemical_knowledge.enabled or not chemicals:
+        return "", []
+    try:
+        with timed('chemical_knowledge'):
+            knowledge = chemical_knowledge.lookup(chemicals)
+        return format_knowledge_context(knowledge, CHEMICAL_KNOWLEDGE_TOKEN_BUDGET, {doc['chunk_id'] for doc in relevant_docs})
+    except Exception as e:
+        print(f"Error looking up chemical knowledge: {e}")
+        return "", []
+
+def chemical_knowledge_lookup(chemicals_param):
+    """Response body for the chemical knowledge endpoint"""
+    chemicals = [name.strip() for name in chemicals_param.split(',') if name.strip()]
+    body = {'stats': chemical_knowledge.stats()}
+    if chemicals:
+        body.update(chemical_knowledge.lookup(chemicals))
+    return body
+
 # 🧠 Function to get AI-generated hazard analysis
-def ai_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operation_phase=None, equipment_volume=None, phase=None, location=None, utilities=None):
+def hazard_retrieval_query(unit, chemicals, operation_phase=None, phase=None, location=None):
+    """Retrieval query used for a hazard analysis"""
+    return f"{unit} {', '.join(chemicals)} {operation_phase} {phase} {location}"
+
+def prepare_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operation_phase=None, equipment_volume=None, phase=None, location=None, utilities=None, relevant_docs=None, operating_envelope=None, structured=False):
+    """Retrieve context and build the hazard-analysis messages, checking the report cache.
+
+    Pass `relevant_docs` to reuse passages that were already retrieved.
+    `operating_envelope` describes a temperature/pressure range the analysis
+    must cover, for sweeps where temp and pressure are a representative point.
+    With `structured`, the model is asked for a JSON report (see hazard_schema).
+    """
     # Build utilities string
     utilities_str = ""
     if utilities and len(utilities) > 0:
@@ -112,13 +541,50 @@ def ai_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operatio
         location_str = f"Location: {location}"
     
     # Get relevant documents for hazard analysis
-    process_query = f"{unit} {', '.join(chemicals)} {operation_phase} {phase} {location}"
-    relevant_docs = get_relevant_documents(process_query, limit=5)
-    document_context = ""
-    if relevant_docs:
-        document_context = "\n\nRelevant Engineering Documents and Handbooks:\n"
-        for doc in relevant_docs:
-            document_context += f"Document: {doc['filename']}\n{doc['content']}\n\n"
+    if relevant_docs is None:
+        process_query = hazard_retrieval_query(unit, chemicals, operation_phase, phase, location)
+        relevant_docs = get_relevant_documents(process_query, limit=5, token_budget=HAZARD_CONTEXT_TOKEN_BUDGET)
+    document_context = format_document_context(relevant_docs, "Relevant Engineering Documents and Handbooks")
+    knowledge_context, knowledge_chunk_ids = chemical_knowledge_context(chemicals, relevant_docs)
+    
+    # Deterministic findings go to the model as established facts
+    with timed('rule_screening'):
+        screening = screen_process(temp, pressure, chemicals, phase, utilities)
+    screening_context = format_screening_context(screening)
+    
+    # Identical inputs with identical retrieved passages get the cached report
+    cache_key = None
+    cached_report = None
+    if analysis_cache.enabled:
+        params = normalize_process_params(
+            unit, temp, pressure, chemicals, flow_rate, operation_phase,
+            equipment_volume, phase, location, utilities
+        )
+        if operating_envelope:
+            params['operating_envelope'] = operating_envelope
+        prompt_version = HAZARD_JSON_PROMPT_VERSION if structured else HAZARD_PROMPT_VERSION
+        prompt_version = f"{prompt_version}+{HAZARD_RULES_VERSION}"
+        if knowledge_context:
+            prompt_version += "+" + hashlib.sha256(knowledge_context.encode('utf-8')).hexdigest()[:16]
+        cache_key = analysis_cache_key(params, relevant_docs, prompt_version, model_router.route_key('hazard'))
+        with timed('cache_lookup'):
+            cached_report = analysis_cache.get(cache_key)
+        if cached_report is not None and structured:
+            cached_report = unpack_hazard_report(cached_report)
+    
+    prompt_started = time.perf_counter()
+    if structured:
+        format_instructions = f"""Respond with a single JSON object matching this schema, and nothing else:
+    {json.dumps(HAZARD_REPORT_SCHEMA)}
+    Number hazards H1, H2, ... and safeguards S1, S2, ...; link each safeguard to the hazards it addresses through hazard_ids.
+    In citations, use the passage IDs shown after each document name above; cite only passages you actually used.
+    Put code and standard references (e.g. "API 521", "OSHA 1910.119") in standards."""
+    else:
+        format_instructions = """Format your response with clear sections:
+    - Hazards: Detailed identification of specific hazards with engineering context
+    - Safeguards: Comprehensive recommendations with technical justification
+
+    Ensure all text is grammatically correct, properly spaced, and professionally written."""
     
     prompt = f"""
     You are a senior process safety engineer with extensive experience in chemical engineering and industrial safety. Based on the following process data, provide a comprehensive hazard analysis with detailed engineering insights.
@@ -134,9 +600,14 @@ def ai_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operatio
     {f"- Phase: {phase}" if phase else ""}
     {f"- Location: {location_str}" if location_str else ""}
     {f"- Utilities: {utilities_str}" if utilities_str else ""}
+    {f"- Operating Envelope: {operating_envelope}. Temperature and pressure above are a representative point; cover the whole envelope." if operating_envelope else ""}
 
     {document_context}
 
+    {knowledge_context}
+
+    {screening_context}
+
     Instructions:
     1. Provide detailed engineering analysis with specific technical details
     2. Include relevant safety standards, codes, and best practices
@@ -155,63 +626,376 @@ def ai_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operatio
     15. Apply proper engineering logic from both the handbooks and your own knowledge base
     16. Use the handbook data to validate and enhance your technical recommendations
 
-    Format your response with clear sections:
-    - Hazards: Detailed identification of specific hazards with engineering context
-    - Safeguards: Comprehensive recommendations with technical justification
+    {format_instructions}
+    """
 
-    Ensure all text is grammatically correct, properly spaced, and professionally written.
+    messages = [
+        {"role": "system", "content": "You are an expert process safety engineer with access to engineering handbooks and technical documents. You combine your extensive knowledge with specific document references to provide comprehensive, accurate hazard analysis. Always reference relevant documents when available and apply proper engineering logic from both handbooks and your expertise."},
+        {"role": "user", "content": prompt}
+    ]
+    record_stage('prompt_build', time.perf_counter() - prompt_started)
+
+    return {
+        'messages': messages,
+        'relevant_docs': relevant_docs,
+        'cache_key': cache_key,
+        'cached_report': cached_report,
+        'screening': screening,
+        'knowledge_chunk_ids': knowledge_chunk_ids,
+        'structured': structured
+    }
+
+def hazard_request_key(params, relevant_docs=None, operating_envelope=None, structured=False):
+    """Coalescing key for a hazard analysis: normalized inputs plus anything else that changes the report"""
+    return json.dumps({
+        'params': params,
+        'documents': None if relevant_docs is None else sorted(str(doc['chunk_id']) for doc in relevant_docs),
+        'operating_envelope': operating_envelope,
+        'structured': structured
+    }, sort_keys=True)
+
+def cache_hazard_report(prepared, report):
+    """Store a finished report under the cache key computed by prepare_hazard_analysis"""
+    if prepared['cache_key'] is not None:
+        stored = pack_hazard_report(report) if is_hazard_report(report) else report
+        analysis_cache.set(prepared['cache_key'], stored, [doc['document_id'] for doc in prepared['relevant_docs']])
+
+def finish_hazard_report(prepared, content):
+    """Turn the model's reply into the report (validated JSON in structured mode) and cache it"""
+    report = content
+    if prepared['structured']:
+        known_chunk_ids = {doc['chunk_id'] for doc in prepared['relevant_docs']} | set(prepared['knowledge_chunk_ids'])
+        report = parse_hazard_report(content, known_chunk_ids)
+    cache_hazard_report(prepared, report)
+    return report
+
+def hazard_completion_options(prepared):
+    """Extra model arguments for a prepared analysis"""
+    return {'response_format': {'type': 'json_object'}} if prepared['structured'] else {}
+
+def ai_hazard_analysis(unit, temp, pressure, chemicals, flow_rate=None, operation_phase=None, equipment_volume=None, phase=None, location=None, utilities=None, relevant_docs=None, operating_envelope=None, structured=False):
+    """Return the full hazard-analysis report for the given process parameters.
+
+    The report is text, or a validated dict in `structured` mode.
+    Concurrent identical requests share one retrieval and model call.
     """
+    def analyze():
+        prepared = prepare_hazard_analysis(
+            unit, temp, pressure, chemicals, flow_rate, operation_phase,
+            equipment_volume, phase, location, utilities, relevant_docs, operating_envelope, structured
+        )
+        if prepared['cached_report'] is not None:
+            return prepared['cached_report']
+
+        content = model_complete('hazard', prepared['messages'], 0.3, **hazard_completion_options(prepared))
+        return finish_hazard_report(prepared, content)
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are an expert process safety engineer with access to engineering handbooks and technical documents. You combine your extensive knowledge with specific document references to provide comprehensive, accurate hazard analysis. Always reference relevant documents when available and apply proper engineering logic from both handbooks and your expertise."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3
+    key = hazard_request_key(
+        normalize_process_params(unit, temp, pressure, chemicals, flow_rate, operation_phase, equipment_volume, phase, location, utilities),
+        relevant_docs, operating_envelope, structured
     )
+    return hazard_flights.do(key, analyze)
 
-    return response.choices[0].message["content"]
+def ai_hazard_analysis_stream(unit, temp, pressure, chemicals, flow_rate=None, operation_phase=None, equipment_volume=None, phase=None, location=None, utilities=None):
+    """Yield the hazard-analysis report in pieces as the model produces them.
 
-def chat_analysis(session_id, user_message, current_analysis=None):
-    """Handle conversational analysis and what-if scenarios"""
-    
-    # Get or create session context
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = {
-            'messages': [],
-            'current_analysis': current_analysis,
-            'process_data': None
-        }
-    
-    session = chat_sessions[session_id]
-    
-    # Update current analysis if provided
+    A request identical to one already streaming joins it and replays its
+    output from the start.
+    """
+    def generate():
+        prepared = prepare_hazard_analysis(
+            unit, temp, pressure, chemicals, flow_rate, operation_phase,
+            equipment_volume, phase, location, utilities
+        )
+        if prepared['cached_report'] is not None:
+            yield prepared['cached_report']
+            return
+
+        parts = []
+        for delta in model_stream('hazard', prepared['messages'], 0.3):
+            parts.append(delta)
+            yield delta
+
+        cache_hazard_report(prepared, "".join(parts))
+
+    key = hazard_request_key(
+        normalize_process_params(unit, temp, pressure, chemicals, flow_rate, operation_phase, equipment_volume, phase, location, utilities)
+    )
+    return hazard_flights.stream(key, generate)
+
+# 🏭 Batch analysis for whole flowsheets
+BATCH_MAX_UNITS = int(os.getenv("BATCH_MAX_UNITS", "100"))
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "8"))
+
+def group_by_shared_chemicals(specs):
+    """Group spec indexes into connected components of specs that share at least one chemical"""
+    parent = list(range(len(specs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_seen = {}
+    for i, params in enumerate(specs):
+        for chemical in params['chemicals']:
+            key = chemical.lower()
+            if key in first_seen:
+                parent[find(i)] = find(first_seen[key])
+            else:
+                first_seen[key] = i
+
+    groups = {}
+    for i in range(len(specs)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def retrieve_for_batch(specs):
+    """Retrieve passages for many specs with one candidate-retrieval pass per chemical group.
+
+    Each group is searched once with the union of its members' queries; each
+    spec then ranks only that candidate pool with its own query.
+    """
+    relevant = [None] * len(specs)
+    for group in group_by_shared_chemicals(specs):
+        queries = [
+            hazard_retrieval_query(
+                specs[i]['unit'], specs[i]['chemicals'], specs[i]['operation_phase'],
+                specs[i]['phase'], specs[i]['location']
+            )
+            for i in group
+        ]
+        pool_size = min(200, 20 * len(group))
+        pool = {chunk_id for chunk_id, _ in rank_passages(" ".join(queries), pool_size)}
+        for i, query in zip(group, queries):
+            relevant[i] = get_relevant_documents(
+                query, limit=5, token_budget=HAZARD_CONTEXT_TOKEN_BUDGET, candidates=pool
+            ) if pool else []
+    return relevant
+
+def check_batch_units(unit_specs):
+    """Error message for an unusable units list, or None"""
+    if not isinstance(unit_specs, list) or not unit_specs:
+        return 'units must be a non-empty list'
+    if len(unit_specs) > BATCH_MAX_UNITS:
+        return f'At most {BATCH_MAX_UNITS} units per batch'
+    return None
+
+def plan_hazard_batch(unit_specs):
+    """Parse and deduplicate unit specs.
+
+    Returns (results with invalid specs already filled in, distinct parsed
+    specs, input index -> position in the distinct specs).
+    """
+    results = [None] * len(unit_specs)
+    unique_specs = []      # parsed params, one per distinct spec
+    owners = {}            # normalized spec -> index into unique_specs
+    assignments = {}       # input index -> index into unique_specs
+
+    for i, data in enumerate(unit_specs):
+        try:
+            params = parse_hazard_request(data)
+        except Exception as e:
+            results[i] = {'index': i, 'status': 'error', 'error': f"Invalid unit spec: {e}"}
+            continue
+
+        key = json.dumps(normalize_process_params(**params), sort_keys=True)
+        if key not in owners:
+            owners[key] = len(unique_specs)
+            unique_specs.append(params)
+        assignments[i] = owners[key]
+    return results, unique_specs, assignments
+
+def assemble_hazard_batch(results, unique_specs, assignments, outcomes):
+    """Fill in one result per input spec from the outcome of its distinct spec"""
+    first_index = {}
+    for i, position in assignments.items():
+        result = dict(outcomes[position], index=i, unit=unique_specs[position]['unit'], screening=screen_hazards(unique_specs[position]))
+        if position in first_index:
+            result['duplicateOf'] = first_index[position]
+        else:
+            first_index[position] = i
+        results[i] = result
+    return results
+
+def summarize_hazard_batch(results):
+    """Response body for a batch: the results plus success counts and overall status"""
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    return {
+        'results': results,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'status': 'ok' if failed == 0 else ('failed' if failed == len(results) else 'partial')
+    }
+
+def ai_hazard_analysis_batch(unit_specs, max_parallel=BATCH_MAX_PARALLEL):
+    """Analyze many unit specs at once; returns one result dict per spec, in input order.
+
+    Identical specs (after normalization) are analyzed once, retrieval is
+    shared across specs with overlapping chemicals, and model calls run with
+    bounded parallelism. A failing spec does not fail the others.
+    """
+    results, unique_specs, assignments = plan_hazard_batch(unit_specs)
+
+    try:
+        relevant = retrieve_for_batch(unique_specs)
+    except Exception as e:
+        print(f"Error retrieving documents for batch: {e}")
+        relevant = [None] * len(unique_specs)
+
+    def analyze(position):
+        return ai_hazard_analysis(**unique_specs[position], relevant_docs=relevant[position])
+
+    outcomes = [None] * len(unique_specs)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(unique_specs) or 1))) as pool:
+        # Each unit runs in a copy of the request context, so its model calls queue under the caller's tenant
+        futures = {pool.submit(contextvars.copy_context().run, analyze, position): position for position in range(len(unique_specs))}
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                outcomes[position] = {'status': 'ok', 'report': future.result()}
+            except Exception as e:
+                outcomes[position] = {'status': 'error', 'error': str(e)}
+
+    return assemble_hazard_batch(results, unique_specs, assignments, outcomes)
+
+# 📈 Parameter sweeps (what-if analysis over temperature and pressure)
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "40000"))
+SWEEP_MAX_REGIONS = int(os.getenv("SWEEP_MAX_REGIONS", "12"))
+
+def is_sweep_request(data):
+    """True if temp or pressure is given as a range rather than a single value"""
+    return isinstance(data.get('temp'), (dict, list)) or isinstance(data.get('pressure'), (dict, list))
+
+def parse_sweep_axis(spec, name):
+    """Grid values for one swept field: a number, a list of numbers, or {"start", "stop", "steps"}"""
+    if isinstance(spec, dict):
+        start, stop = float(spec['start']), float(spec['stop'])
+        steps = int(spec.get('steps', 11))
+        if steps < 1:
+            raise ValueError(f"{name}.steps must be at least 1")
+        values = np.linspace(start, stop, steps)
+    elif isinstance(spec, list):
+        values = np.array([float(value) for value in spec])
+    else:
+        values = np.array([float(spec)])
+    if values.size == 0 or not np.all(np.isfinite(values)):
+        raise ValueError(f"{name} must contain finite numbers")
+    return np.unique(values)
+
+def parse_sweep_request(data):
+    """(base params, temperature grid, pressure grid) for a sweep request body"""
+    temps = parse_sweep_axis(data['temp'], 'temp')
+    pressures = parse_sweep_axis(data['pressure'], 'pressure')
+    if temps.size * pressures.size > SWEEP_MAX_POINTS:
+        raise ValueError(f"At most {SWEEP_MAX_POINTS} grid points per sweep")
+    params = parse_hazard_request(dict(data, temp=temps[0], pressure=pressures[0]))
+    return params, temps, pressures
+
+def parse_max_regions(data):
+    """Requested number of sweep regions to analyze; raises ValueError for a non-integer"""
+    value = data.get('maxRegions', SWEEP_MAX_REGIONS)
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("maxRegions must be an integer")
+    return max(0, int(value))
+
+def describe_region(region):
+    """Operating-envelope text for one sweep region"""
+    (t_min, t_max), (p_min, p_max) = region['temp_range'], region['pressure_range']
+    temps = f"{t_min:g} K" if t_min == t_max else f"{t_min:g}-{t_max:g} K"
+    pressures = f"{p_min:g} atm" if p_min == p_max else f"{p_min:g}-{p_max:g} atm"
+    return f"{temps} at {pressures}"
+
+def ai_hazard_analysis_sweep(params, temps, pressures, analyze=True, max_regions=SWEEP_MAX_REGIONS, max_parallel=BATCH_MAX_PARALLEL):
+    """Screen a temperature x pressure grid and analyze each distinct flag region once.
+
+    The rule engine runs over the whole grid with NumPy; grid points raising
+    the same flags form one region, and the model is called once per region
+    (most severe first, up to `max_regions`) at a representative point.
+    """
+    sweep = screen_grid(temps, pressures, params['chemicals'], params['phase'], params['utilities'])
+    regions = sweep['regions']
+    for region in regions:
+        region['envelope'] = describe_region(region)
+        region['status'] = 'screened'
+    if not analyze:
+        return sweep
+
+    # Retrieval does not depend on temperature or pressure, so every region shares it
+    try:
+        relevant_docs = get_relevant_documents(
+            hazard_retrieval_query(params['unit'], params['chemicals'], params['operation_phase'], params['phase'], params['location']),
+            limit=5, token_budget=HAZARD_CONTEXT_TOKEN_BUDGET
+        )
+    except Exception as e:
+        print(f"Error retrieving documents for sweep: {e}")
+        relevant_docs = None
+
+    def analyze_region(region):
+        point = region['representative']
+        return ai_hazard_analysis(**dict(params, temp=point['temp'], pressure=point['pressure']),
+                                  relevant_docs=relevant_docs, operating_envelope=region['envelope'])
+
+    selected = regions[:max(0, max_regions)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(selected) or 1))) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, analyze_region, region): region for region in selected}
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                region['report'] = future.result()
+                region['status'] = 'ok'
+            except Exception as e:
+                region['error'] = str(e)
+                region['status'] = 'error'
+    for region in regions[len(selected):]:
+        region['status'] = 'not_analyzed'
+    return sweep
+
+def load_chat_session(session_id, current_analysis=None):
+    """Load the session for a chat turn, keeping a newly supplied analysis on it"""
     if current_analysis:
-        session['current_analysis'] = current_analysis
+        if isinstance(current_analysis, dict):
+            current_analysis = validate_hazard_report(current_analysis)
+        return session_store.update(session_id, lambda session: session.update(current_analysis=current_analysis))
+    return load_session(session_id)
+
+def prepare_chat_turn(session_id, user_message, current_analysis=None, session=None):
+    """Load the session (unless it is passed in) and build the chat messages for a user turn"""
+    if session is None:
+        session = load_chat_session(session_id, current_analysis)
     
-    # Get relevant documents based on user query
-    relevant_docs = get_relevant_documents(user_message, limit=3)
-    document_context = ""
-    if relevant_docs:
-        document_context = "\n\nRelevant Engineering Documents:\n"
-        for doc in relevant_docs:
-            document_context += f"Document: {doc['filename']}\n{doc['content']}\n\n"
+    # Get relevant documents based on user query; lowest-ranked passages are dropped first
+    relevant_docs = get_relevant_documents(user_message, limit=3, token_budget=CHAT_CONTEXT_TOKEN_BUDGET)
+    relevant_docs = select_passages(relevant_docs, CHAT_CONTEXT_TOKEN_BUDGET)
+    document_context = format_document_context(relevant_docs, "Relevant Engineering Documents")
     
+    # Every section is held to its own token budget so prompt size stays flat as the chat grows
+    prompt_started = time.perf_counter()
+    analysis_context = format_analysis_context(session['current_analysis'], user_message)
+    process_context = truncate_to_tokens(session['process_data'], CHAT_PROCESS_TOKEN_BUDGET)
+    conversation_summary = session.get('summary') or 'No earlier conversation.'
+    conversation_history = "\n".join(
+        format_turn(turn) for turn in select_recent_turns(session['messages'], CHAT_HISTORY_TOKEN_BUDGET)
+    )
+
     # Build context for the AI
     context = f"""
     You are a friendly and knowledgeable process safety engineer having a casual conversation with a colleague about their hazard analysis. Be conversational, use "you" and "we", and make the conversation feel natural and engaging.
     
     Current Analysis Context:
-    {session['current_analysis'] if session['current_analysis'] else 'No current analysis available.'}
+    {analysis_context if analysis_context else 'No current analysis available.'}
     
     Process Data Context:
-    {session['process_data'] if session['process_data'] else 'No process data available.'}
+    {process_context if process_context else 'No process data available.'}
     
     {document_context}
     
+    Summary of Earlier Conversation:
+    {conversation_summary}
+    
     Previous Conversation:
-    {chr(10).join([f"User: {msg['user']}\nAssistant: {msg['assistant']}" for msg in session['messages'][-5:]])}
+    {conversation_history}
     
     User Question: {user_message}
     
@@ -258,86 +1042,921 @@ def chat_analysis(session_id, user_message, current_analysis=None):
     Remember: You're having a conversation, not writing a report. Make it feel natural and engaging while being easy to read!
     """
     
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a friendly and experienced process safety engineer chatting with a colleague. You have deep expertise in chemical engineering and safety, but you communicate in a warm, conversational way. You're here to help them understand their process risks and think through scenarios together. IMPORTANT: Always format your responses with clear section headers and clean, left-aligned bullet points that are completely separate from paragraphs. Never embed bullet points within text. Use simple text formatting - no markdown symbols, asterisks, or hashtags."},
-            {"role": "user", "content": context}
-        ],
-        temperature=0.7
+    messages = [
+        {"role": "system", "content": "You are a friendly and experienced process safety engineer chatting with a colleague. You have deep expertise in chemical engineering and safety, but you communicate in a warm, conversational way. You're here to help them understand their process risks and think through scenarios together. IMPORTANT: Always format your responses with clear section headers and clean, left-aligned bullet points that are completely separate from paragraphs. Never embed bullet points within text. Use simple text formatting - no markdown symbols, asterisks, or hashtags."},
+        {"role": "user", "content": context}
+    ]
+    record_stage('prompt_build', time.perf_counter() - prompt_started)
+    return session, messages
+
+def record_chat_turn(session_id, user_message, assistant_response):
+    """Append a completed exchange to the session history; older turns are summarized in the background"""
+    turn = {'user': user_message, 'assistant': assistant_response}
+    session = session_store.update(session_id, lambda session: session['messages'].append(turn))
+    if turns_to_summarize(session):
+        schedule_chat_summary(session_id)
+    return session
+
+def turns_to_summarize(session):
+    """The oldest turns, once enough have built up to fold into the summary; [] if none are due yet"""
+    turns = session['messages']
+    if len(turns) > CHAT_RECENT_TURNS and (
+        len(turns) >= CHAT_RECENT_TURNS + CHAT_SUMMARY_BATCH or history_tokens(turns) > CHAT_HISTORY_TOKEN_BUDGET
+    ):
+        return turns[:-CHAT_RECENT_TURNS]
+    return []
+
+def fold_chat_summary(session_id, older, previous_summary, summary):
+    """Replace summarized turns with their summary, unless the session changed underneath; returns True if applied"""
+    folded = []
+    def fold(session):
+        # Turns appended (or other fields set) while the summary ran are kept as they are
+        if session['messages'][:len(older)] == older and session.get('summary', '') == previous_summary:
+            session['messages'] = session['messages'][len(older):]
+            session['summary'] = summary
+            folded.append(True)
+    session_store.update(session_id, fold)
+    return bool(folded)
+
+def summarize_chat_session(session_id):
+    """Roll a session's older turns into its summary, off the reply path"""
+    session = load_session(session_id)
+    older = turns_to_summarize(session)
+    if older:
+        previous = session.get('summary', '')
+        fold_chat_summary(session_id, older, previous, summarize_turns(previous, older))
+
+# One background summary per session at a time
+_chat_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary')
+_chat_summaries_running = set()
+_chat_summaries_lock = threading.Lock()
+
+def schedule_chat_summary(session_id):
+    """Summarize the session on a background thread, unless a summary for it is already running"""
+    with _chat_summaries_lock:
+        if session_id in _chat_summaries_running:
+            return
+        _chat_summaries_running.add(session_id)
+    # In the request's context, so the summary's model call is admitted under the same tenant
+    _chat_summary_pool.submit(contextvars.copy_context().run, run_chat_summary, session_id)
+
+def run_chat_summary(session_id):
+    try:
+        summarize_chat_session(session_id)
+    except Exception as e:
+        print(f"Error summarizing chat session {session_id}: {e}")
+    finally:
+        with _chat_summaries_lock:
+            _chat_summaries_running.discard(session_id)
+
+def summarize_turns(summary, turns):
+    """Fold turns into the running conversation summary, falling back to an extractive summary"""
+    try:
+        content = model_complete('summary', build_summary_messages(summary, turns, CHAT_SUMMARY_TOKEN_BUDGET), 0)
+        return truncate_to_tokens(content.strip(), CHAT_SUMMARY_TOKEN_BUDGET)
+    except Exception as e:
+        print(f"Error summarizing conversation, using extractive summary: {e}")
+        return extractive_summary(summary, turns, CHAT_SUMMARY_TOKEN_BUDGET)
+
+# 💬 Chat answer cache: paraphrased questions about the same analysis share one answer (off by default)
+CHAT_ANSWER_CACHE = os.getenv("CHAT_ANSWER_CACHE", "false").lower() in ("1", "true", "yes")
+chat_answer_cache = SemanticAnswerCache(
+    (embedder or create_embedder(EMBEDDING_MODEL)) if CHAT_ANSWER_CACHE else None,
+    max_entries=int(os.getenv("CHAT_ANSWER_CACHE_SIZE", "512")) if CHAT_ANSWER_CACHE else 0,
+    threshold=float(os.getenv("CHAT_ANSWER_CACHE_THRESHOLD", "0.9")),
+    ttl_seconds=float(os.getenv("CHAT_ANSWER_CACHE_TTL_SECONDS", "3600"))
+)
+
+def chat_answer_fingerprint(session, user_message=''):
+    """What an answer depends on besides the question: analysis, process data, documents and chat model.
+
+    A follow-up that refers back ("does that apply to the condenser too?")
+    also depends on the conversation, so its fingerprint includes the rolling
+    summary and recent turns; a question that stands on its own can be
+    answered from any session or point in the conversation.
+    """
+    if not session.get('current_analysis') and not session.get('process_data'):
+        return None
+    conversation = None
+    if is_follow_up(user_message):
+        conversation = [session.get('summary', ''), session.get('messages', [])[-CHAT_RECENT_TURNS:]]
+    payload = json.dumps(
+        [session.get('current_analysis'), session.get('process_data'), conversation, corpus_stamp(), model_router.route_key('chat')],
+        sort_keys=True, default=str
     )
-    
-    assistant_response = response.choices[0].message["content"]
-    
-    # Store the conversation
-    session['messages'].append({
-        'user': user_message,
-        'assistant': assistant_response
-    })
-    
-    # Keep only last 20 messages to manage memory
-    if len(session['messages']) > 20:
-        session['messages'] = session['messages'][-20:]
-    
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cached_chat_answer(session, user_message):
+    """(fingerprint to store the answer under or None, cached answer or None)"""
+    if not chat_answer_cache.enabled or not chat_answer_cache.cacheable(user_message):
+        return None, None
+    fingerprint = chat_answer_fingerprint(session, user_message)
+    if fingerprint is None:
+        return None, None
+    with timed('chat_cache_lookup'):
+        answer = chat_answer_cache.get(fingerprint, user_message)
+    CHAT_ANSWER_LOOKUPS.inc(result='miss' if answer is None else 'hit')
+    return fingerprint, answer
+
+def finish_chat_turn(session_id, user_message, fingerprint, assistant_response):
+    """Cache a fresh answer and record the exchange"""
+    if fingerprint is not None:
+        chat_answer_cache.set(fingerprint, user_message, assistant_response)
+    record_chat_turn(session_id, user_message, assistant_response)
+
+def chat_analysis(session_id, user_message, current_analysis=None):
+    """Handle conversational analysis and what-if scenarios"""
+    session = load_chat_session(session_id, current_analysis)
+    fingerprint, cached = cached_chat_answer(session, user_message)
+    if cached is not None:
+        record_chat_turn(session_id, user_message, cached)
+        return cached
+
+    session, messages = prepare_chat_turn(session_id, user_message, session=session)
+    assistant_response = model_complete('chat', messages, 0.7)
+    finish_chat_turn(session_id, user_message, fingerprint, assistant_response)
     return assistant_response
 
+def chat_analysis_stream(session_id, user_message, current_analysis=None):
+    """Yield the chat reply in pieces; the session is updated once the reply is complete"""
+    session = load_chat_session(session_id, current_analysis)
+    fingerprint, cached = cached_chat_answer(session, user_message)
+    if cached is not None:
+        record_chat_turn(session_id, user_message, cached)
+        yield cached
+        return
+
+    session, messages = prepare_chat_turn(session_id, user_message, session=session)
+    parts = []
+    for delta in model_stream('chat', messages, 0.7):
+        parts.append(delta)
+        yield delta
+
+    finish_chat_turn(session_id, user_message, fingerprint, "".join(parts))
+
+def load_session(session_id):
+    """Fetch a chat session from the session store, or a new empty one"""
+    session = session_store.get(session_id)
+    return session if session is not None else new_session()
+
 def update_session_process_data(session_id, process_data):
     """Update session with current process data for context"""
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = {'messages': [], 'current_analysis': None, 'process_data': None}
-    
-    chat_sessions[session_id]['process_data'] = process_data
+    session_store.update(session_id, lambda session: session.update(process_data=process_data))
+
+def update_session_analysis(session_id, analysis):
+    """Keep a finished report on the session so chat turns can refer to it"""
+    session_store.update(session_id, lambda session: session.update(current_analysis=analysis))
+
+def format_analysis_context(analysis, user_message):
+    """Current analysis for a chat prompt.
+
+    A structured report goes in as one line per hazard/safeguard ID, plus the
+    full text of the items the question names, instead of the whole report.
+    """
+    if not is_hazard_report(analysis):
+        return truncate_to_tokens(analysis, CHAT_ANALYSIS_TOKEN_BUDGET)
+    context = "Refer to hazards and safeguards by their IDs.\n" + hazard_digest(analysis)
+    referenced = referenced_items(analysis, user_message)
+    if referenced:
+        context += f"\n\nItems named in the question:\n{referenced}"
+    return truncate_to_tokens(context, CHAT_ANALYSIS_TOKEN_BUDGET)
+
+# 🧾 Request handling shared by the Flask routes and the async app
+def parse_hazard_request(data):
+    """Pull the hazard-analysis parameters out of a request body"""
+    return {
+        'unit': data['unit'],
+        'temp': float(data['temp']),
+        'pressure': float(data['pressure']),
+        'chemicals': [c.strip() for c in data['chemicals']],
+        'flow_rate': data.get('flowRate'),
+        'operation_phase': data.get('operationPhase'),
+        'equipment_volume': data.get('equipmentVolume'),
+        'phase': data.get('phase'),
+        'location': data.get('location'),
+        'utilities': data.get('utilities', [])
+    }
+
+def wants_structured_report(data):
+    """True if the client asked for the JSON report ("format": "json")"""
+    return str(data.get('format') or '').lower() == 'json'
+
+def parse_report_view_args(data):
+    """filter_hazard_report keyword arguments from a request body"""
+    return {
+        'min_severity': data.get('minSeverity'),
+        'hazard_ids': data.get('hazardIds'),
+        'sort_by': data.get('sortBy')
+    }
+
+# Model route of each endpoint that is rate-limited per tenant
+ADMISSION_ENDPOINTS = {
+    '/api/hazard_analysis': 'hazard',
+    '/api/hazard_analysis/batch': 'hazard',
+    '/api/hazard_analysis/sweep': 'hazard',
+    '/api/hazard_analysis/jobs': 'hazard',
+    '/api/chat': 'chat'
+}
+
+def request_tenant(headers, session_id=None, remote_addr=None):
+    """Who a request counts against: its API key, else its chat session, else its client address"""
+    api_key = headers.get('X-API-Key') or headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    if session_id and session_id != 'default':
+        return f"session:{session_id}"
+    return f"ip:{remote_addr or 'unknown'}"
+
+def admit_request(path, data, tenant):
+    """Apply the tenant's rate limit and the load-shedding budgets; raises AdmissionRejected"""
+    route = ADMISSION_ENDPOINTS[path]
+    if isinstance(data.get('units'), list):
+        calls = len(data['units'])
+    elif is_sweep_request(data):
+        try:
+            calls = parse_max_regions(data) if data.get('analyze', True) else 0
+        except ValueError:
+            # The sweep route rejects the request with a 400; admit it at the default size until then
+            calls = SWEEP_MAX_REGIONS
+    else:
+        calls = 1
+    if route == 'chat':
+        per_call = CHAT_CONTEXT_TOKEN_BUDGET + CHAT_ANALYSIS_TOKEN_BUDGET + CHAT_HISTORY_TOKEN_BUDGET + EXPECTED_REPLY_TOKENS['chat']
+    else:
+        per_call = HAZARD_CONTEXT_TOKEN_BUDGET + 1000 + EXPECTED_REPLY_TOKENS['hazard']
+    admission.admit(tenant, cost=max(1, calls), estimated_tokens=calls * per_call)
+
+def admission_rejection(e):
+    """(body, status, headers) for a shed request: 429 for the tenant's own rate limit, 503 when the server is overloaded"""
+    body = {'error': str(e), 'reason': e.reason, 'retryAfter': math.ceil(e.retry_after)}
+    return body, 429 if e.reason == 'rate_limited' else 503, {'Retry-After': str(math.ceil(e.retry_after))}
+
+def screen_hazards(params):
+    """Rule-engine flags for parsed hazard-request params"""
+    return screen_process(params['temp'], params['pressure'], params['chemicals'], params['phase'], params['utilities'])
+
+def describe_process(params):
+    """Plain-text process summary kept on the chat session for context"""
+    return f"""
+        Unit: {params['unit']}
+        Temperature: {params['temp']} K
+        Pressure: {params['pressure']} atm
+        Chemicals: {', '.join(params['chemicals'])}
+        {f"Flow Rate: {params['flow_rate']}" if params['flow_rate'] else ""}
+        {f"Operation Phase: {params['operation_phase']}" if params['operation_phase'] else ""}
+        {f"Equipment Volume: {params['equipment_volume']}" if params['equipment_volume'] else ""}
+        {f"Phase: {params['phase']}" if params['phase'] else ""}
+        {f"Location: {params['location']}" if params['location'] else ""}
+        {f"Utilities: {', '.join(params['utilities'])}" if params['utilities'] else ""}
+        """
+
+# 📥 Upload ingestion
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+DOCUMENT_PREVIEW_CHARS = 2000
+UPLOAD_PROGRESS_TTL_SECONDS = 3600
+
+upload_progress = {}
+_upload_progress_lock = threading.Lock()
+
+def report_upload_progress(upload_id, **fields):
+    """Record how far an upload has got, dropping entries for uploads that finished long ago"""
+    if not upload_id:
+        return
+    now = time.time()
+    with _upload_progress_lock:
+        entry = upload_progress.setdefault(upload_id, {'upload_id': upload_id, 'status': 'extracting'})
+        entry.update(fields, updated_at=now)
+        for stale_id in [key for key, value in upload_progress.items() if now - value['updated_at'] > UPLOAD_PROGRESS_TTL_SECONDS]:
+            del upload_progress[stale_id]
+
+def get_upload_progress(upload_id):
+    with _upload_progress_lock:
+        entry = upload_progress.get(upload_id)
+        return dict(entry) if entry is not None else None
+
+def spool_request_file(stream, filename):
+    """Copy an upload to a temp file so it is never held in memory whole; returns (path, size, content hash)"""
+    with timed('upload_spool'):
+        return spool_upload(stream, directory=UPLOAD_SPOOL_DIR, suffix=os.path.splitext(filename)[1])
+
+def reusable_pdf_pages(path, document_id, old_chunks):
+    """Text of the pages a revised PDF shares with its previous version, keyed by new page number.
+
+    Page text is cut back out of the stored passages and only reused when it
+    matches the text hash recorded at the last upload.
+    """
+    try:
+        old_pages = get_document_store().fetch_pages(document_id)
+    except Exception as e:
+        print(f"Error fetching document pages: {e}")
+        return {}
+    if not old_pages or not old_chunks:
+        return {}
+
+    old_text = rebuild_text(old_chunks)
+    by_hash = {}
+    for page in old_pages:
+        if page['page_hash'] and page['page_hash'] not in by_hash:
+            text = old_text[page['start_offset']:page['end_offset']]
+            if text_hash(text) == page['text_hash']:
+                by_hash[page['page_hash']] = text
+
+    known_pages = {}
+    for number, page_hash in enumerate(pdf_page_hashes(path)):
+        text = by_hash.get(page_hash)
+        if text is not None:
+            # Stored spans include the newline added after each page
+            known_pages[number] = (page_hash, text[:-1])
+    return known_pages
+
+def chunk_signature(chunk):
+    if chunk is None:
+        return None
+    return chunk['start_offset'], chunk['end_offset'], chunk['content']
+
+def store_document_pages(document_id, pages):
+    """Replace a document's page hashes, used to find unchanged pages in its next revision"""
+    try:
+        get_document_store().replace_pages(document_id, pages)
+    except Exception as e:
+        print(f"Error storing document pages: {e}")
+
+# Share of unchanged pages or passages needed before a same-named upload counts as a new version of a document
+REVISION_MIN_OVERLAP = float(os.getenv("REVISION_MIN_OVERLAP", "0.5"))
+
+def revision_overlap(old_chunks, chunks, known_pages, pages):
+    """Share of the smaller version's passages (or the new PDF's pages) found unchanged in the other"""
+    overlap = len(known_pages) / len(pages) if pages else 0.0
+    if old_chunks and chunks:
+        old_contents = {chunk['content'] for chunk in old_chunks.values()}
+        shared = sum(1 for chunk in chunks if chunk['content'] in old_contents)
+        overlap = max(overlap, shared / min(len(old_chunks), len(chunks)))
+    return overlap
+
+def save_uploaded_document(path, filename, file_size, content_hash, upload_id=None, replaces_id=None):
+    """Extract, store and index a spooled upload page by page; returns (response body, status code)
+
+    Pages flow straight into the chunker and chunks are written in batches,
+    so memory holds a few pages plus the pending batch, not the whole file.
+    The documents row keeps a preview; the full text lives in document_chunks.
+
+    An upload identical to a stored document is a no-op. An upload naming a
+    document in `replaces_id`, or sharing enough pages or passages with one of
+    the latest documents of the same filename, is a new version of it: unchanged
+    PDF pages are not re-extracted and unchanged passages are neither
+    rewritten nor re-embedded. A new version is only written once extraction
+    has finished, so a failed upload leaves the stored version untouched.
+    """
+    with timed('upload_lookup'):
+        duplicate = get_document_store().find_by_hash(content_hash)
+    if duplicate is not None:
+        report_upload_progress(upload_id, status='done', document_id=duplicate['id'], duplicate=True)
+        return {
+            'message': 'Document already uploaded',
+            'document_id': duplicate['id'],
+            'filename': duplicate.get('filename', filename),
+            'duplicate': True
+        }, 200
+
+    with timed('upload_lookup'):
+        candidates = get_document_store().find_previous_versions(filename, replaces_id)
+        previous = candidates[0] if candidates else None
+        chunks_by_doc = fetch_document_chunks([candidate['id'] for candidate in candidates]) if candidates else {}
+        old_chunks = {}
+        known_pages = {}
+        if previous is not None:
+            old_chunks = {chunk['chunk_index']: chunk for chunk in chunks_by_doc.get(previous['id'], [])}
+            if filename.lower().endswith('.pdf'):
+                known_pages = reusable_pdf_pages(path, previous['id'], list(old_chunks.values()))
+
+    chunker = StreamingChunker()
+    preview = ""
+    content_length = 0
+    pending = []
+    chunks = []
+    pages = []
+    changed_chunks = 0
+    stored = None
+
+    def doc_data():
+        return {
+            'filename': filename,
+            'content': preview,
+            'file_size': file_size,
+            'content_length': content_length,
+            'content_hash': content_hash
+        }
+
+    def on_page(done, total):
+        report_upload_progress(upload_id, pages_done=done, pages_total=total, chunk_count=len(chunks) + len(pending))
+
+    def flush():
+        nonlocal stored
+        if previous is not None:
+            # A possible new version is held back until it is complete and confirmed
+            chunks.extend(pending)
+            pending.clear()
+            return
+        started = time.perf_counter()
+        if stored is None:
+            # Store document metadata once there is text to keep
+            stored = get_document_store().insert_document(doc_data())
+        if stored.get('id') and pending:
+            store_document_chunks(stored['id'], pending)
+        chunks.extend(pending)
+        pending.clear()
+        record_stage('upload_store', time.perf_counter() - started)
+
+    report_upload_progress(upload_id, status='extracting', filename=filename)
+    extraction_failed = False
+    try:
+        pages_iter = iter_document_pages(path, filename, workers=EXTRACTION_WORKERS, progress=on_page, known_pages=known_pages)
+        # Only the waits on the extractor count as extraction; flush() times the writes
+        for page_hash, page in timed_iter(pages_iter, 'upload_extract'):
+            if page_hash is not None:
+                pages.append({
+                    'page_number': len(pages),
+                    'page_hash': page_hash,
+                    'text_hash': text_hash(page),
+                    'start_offset': content_length,
+                    'end_offset': content_length + len(page)
+                })
+            content_length += len(page)
+            if len(preview) < DOCUMENT_PREVIEW_CHARS:
+                preview += page[:DOCUMENT_PREVIEW_CHARS - len(preview)]
+            pending.extend(chunker.feed(page))
+            if len(pending) >= DOCUMENT_SYNC_PAGE_SIZE:
+                flush()
+    except Exception as e:
+        # A new document keeps what was already stored; a new version is never half-applied
+        print(f"Error extracting document text: {e}")
+        extraction_failed = True
+        if stored is None:
+            preview = ""
+    pending.extend(chunker.finish())
+
+    if extraction_failed and previous is not None:
+        report_upload_progress(upload_id, status='failed', error='Could not extract the whole document')
+        return {'error': 'Could not extract the whole document; the stored version was kept'}, 400
+    if not preview.strip() or not (pending or chunks):
+        report_upload_progress(upload_id, status='failed', error='Could not extract text from document')
+        return {'error': 'Could not extract text from document'}, 400
+
+    flush()
+    if previous is not None and not replaces_id:
+        # Same filename is only a hint: pick the stored document this one overlaps most
+        overlaps = []
+        for candidate in candidates:
+            candidate_chunks = {chunk['chunk_index']: chunk for chunk in chunks_by_doc.get(candidate['id'], [])}
+            candidate_pages = known_pages if candidate is previous else {}
+            overlaps.append((revision_overlap(candidate_chunks, chunks, candidate_pages, pages), candidate, candidate_chunks))
+        overlap, best, best_chunks = max(overlaps, key=lambda item: item[0])
+        if best is not previous:
+            known_pages = {}
+        previous, old_chunks = (best, best_chunks) if overlap >= REVISION_MIN_OVERLAP else (None, {})
+        if previous is None:
+            # A different document that happens to share the name: store it alongside
+            pending, chunks = chunks, []
+            flush()
+
+    if previous is not None:
+        started = time.perf_counter()
+        changed = [chunk for chunk in chunks if chunk_signature(old_chunks.get(chunk['chunk_index'])) != chunk_signature(chunk)]
+        changed_chunks = len(changed)
+        stored = get_document_store().replace_version(previous['id'], doc_data(), changed, len(chunks), pages)
+        record_stage('upload_store', time.perf_counter() - started)
+    elif pages:
+        store_document_pages(stored['id'], pages)
+
+    if stored.get('id'):
+        if previous is None and stored.get('content_length') != content_length:
+            get_document_store().update_document(stored['id'], {'content_length': content_length})
+        # Index the passages right away so they are searchable without a resync
+        with timed('upload_index'):
+            index_document(stored['id'], filename, chunks, stored.get('upload_date', ''))
+            save_document_index()
+        warm_chemical_knowledge()
+    report_upload_progress(upload_id, status='done', chunk_count=len(chunks), document_id=stored.get('id'))
+
+    body = {
+        'message': 'Document uploaded successfully',
+        'document_id': stored.get('id', 'unknown'),
+        'filename': filename,
+        'chunk_count': len(chunks),
+        'content_preview': preview[:500] + '...' if content_length > 500 else preview
+    }
+    if previous is not None:
+        body.update(message='Document revision uploaded', revision=True,
+                    pages_reused=len(known_pages), chunks_changed=changed_chunks)
+    return body, 200
+
+# Metadata only; the content preview is never needed by the list
+DOCUMENT_LIST_COLUMNS = 'id, filename, upload_date, file_size, content_length'
+DOCUMENT_LIST_DEFAULT_LIMIT = 50
+DOCUMENT_LIST_MAX_LIMIT = 200
+
+def encode_document_cursor(row):
+    """Opaque cursor pointing just past a row in (upload_date desc, id desc) order"""
+    return base64.urlsafe_b64encode(json.dumps([row.get('upload_date') or '', row['id']]).encode()).decode()
+
+def decode_document_cursor(cursor):
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return parse_list_cursor(after)
+
+def parse_document_list_args(args):
+    """Validated keyword arguments for fetch_document_list from query parameters"""
+    limit = int(args.get('limit', DOCUMENT_LIST_DEFAULT_LIMIT))
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return {
+        'limit': min(limit, DOCUMENT_LIST_MAX_LIMIT),
+        'cursor': args.get('cursor') or None,
+        'filename': args.get('filename') or None,
+        'uploaded_after': args.get('uploadedAfter') or None,
+        'uploaded_before': args.get('uploadedBefore') or None
+    }
+
+def fetch_document_list(limit=DOCUMENT_LIST_DEFAULT_LIMIT, cursor=None, filename=None, uploaded_after=None, uploaded_before=None):
+    """Return one page of the document list, newest first, with the total number of matching documents
+
+    Pages are keyed on (upload_date, id) rather than offsets, so each page
+    costs the same however deep the client has paged and concurrent uploads
+    do not shift rows between pages.
+    """
+    after = decode_document_cursor(cursor) if cursor else None
+    # One extra row tells whether another page follows; the total is counted by the store, not by fetching rows
+    rows, total_count = get_document_store().list_documents(
+        DOCUMENT_LIST_COLUMNS, limit + 1, after=after, filename=filename,
+        uploaded_after=uploaded_after, uploaded_before=uploaded_before, count=True
+    )
+
+    documents = []
+    for doc in rows[:limit]:
+        documents.append({
+            'id': doc['id'],
+            'filename': doc.get('filename', ''),
+            'upload_date': doc.get('upload_date', ''),
+            'file_size': doc.get('file_size', 0),
+            'content_length': doc.get('content_length', 0)
+        })
+
+    return {
+        'documents': documents,
+        'next_cursor': encode_document_cursor(rows[limit - 1]) if len(rows) > limit else None,
+        'total_count': total_count
+    }
+
+def document_list_validators(body):
+    """(ETag, Last-Modified datetime or None) for a document list page"""
+    etag = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    last_modified = None
+    for doc in body['documents']:
+        try:
+            uploaded = datetime.fromisoformat(doc['upload_date'].replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            continue
+        if uploaded.tzinfo is None:
+            uploaded = uploaded.replace(tzinfo=timezone.utc)
+        if last_modified is None or uploaded > last_modified:
+            last_modified = uploaded
+    return etag, last_modified
+
+# ⏳ Background Jobs
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "hazard_jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+JOB_EVENTS_TIMEOUT_SECONDS = float(os.getenv("JOB_EVENTS_TIMEOUT_SECONDS", "900"))
+
+_job_queue = None
+_job_workers = None
+_job_lock = threading.Lock()
+
+def run_hazard_analysis_job(payload):
+    with tenant_context(payload.get('tenant')):
+        return analyze_hazard_job(payload)
+
+def analyze_hazard_job(payload):
+    params = parse_hazard_request(payload)
+    if wants_structured_report(payload):
+        report = ai_hazard_analysis(**params, structured=True)
+        return {'report': render_hazard_report(report), 'structured': report, 'screening': screen_hazards(params)}
+    return {'report': ai_hazard_analysis(**params), 'screening': screen_hazards(params)}
+
+def run_hazard_analysis_batch_job(payload):
+    with tenant_context(payload.get('tenant')):
+        return {'results': ai_hazard_analysis_batch(payload['units'])}
+
+def run_hazard_analysis_sweep_job(payload):
+    params, temps, pressures = parse_sweep_request(payload)
+    with tenant_context(payload.get('tenant')):
+        return {'sweep': ai_hazard_analysis_sweep(params, temps, pressures, payload.get('analyze', True),
+                                                  parse_max_regions(payload))}
+
+def is_retryable_job_error(e):
+    """Transient model errors and a full admission queue are retried with backoff"""
+    return isinstance(e, AdmissionRejected) or is_transient_error(e)
+
+def get_job_queue():
+    """Open the job queue and start this process's worker threads on first use"""
+    global _job_queue, _job_workers
+    with _job_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(JOB_QUEUE_PATH)
+            _job_workers = JobWorkerPool(
+                _job_queue,
+                {
+                    'hazard_analysis': run_hazard_analysis_job,
+                    'hazard_analysis_batch': run_hazard_analysis_batch_job,
+                    'hazard_analysis_sweep': run_hazard_analysis_sweep_job
+                },
+                workers=JOB_WORKERS,
+                is_transient=is_retryable_job_error
+            )
+            _job_workers.start()
+            _job_queue.prune(JOB_RETENTION_SECONDS)
+        return _job_queue
+
+def hazard_job_kind(data):
+    """Job kind for a jobs request body; malformed specs are rejected now rather than in the worker"""
+    if 'units' in data:
+        error = check_batch_units(data['units'])
+        if error:
+            raise ValueError(error)
+        return 'hazard_analysis_batch'
+    if is_sweep_request(data):
+        parse_sweep_request(data)
+        return 'hazard_analysis_sweep'
+    parse_hazard_request(data)
+    return 'hazard_analysis'
+
+def submit_hazard_job(kind, data, tenant):
+    """Queue a job and return the response body pointing at it"""
+    job_id = get_job_queue().submit(kind, dict(data, tenant=tenant), max_attempts=JOB_MAX_ATTEMPTS)
+    return {
+        'jobId': job_id,
+        'status': 'queued',
+        'statusUrl': f'/api/jobs/{job_id}',
+        'eventsUrl': f'/api/jobs/{job_id}/events'
+    }
+
+def describe_job(job):
+    """Public view of a job record"""
+    return {
+        'jobId': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'result': job['result'],
+        'error': job['error'],
+        'createdAt': job['created_at'],
+        'updatedAt': job['updated_at']
+    }
+
+# Inventory entries are built while the first requests arrive
+warm_chemical_knowledge()
 
 # --- Flask API ---
 app = Flask(__name__)
 CORS(app)
 
-# Global session storage for chat context
-chat_sessions = {}
+# 📊 Per-stage latency metrics (/metrics) and an optional Server-Timing header on every response
+TIMING_HEADER = os.getenv("TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+
+@app.before_request
+def start_request_timing():
+    g.metrics_token = begin_request()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_timing(response):
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint, status=response.status_code)
+        if TIMING_HEADER:
+            # Streamed responses only carry the stages finished before the first byte
+            response.headers['Server-Timing'] = server_timing_header(dict(current_timings(), total=time.perf_counter() - started))
+    return response
+
+@app.before_request
+def admit_model_request():
+    """Per-tenant rate limiting and load shedding for the endpoints that call the model"""
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    g.tenant = request_tenant(request.headers, data.get('sessionId'), request.remote_addr)
+    set_current_tenant(g.tenant)
+    if request.method != 'POST' or request.url_rule is None or request.url_rule.rule not in ADMISSION_ENDPOINTS:
+        return None
+    try:
+        admit_request(request.url_rule.rule, data, g.tenant)
+    except AdmissionRejected as e:
+        body, status, headers = admission_rejection(e)
+        return jsonify(body), status, headers
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    """Admission control counters, queue depth and the current model concurrency limit"""
+    return jsonify(admission.stats())
+
+@app.route('/api/chemical_knowledge', methods=['GET'])
+def chemical_knowledge_api():
+    """Precomputed entries for ?chemicals=a,b,... (names, formulas or CAS numbers) and cache counters"""
+    return jsonify(chemical_knowledge_lookup(request.args.get('chemicals', '')))
+
+@app.teardown_request
+def end_request_timing(error=None):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        end_request(token)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    """Prometheus metrics for this process"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Session storage for chat context: per-process LRU (memory) or shared across workers (sqlite)
+session_store = create_session_store(
+    os.getenv("SESSION_STORE", "memory").lower(),
+    path=os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "hazard_sessions.db")),
+    idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "86400")),
+    max_sessions=int(os.getenv("SESSION_MAX_COUNT", "1000")),
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+# 📡 Server-Sent Events streaming
+def wants_stream(data):
+    """True if the client asked for a streamed response (?stream=1 or "stream": true)"""
+    return bool(data.get('stream')) or request.args.get('stream') in ('1', 'true')
+
+def sse_event(payload, event=None):
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+def sse_response(chunks, result_field, extra=None, preliminary=None):
+    """Stream text chunks as `delta` events, then a `done` event carrying the full text.
+
+    `preliminary` is a list of (event, payload) pairs sent before the first
+    chunk. Errors raised mid-stream are reported as an `error` event since
+    the 200 status has already been sent.
+    """
+    def generate():
+        parts = []
+        try:
+            for event, payload in preliminary or []:
+                yield sse_event(payload, event=event)
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event({'delta': chunk})
+            yield sse_event(dict(extra or {}, **{result_field: "".join(parts)}), event='done')
+        except Exception as e:
+            print(f"Error while streaming response: {e}")
+            yield sse_event({'error': str(e)}, event='error')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/hazard_analysis', methods=['POST'])
 def hazard_analysis_api():
     data = request.json
     try:
-        unit = data['unit']
-        temp = float(data['temp'])
-        pressure = float(data['pressure'])
-        chemicals = [c.strip() for c in data['chemicals']]
-        
-        # Extract new optional fields
-        flow_rate = data.get('flowRate')
-        operation_phase = data.get('operationPhase')
-        equipment_volume = data.get('equipmentVolume')
-        phase = data.get('phase')
-        location = data.get('location')
-        utilities = data.get('utilities', [])
-        
-        report = ai_hazard_analysis(
-            unit, temp, pressure, chemicals, 
-            flow_rate, operation_phase, equipment_volume, 
-            phase, location, utilities
-        )
+        params = parse_hazard_request(data)
         
         # Update chat session with process data for context
         session_id = data.get('sessionId', 'default')
-        process_data = f"""
-        Unit: {unit}
-        Temperature: {temp} K
-        Pressure: {pressure} atm
-        Chemicals: {', '.join(chemicals)}
-        {f"Flow Rate: {flow_rate}" if flow_rate else ""}
-        {f"Operation Phase: {operation_phase}" if operation_phase else ""}
-        {f"Equipment Volume: {equipment_volume}" if equipment_volume else ""}
-        {f"Phase: {phase}" if phase else ""}
-        {f"Location: {location}" if location else ""}
-        {f"Utilities: {', '.join(utilities)}" if utilities else ""}
-        """
-        update_session_process_data(session_id, process_data)
+        update_session_process_data(session_id, describe_process(params))
+        
+        # The rule engine answers in microseconds, so streamed clients get its flags before the model starts
+        screening = screen_hazards(params)
+        structured = wants_structured_report(data)
+        if wants_stream(data):
+            if structured:
+                return jsonify({'error': 'Streaming is not available for the JSON report format'}), 400
+            return sse_response(ai_hazard_analysis_stream(**params), 'report', {'screening': screening},
+                                preliminary=[('screening', screening)])
+        
+        if structured:
+            report = ai_hazard_analysis(**params, structured=True)
+            update_session_analysis(session_id, report)
+            return jsonify({'report': render_hazard_report(report), 'structured': report, 'screening': screening})
+        
+        report = ai_hazard_analysis(**params)
+        return jsonify({'report': report, 'screening': screening})
+    except AdmissionRejected as e:
+        body, status, headers = admission_rejection(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/hazard_report/view', methods=['POST'])
+def hazard_report_view_api():
+    """Filter, sort and re-render a structured report without a model call"""
+    data = request.json
+    try:
+        report = filter_hazard_report(validate_hazard_report(data['report']), **parse_report_view_args(data))
+        return jsonify({'report': render_hazard_report(report), 'structured': report})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/hazard_screening', methods=['POST'])
+def hazard_screening_api():
+    """Instant rule-based pre-screening, without retrieval or a model call"""
+    try:
+        return jsonify({'screening': screen_hazards(parse_hazard_request(request.json))})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/hazard_analysis/batch', methods=['POST'])
+def hazard_analysis_batch_api():
+    """Analyze every unit of a flowsheet in one request"""
+    data = request.json
+    try:
+        unit_specs = data['units']
+        error = check_batch_units(unit_specs)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        return jsonify(summarize_hazard_batch(ai_hazard_analysis_batch(unit_specs)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/hazard_analysis/sweep', methods=['POST'])
+def hazard_analysis_sweep_api():
+    """What-if analysis over temperature and pressure ranges: one model call per distinct flag region"""
+    data = request.json
+    try:
+        params, temps, pressures = parse_sweep_request(data)
+        sweep = ai_hazard_analysis_sweep(params, temps, pressures, data.get('analyze', True),
+                                         parse_max_regions(data))
+        return jsonify({'sweep': sweep})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/hazard_analysis/jobs', methods=['POST'])
+def submit_hazard_analysis_job():
+    """Queue a hazard analysis (a batch with "units", or a sweep with temp/pressure ranges) and return its job ID immediately"""
+    data = request.json
+    try:
+        kind = hazard_job_kind(data)
+        if kind == 'hazard_analysis':
+            update_session_process_data(data.get('sessionId', 'default'), describe_process(parse_hazard_request(data)))
         
-        return jsonify({'report': report})
+        return jsonify(submit_hazard_job(kind, data, g.tenant)), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job's status and result"""
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(describe_job(job))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Subscribe to a job's status changes as Server-Sent Events"""
+    queue = get_job_queue()
+    if queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        last_seen = None
+        deadline = time.time() + JOB_EVENTS_TIMEOUT_SECONDS
+        while time.time() < deadline:
+            job = queue.get(job_id)
+            if job is None:
+                yield sse_event({'error': 'Job not found'}, event='error')
+                return
+            state = (job['status'], job['attempts'])
+            if job['status'] in TERMINAL_STATUSES:
+                yield sse_event(describe_job(job), event='done')
+                return
+            if state != last_seen:
+                last_seen = state
+                yield sse_event(describe_job(job), event='status')
+            time.sleep(1.0)
+        yield sse_event({'error': 'Timed out waiting for job'}, event='error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/chat', methods=['POST'])
 def chat_api():
     data = request.json
@@ -346,21 +1965,32 @@ def chat_api():
         user_message = data['message']
         current_analysis = data.get('currentAnalysis')
         
-        # Update session with current analysis if provided
-        if current_analysis:
+        # Update session with current analysis if provided (a structured report is kept by prepare_chat_turn)
+        if current_analysis and not is_hazard_report(current_analysis):
             update_session_process_data(session_id, current_analysis)
         
+        if wants_stream(data):
+            chunks = chat_analysis_stream(session_id, user_message, current_analysis)
+            return sse_response(chunks, 'response', {'sessionId': session_id})
+        
         response = chat_analysis(session_id, user_message, current_analysis)
         return jsonify({'response': response, 'sessionId': session_id})
+    except AdmissionRejected as e:
+        body, status, headers = admission_rejection(e)
+        return jsonify(body), status, headers
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/chat/cache', methods=['GET'])
+def chat_cache_stats():
+    """Chat answer cache hit/miss counters"""
+    return jsonify(chat_answer_cache.stats())
+
 @app.route('/api/chat/session/<session_id>', methods=['DELETE'])
 def clear_chat_session(session_id):
     """Clear a specific chat session"""
     try:
-        if session_id in chat_sessions:
-            del chat_sessions[session_id]
+        session_store.delete(session_id)
         return jsonify({'message': 'Session cleared'})
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -369,7 +1999,7 @@ def clear_chat_session(session_id):
 def upload_document():
     """Upload and process engineering documents"""
     try:
-        if supabase is None:
+        if get_document_store() is None:
             return jsonify({'error': 'Document storage temporarily unavailable. Please try again later.'}), 503
         
         if 'file' not in request.files:
@@ -379,58 +2009,45 @@ def upload_document():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Read file content
-        file_content = file.read()
-        filename = file.filename
-        
-        # Extract text from the document
-        extracted_text = extract_text_from_file(file_content, filename)
-        
-        if not extracted_text:
-            return jsonify({'error': 'Could not extract text from document'}), 400
-        
-        # Store document metadata in Supabase
-        doc_data = {
-            'filename': filename,
-            'content': extracted_text,
-            'upload_date': 'now()',
-            'file_size': len(file_content),
-            'content_length': len(extracted_text)
-        }
-        
-        # Save to Supabase
-        response = supabase.table('documents').insert(doc_data).execute()
-        
-        return jsonify({
-            'message': 'Document uploaded successfully',
-            'document_id': response.data[0]['id'] if response.data else 'unknown',
-            'filename': filename,
-            'content_preview': extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text
-        })
+        upload_id = request.form.get('uploadId')
+        replaces_id = request.form.get('replacesDocumentId')
+        path, file_size, content_hash = spool_request_file(file.stream, file.filename)
+        try:
+            body, status = save_uploaded_document(path, file.filename, file_size, content_hash, upload_id, replaces_id)
+        finally:
+            os.remove(path)
+        return jsonify(body), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/upload-document/progress/<upload_id>', methods=['GET'])
+def upload_document_progress(upload_id):
+    """Extraction progress for an upload started with an uploadId form field"""
+    progress = get_upload_progress(upload_id)
+    if progress is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(progress)
+
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
-    """List all uploaded documents"""
+    """List uploaded documents a page at a time"""
     try:
-        if supabase is None:
+        if get_document_store() is None:
             return jsonify({'error': 'Document storage temporarily unavailable. Please try again later.'}), 503
         
-        response = supabase.table('documents').select('*').order('upload_date', desc=True).execute()
+        body = fetch_document_list(**parse_document_list_args(request.args))
         
-        documents = []
-        for doc in response.data:
-            documents.append({
-                'id': doc['id'],
-                'filename': doc.get('filename', ''),
-                'upload_date': doc.get('upload_date', ''),
-                'file_size': doc.get('file_size', 0),
-                'content_length': doc.get('content_length', 0)
-            })
-        
-        return jsonify({'documents': documents})
+        # Lets the frontend revalidate with If-None-Match / If-Modified-Since and get a bodiless 304
+        etag, last_modified = document_list_validators(body)
+        response = jsonify(body)
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def new_session():
+    """Empty chat session"""
+    return {'messages': [], 'summary': '', 'current_analysis': None, 'process_data': None}
+
+
+class MemorySessionStore:
+    """Per-process LRU session store with idle-TTL expiry and count/size caps.
+
+    Sessions are kept in access order, so both expired and least recently
+    used sessions sit at the front and eviction is O(1) per session.
+    """
+
+    def __init__(self, max_sessions=1000, idle_ttl_seconds=86400, max_bytes=64 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._sessions = OrderedDict()   # session_id -> (last_access, session, size in bytes)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return a copy of the session, or None if it is missing or idle-expired"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (now, entry[1], entry[2])
+            self._sessions.move_to_end(session_id)
+            return json.loads(entry[1])
+
+    def save(self, session_id, session):
+        """Store the session, evicting idle and least recently used sessions to stay within the caps"""
+        data = json.dumps(session)
+        with self._lock:
+            self._store(session_id, data)
+
+    def update(self, session_id, mutate):
+        """Apply mutate(session) to the stored (or a new) session atomically and return the result"""
+        with self._lock:
+            self._expire(time.time())
+            entry = self._sessions.get(session_id)
+            session = json.loads(entry[1]) if entry is not None else new_session()
+            mutate(session)
+            self._store(session_id, json.dumps(session))
+            return session
+
+    def _store(self, session_id, data):
+        """Caller holds the lock"""
+        size = len(data)
+        now = time.time()
+        previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self.total_bytes -= previous[2]
+        self._sessions[session_id] = (now, data, size)
+        self.total_bytes += size
+
+        self._expire(now)
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._sessions.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+
+    def _expire(self, now):
+        cutoff = now - self.idle_ttl_seconds
+        while self._sessions:
+            session_id, (last_access, _, size) = next(iter(self._sessions.items()))
+            if last_access >= cutoff:
+                break
+            del self._sessions[session_id]
+            self.total_bytes -= size
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Session store in a local SQLite database (WAL mode), shared by every worker on the host"""
+
+    def __init__(self, path, idle_ttl_seconds=86400, prune_interval_seconds=300):
+        self.path = path
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.prune_interval_seconds = prune_interval_seconds
+        self._last_prune = 0.0
+        self._local = threading.local()
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        db.execute('CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions(updated_at)')
+
+    def _db(self):
+        # sqlite3 connections must not be shared across threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def get(self, session_id):
+        """Return the session, or None if it is missing or idle-expired"""
+        now = time.time()
+        row = self._db().execute(
+            'SELECT data FROM chat_sessions WHERE id = ? AND updated_at >= ?',
+            (session_id, now - self.idle_ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db().execute('UPDATE chat_sessions SET updated_at = ? WHERE id = ?', (now, session_id))
+        return json.loads(row[0])
+
+    def save(self, session_id, session):
+        now = time.time()
+        self._db().execute(
+            'INSERT OR REPLACE INTO chat_sessions (id, data, updated_at) VALUES (?, ?, ?)',
+            (session_id, json.dumps(session), now)
+        )
+        if now - self._last_prune > self.prune_interval_seconds:
+            self._last_prune = now
+            self._db().execute('DELETE FROM chat_sessions WHERE updated_at < ?', (now - self.idle_ttl_seconds,))
+
+    def update(self, session_id, mutate):
+        """Apply mutate(session) to the stored (or a new) session in one write transaction and return the result"""
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT data FROM chat_sessions WHERE id = ? AND updated_at >= ?',
+                (session_id, now - self.idle_ttl_seconds)
+            ).fetchone()
+            session = json.loads(row[0]) if row is not None else new_session()
+            mutate(session)
+            db.execute(
+                'INSERT OR REPLACE INTO chat_sessions (id, data, updated_at) VALUES (?, ?, ?)',
+                (session_id, json.dumps(session), now)
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return session
+
+    def delete(self, session_id):
+        self._db().execute('DELETE FROM chat_sessions WHERE id = ?', (session_id,))
+
+
+def create_session_store(kind='memory', path=None, idle_ttl_seconds=86400, max_sessions=1000, max_bytes=64 * 1024 * 1024):
+    """Build the session store named by `kind` ('memory' or 'sqlite')"""
+    if kind == 'sqlite':
+        return SQLiteSessionStore(path, idle_ttl_seconds=idle_ttl_seconds)
+    if kind != 'memory':
+        print(f"Warning: unknown session store '{kind}', using memory")
+    return MemorySessionStore(max_sessions=max_sessions, idle_ttl_seconds=idle_ttl_seconds, max_bytes=max_bytes)
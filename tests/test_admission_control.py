@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from admission_control import AdmissionController, AdmissionRejected
+
+
+def test_async_slots_share_the_fair_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, min_concurrency=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def call(tenant, name):
+            async with controller.async_slot(tenant, 100):
+                order.append(name)
+                await gate.wait()
+
+        # A holds the only slot; A's backlog is queued before B's single call
+        tasks = [asyncio.ensure_future(call('a', 'a0'))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.ensure_future(call('a', f'a{i}')) for i in range(1, 4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call('b', 'b0')))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order.index('b0') <= 2
+    assert stats['active'] == 0 and stats['queued'] == 0 and stats['committed_tokens'] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, min_concurrency=1)
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.async_slot('a'):
+                holding.set()
+                await release.wait()
+
+        async def wait_turn():
+            async with controller.async_slot('b'):
+                pass
+
+        holder = asyncio.ensure_future(hold())
+        await holding.wait()
+        waiter = asyncio.ensure_future(wait_turn())
+        await asyncio.sleep(0.01)
+        assert controller.stats()['queued'] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        await holder
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['active'] == 0 and stats['queued'] == 0
+
+
+def test_async_waiter_times_out_with_rejection():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, min_concurrency=1, max_wait_seconds=0.05)
+        async with controller.async_slot('a'):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.async_slot('b'):
+                    pass
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.reason == 'queue_timeout'
+    assert stats['queue_timeout'] == 1 and stats['active'] == 0 and stats['queued'] == 0
+
+
+def test_upstream_rate_limit_shrinks_the_async_limit():
+    controller = AdmissionController(max_concurrency=8, min_concurrency=2)
+    controller.record_upstream(rate_limited=True)
+    assert controller.stats()['concurrency'] == 4
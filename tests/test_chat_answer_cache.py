@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp()
+os.environ.update({
+    'MODEL_PROVIDER': 'mock',
+    'MOCK_LATENCY_SECONDS': '0',
+    'MOCK_TOKENS_PER_SECOND': '100000',
+    'CHAT_ANSWER_CACHE': '1',
+    'ADMISSION_CONTROL': '0',
+    'SESSION_STORE': 'memory',
+    'DOCUMENT_STORE': 'sqlite',
+    'DOCUMENT_STORE_PATH': os.path.join(_workdir, 'documents.db'),
+    'DOCUMENT_INDEX_PATH': os.path.join(_workdir, 'document_index.json'),
+    'CHEMICAL_KNOWLEDGE_PATH': os.path.join(_workdir, 'chemical_knowledge.db'),
+    'JOB_QUEUE_PATH': os.path.join(_workdir, 'jobs.db'),
+})
+
+import safety_assistant as core  # noqa: E402
+from answer_cache import is_follow_up  # noqa: E402
+
+ANALYSIS = 'Reactor R-101, toluene at 450 K and 5 atm'
+
+
+def ask(client, session_id, message):
+    response = client.post('/api/chat', json={'sessionId': session_id, 'message': message, 'currentAnalysis': ANALYSIS})
+    assert response.status_code == 200
+    return response.get_json()['response']
+
+
+def test_paraphrase_hits_within_the_same_session():
+    core.chat_answer_cache.clear()
+    client = core.app.test_client()
+    first = ask(client, 'same-session', 'what if we lose cooling water')
+    hits = core.chat_answer_cache.stats()['hits']
+    assert ask(client, 'same-session', 'what happens on loss of cooling water') == first
+    assert core.chat_answer_cache.stats()['hits'] == hits + 1
+
+
+def test_follow_up_is_keyed_on_the_conversation():
+    core.chat_answer_cache.clear()
+    client = core.app.test_client()
+    ask(client, 'first', 'what if the agitator stops')
+    ask(client, 'second', 'what if the feed pump trips')
+    ask(client, 'first', 'does that also apply to the condenser')
+    hits = core.chat_answer_cache.stats()['hits']
+    ask(client, 'second', 'does that also apply to the condenser')
+    assert core.chat_answer_cache.stats()['hits'] == hits
+
+
+def test_is_follow_up():
+    assert is_follow_up('does that apply to the condenser too?')
+    assert not is_follow_up('what if we lose cooling water?')
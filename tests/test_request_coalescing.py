@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from request_coalescing import AsyncSingleFlight, SingleFlight
+
+
+def test_cancelled_async_leader_releases_its_key():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+            return 'slow'
+
+        async def fast():
+            return 'fast'
+
+        leader = asyncio.ensure_future(flights.do('k', slow))
+        await started.wait()
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert flights.stats()['in_flight'] == 0
+        return await asyncio.wait_for(flights.do('k', fast), 1)
+
+    assert asyncio.run(scenario()) == 'fast'
+
+
+def test_follower_takes_over_from_cancelled_async_leader():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def fast():
+            return 'fast'
+
+        leader = asyncio.ensure_future(flights.do('k', slow))
+        await started.wait()
+        follower = asyncio.ensure_future(flights.do('k', fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.wait_for(follower, 1)
+
+    assert asyncio.run(scenario()) == 'fast'
+
+
+def test_interrupted_sync_leader_releases_its_key():
+    flights = SingleFlight()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        flights.do('k', interrupted)
+    assert flights.stats()['in_flight'] == 0
+    assert flights.do('k', lambda: 'fast') == 'fast'
+
+
+def test_sync_followers_share_the_leader_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'report'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', slow))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()['followers'] < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['report'] * 3 and len(calls) == 1
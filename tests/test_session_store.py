@@ -0,0 +1,31 @@
+import threading
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+def concurrent_appends(store):
+    def append(n):
+        for i in range(20):
+            store.update('s', lambda session: session['messages'].append({'user': f'{n}-{i}', 'assistant': ''}))
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return store.get('s')
+
+
+def test_memory_updates_do_not_lose_writes():
+    assert len(concurrent_appends(MemorySessionStore())['messages']) == 80
+
+
+def test_sqlite_updates_do_not_lose_writes(tmp_path):
+    assert len(concurrent_appends(SQLiteSessionStore(str(tmp_path / 'sessions.db')))['messages']) == 80
+
+
+def test_update_keeps_fields_set_by_other_writers():
+    store = MemorySessionStore()
+    store.update('s', lambda session: session.update(process_data='reactor'))
+    session = store.update('s', lambda session: session['messages'].append({'user': 'q', 'assistant': 'a'}))
+    assert session['process_data'] == 'reactor' and store.get('s') == session